@@ -0,0 +1,123 @@
+import os
+import random
+
+from PIL import Image, ImageDraw, ImageFilter
+
+# bump when a generator changes, reports of different corpus versions don't compare
+CORPUS_VERSION = 1
+
+
+def _photo(size, seed):
+    """Smooth gradients with soft blobs and sensor-like noise, saved as a camera JPEG."""
+    rng = random.Random(seed)
+    width, height = size
+    small = Image.new("RGB", (64, 48))
+    draw = ImageDraw.Draw(small)
+    for y in range(48):
+        draw.line((0, y, 63, y), fill=(90 + y * 2, 120 + y, 200 - y * 2))
+    for _ in range(12):
+        x, y, r = rng.randrange(64), rng.randrange(48), rng.randrange(4, 16)
+        draw.ellipse((x - r, y - r, x + r, y + r),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    image = small.filter(ImageFilter.GaussianBlur(3)).resize(size, Image.BICUBIC)
+    # fine detail: noise blended in at a low level
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    image = Image.blend(image, noise, 0.12)
+    detail = ImageDraw.Draw(image)
+    for _ in range(200):
+        x, y = rng.randrange(width), rng.randrange(height)
+        detail.line((x, y, x + rng.randrange(-60, 60), y + rng.randrange(-60, 60)),
+                    fill=(rng.randrange(256),) * 3, width=2)
+    return image
+
+
+def _screenshot(size, seed):
+    """Flat UI panels, text and hard edges, saved as PNG."""
+    rng = random.Random(seed)
+    width, height = size
+    image = Image.new("RGB", size, (245, 246, 248))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, width, 56), fill=(29, 161, 242))
+    draw.rectangle((0, 56, 260, height), fill=(230, 233, 237))
+    y = 80
+    while y < height - 40:
+        draw.rectangle((290, y, width - 40, y + 110), fill=(255, 255, 255), outline=(220, 220, 220))
+        for line in range(4):
+            text = " ".join("".join(chr(rng.randrange(97, 123)) for _ in range(rng.randrange(3, 9)))
+                            for _ in range(rng.randrange(6, 14)))
+            draw.text((310, y + 12 + line * 22), text, fill=(20, 20, 20))
+        y += 130
+    for i in range(12):
+        draw.text((20, 80 + i * 36), f"Menu item {i}", fill=(60, 60, 60))
+    return image
+
+
+def _animation(size, frames, duration, seed, letterbox=0, hold=1, noisy=False):
+    """Shapes moving over a background; hold > 1 repeats every pose (with a tiny change) hold times."""
+    rng = random.Random(seed)
+    width, height = size
+    background = Image.new("RGB", size)
+    draw = ImageDraw.Draw(background)
+    for x in range(width):
+        draw.line((x, 0, x, height), fill=(x * 200 // width, 80, 160))
+    if noisy:
+        background = Image.blend(background, Image.effect_noise(size, 60).convert("RGB"), 0.3)
+    if letterbox:
+        draw = ImageDraw.Draw(background)
+        draw.rectangle((0, 0, width, letterbox), fill=(0, 0, 0))
+        draw.rectangle((0, height - letterbox, width, height), fill=(0, 0, 0))
+
+    speeds = [(rng.randrange(2, 6), rng.randrange(1, 4)) for _ in range(3)]
+    result = []
+    for i in range(frames):
+        frame = background.copy()
+        draw = ImageDraw.Draw(frame)
+        pose = i // hold
+        for index, (dx, dy) in enumerate(speeds):
+            x = (pose * dx + index * 70) % (width - 50)
+            y = letterbox + (pose * dy + index * 40) % (height - 2 * letterbox - 50)
+            draw.ellipse((x, y, x + 50, y + 50), fill=(255, 200 - index * 60, index * 90))
+        # held frames differ in one pixel, so the GIF encoder can't merge them itself
+        draw.point((i % width, height // 2), fill=(i * 7 % 256, 0, 0))
+        result.append(frame.convert("P", palette=Image.ADAPTIVE))
+    return result, duration
+
+
+def _save_gif(path, frames_and_duration):
+    frames, duration = frames_and_duration
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=duration, loop=0)
+
+
+# name -> (kind, generator writing the file); every generator is deterministic,
+# so the same corpus comes out on every machine and reports stay comparable
+CASES = {
+    "photo_12mp": ("photo", lambda path: _photo((4000, 3000), 1).save(path, quality=92)),
+    "photo_2mp": ("photo", lambda path: _photo((1600, 1200), 2).save(path, quality=92)),
+    "photo_portrait": ("photo", lambda path: _photo((1200, 1600), 3).save(path, quality=92)),
+    "screenshot_fullhd": ("screenshot", lambda path: _screenshot((1920, 1080), 4).save(path)),
+    "screenshot_phone": ("screenshot", lambda path: _screenshot((1080, 2340), 5).save(path)),
+    "gif_shapes": ("animation", lambda path: _save_gif(path, _animation((320, 240), 60, 20, 6))),
+    "gif_letterboxed_held": ("animation", lambda path: _save_gif(
+        path, _animation((480, 270), 90, 30, 7, letterbox=40, hold=3))),
+    "gif_noisy": ("animation", lambda path: _save_gif(path, _animation((400, 300), 48, 40, 8, noisy=True))),
+}
+
+EXTENSIONS = {"photo": ".jpg", "screenshot": ".png", "animation": ".gif"}
+
+
+def ensure_corpus(folder: str, names=None) -> dict:
+    """Generate the missing corpus files into folder, returns {name: (kind, path)}."""
+    folder = os.path.join(folder, f"v{CORPUS_VERSION}")
+    os.makedirs(folder, exist_ok=True)
+    corpus = {}
+    for name, (kind, generate) in CASES.items():
+        if names and name not in names:
+            continue
+        path = os.path.join(folder, name + EXTENSIONS[kind])
+        if not os.path.exists(path):
+            print(f"Generating {name}")
+            temp_path = path + ".tmp" + EXTENSIONS[kind]
+            generate(temp_path)
+            os.replace(temp_path, path)
+        corpus[name] = (kind, path)
+    return corpus
@@ -0,0 +1,289 @@
+"""
+Benchmark of the upload compression path over a generated corpus of photos,
+screenshots and animated GIFs.
+
+    python -m benchmarks.encoders [--cases photo_2mp,gif_shapes] [--out report.json] [--baseline old.json]
+
+Every case runs in a fresh process, so peak memory belongs to that case alone.
+The JSON report has one result per case, strategy and format: encode attempts,
+wall time, peak memory, output size, whether it fits MAX_FILE_SIZE and SSIM
+against the source. With --baseline the results are compared to an earlier report.
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+REPORT_VERSION = 1
+MAX_SIZE = (1200, 1200)  # compress_image's default
+GIF_SSIM_SAMPLES = 12  # animation frames compared, evenly spread over the playback time
+
+# kind -> (strategy, format); compress_image is what the app uploads with
+STRATEGIES = {
+    "photo": [("compress_image", "WEBP"), ("search", "JPEG"), ("search", "AVIF"),
+              ("fixed_q80", "WEBP"), ("fixed_q80", "JPEG")],
+    "screenshot": [("compress_image", "WEBP"), ("search", "AVIF"), ("fixed_q80", "WEBP")],
+    "animation": [("compress_image", "AVIF"), ("gif_to_avif_buffer", "AVIF"),
+                  ("gif_to_avif_buffer_half", "AVIF")],
+}
+
+
+def _encode(uploader, strategy, img_format, path):
+    from PIL import Image
+
+    if strategy == "compress_image":
+        return uploader.compress_image(path, MAX_SIZE)
+    if strategy == "gif_to_avif_buffer":
+        return uploader.gif_to_avif_buffer(path)
+    if strategy == "gif_to_avif_buffer_half":
+        return uploader.gif_to_avif_buffer(path, drop_every_second_frame=True)
+
+    img = uploader.downscale_for_encoding(Image.open(path), MAX_SIZE)
+    if img_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    if strategy == "search":
+        return uploader.search_still_encoding(img, img_format)
+    if strategy == "fixed_q80":
+        output = io.BytesIO()
+        uploader.encode_count += 1
+        img.save(output, format=img_format, quality=80)
+        output.seek(0)
+        return output
+    raise ValueError(f"unknown strategy {strategy}")
+
+
+def _still_ssim(path, output):
+    from PIL import Image
+    from benchmarks.metrics import ssim
+
+    with Image.open(output) as encoded, Image.open(path) as source:
+        reference = source.convert("RGB").resize(encoded.size, Image.LANCZOS)
+        return ssim(reference, encoded.convert("RGB"))
+
+
+def _frames_with_times(image):
+    """(start ms, RGBA frame) of every frame, and the total duration"""
+    frames = []
+    time_ms = 0
+    for index in range(getattr(image, "n_frames", 1)):
+        image.seek(index)
+        frames.append((time_ms, image.convert("RGBA")))
+        time_ms += image.info.get("duration", 100)
+    return frames, time_ms
+
+
+def _animation_ssim(path, output):
+    """
+    SSIM of the frames shown at the same moments in the source and the output.
+    Outputs with trimmed borders are compared to the source cropped the same way.
+    """
+    from PIL import Image
+    from benchmarks.metrics import ssim
+    from controller.image_uploader import GifFrames
+
+    with Image.open(path) as source_image, Image.open(output) as encoded_image:
+        source, source_length = _frames_with_times(source_image)
+        encoded, encoded_length = _frames_with_times(encoded_image)
+
+    source_frames = [frame for _, frame in source]
+    if encoded[0][1].size != source_frames[0].size:
+        trimmed = GifFrames(source_frames, [0] * len(source_frames)).trim_borders().frames
+        if trimmed[0].size == encoded[0][1].size:
+            source_frames = trimmed
+
+    def frame_at(frames, times, moment):
+        index = 0
+        while index + 1 < len(times) and times[index + 1] <= moment:
+            index += 1
+        return frames[index]
+
+    source_times = [start for start, _ in source]
+    encoded_times = [start for start, _ in encoded]
+    encoded_frames = [frame for _, frame in encoded]
+    scores = []
+    for sample in range(GIF_SSIM_SAMPLES):
+        moment = source_length * sample / GIF_SSIM_SAMPLES
+        reference = frame_at(source_frames, source_times, moment)
+        distorted = frame_at(encoded_frames, encoded_times, moment)
+        if reference.size != distorted.size:
+            reference = reference.resize(distorted.size, Image.LANCZOS)
+        scores.append(ssim(reference, distorted))
+    return sum(scores) / len(scores), len(encoded), encoded_length, source_length
+
+
+def run_case(name, kind, path, strategy, img_format, max_file_size):
+    """One measurement, run in its own process. Returns the result dict."""
+    from benchmarks.metrics import peak_rss_bytes
+    from controller.image_uploader import ImageUploader
+
+    result = {"case": name, "kind": kind, "strategy": strategy, "format": img_format,
+              "input_bytes": os.path.getsize(path)}
+    uploader = ImageUploader()
+    uploader.MAX_FILE_SIZE = max_file_size
+    uploader.encode_count = 0
+    uploader.probe_count = 0
+
+    def counted(method, counter):
+        def wrapper(*args, **kwargs):
+            setattr(uploader, counter, getattr(uploader, counter) + 1)
+            return method(*args, **kwargs)
+        return wrapper
+
+    uploader.encode_still = counted(uploader.encode_still, "encode_count")
+    uploader.encode_avif = counted(uploader.encode_avif, "encode_count")
+    uploader.probe = counted(uploader.probe, "probe_count")
+
+    rss_before = peak_rss_bytes()
+    start = time.perf_counter()
+    try:
+        # the uploader logs every attempt, that's not part of the report
+        with contextlib.redirect_stdout(io.StringIO()):
+            output = _encode(uploader, strategy, img_format, path)
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+        output = None
+    result["wall_seconds"] = round(time.perf_counter() - start, 4)
+    rss_after = peak_rss_bytes()
+    result["peak_rss_bytes"] = rss_after
+    result["peak_rss_delta_bytes"] = None if rss_after is None else max(0, rss_after - rss_before)
+    result["attempts"] = uploader.encode_count
+    result["probes"] = uploader.probe_count
+
+    if output is not None:
+        result["output_bytes"] = output.getbuffer().nbytes
+        result["fits"] = result["output_bytes"] <= max_file_size
+        output.seek(0)
+        if kind == "animation":
+            score, frames, length, source_length = _animation_ssim(path, output)
+            result.update(ssim=round(score, 4), output_frames=frames,
+                          output_duration_ms=length, source_duration_ms=source_length)
+        else:
+            result["ssim"] = round(_still_ssim(path, output), 4)
+    return result
+
+
+def summarize(results):
+    summary = {}
+    for result in results:
+        group = summary.setdefault(f"{result['kind']}/{result['strategy']}/{result['format']}",
+                                   {"cases": 0, "errors": 0, "fits": 0, "attempts": 0, "wall_seconds": 0.0,
+                                    "output_bytes": 0, "ssim": []})
+        group["cases"] += 1
+        if "error" in result:
+            group["errors"] += 1
+            continue
+        group["fits"] += int(result["fits"])
+        group["attempts"] += result["attempts"]
+        group["wall_seconds"] += result["wall_seconds"]
+        group["output_bytes"] += result["output_bytes"]
+        group["ssim"].append(result["ssim"])
+    for group in summary.values():
+        scores = group.pop("ssim")
+        group["mean_ssim"] = round(sum(scores) / len(scores), 4) if scores else None
+        group["wall_seconds"] = round(group["wall_seconds"], 3)
+    return summary
+
+
+def environment():
+    from PIL import Image, features
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "pillow": Image.__version__,
+        "avif": bool(features.check("avif")),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "commit": commit,
+    }
+
+
+def compare(results, baseline):
+    """Printable comparison with an earlier report, matched by case, strategy and format."""
+    earlier = {(r["case"], r["strategy"], r["format"]): r for r in baseline["results"]}
+    lines = [f"{'case':24} {'strategy':30} {'size':>16} {'ssim':>16} {'seconds':>16} {'attempts':>10}"]
+    for result in results:
+        old = earlier.get((result["case"], result["strategy"], result["format"]))
+        if old is None or "error" in result or "error" in old:
+            continue
+        size_change = (result["output_bytes"] - old["output_bytes"]) / old["output_bytes"] * 100
+        lines.append(
+            f"{result['case']:24} {result['strategy'] + '/' + result['format']:30} "
+            f"{result['output_bytes']:>9} {size_change:+5.1f}% "
+            f"{result['ssim']:>8.4f} {result['ssim'] - old['ssim']:+.4f} "
+            f"{result['wall_seconds']:>8.2f} {result['wall_seconds'] - old['wall_seconds']:+6.2f} "
+            f"{old['attempts']:>4} -> {result['attempts']:<3}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from benchmarks.corpus import CORPUS_VERSION, ensure_corpus
+    from modal.constants import Constants
+
+    parser = argparse.ArgumentParser(description="Benchmark the upload compression path")
+    parser.add_argument("--cases", help="comma separated corpus case names, all by default")
+    parser.add_argument("--corpus", default=os.path.join("benchmarks", ".corpus"),
+                        help="where the generated corpus is kept")
+    parser.add_argument("--out", help="report path, benchmarks/reports/encoders-<time>.json by default")
+    parser.add_argument("--baseline", help="earlier report to compare with")
+    parser.add_argument("--max-file-size", type=int, default=Constants.MAX_FILE_SIZE)
+    args = parser.parse_args(argv)
+
+    names = args.cases.split(",") if args.cases else None
+    corpus = ensure_corpus(args.corpus, names)
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for name, (kind, path) in corpus.items():
+        for strategy, img_format in STRATEGIES[kind]:
+            # a fresh process per case: peak memory and caches are its own
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (name, kind, path, strategy, img_format, args.max_file_size))
+            results.append(result)
+            if "error" in result:
+                print(f"{name:24} {strategy}/{img_format:5} error: {result['error']}")
+            else:
+                print(f"{name:24} {strategy + '/' + img_format:30} {result['output_bytes']:>8} B "
+                      f"ssim {result['ssim']:.4f} {result['wall_seconds']:6.2f}s "
+                      f"{result['attempts']:>2} attempts")
+
+    report = {
+        "version": REPORT_VERSION,
+        "corpus_version": CORPUS_VERSION,
+        "created": datetime.now().astimezone().isoformat(),
+        "max_file_size": args.max_file_size,
+        "environment": environment(),
+        "results": results,
+        "summary": summarize(results),
+    }
+    out = args.out or os.path.join("benchmarks", "reports",
+                                   f"encoders-{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    if os.path.dirname(out):
+        os.makedirs(os.path.dirname(out), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as file:
+        json.dump(report, file, indent=2)
+    print(f"Report written to {out}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("corpus_version") != CORPUS_VERSION:
+            print("The baseline was measured on another corpus version, not comparing")
+        else:
+            print(compare(results, baseline))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
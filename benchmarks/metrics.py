@@ -0,0 +1,79 @@
+import sys
+
+from PIL import Image
+
+SSIM_EDGE = 256  # images are compared at this longest edge, enough to see encoder artifacts
+SSIM_WINDOW = 8
+_C1 = (0.01 * 255) ** 2
+_C2 = (0.03 * 255) ** 2
+
+
+def ssim(reference: Image.Image, distorted: Image.Image) -> float:
+    """
+    Structural similarity of two images on their luma, 1.0 for identical ones.
+    Computed on SSIM_WINDOW sized blocks (instead of the usual gaussian window)
+    of both images scaled to the same size, at most SSIM_EDGE on the longest
+    edge, so it needs nothing but Pillow.
+    """
+    width, height = distorted.size
+    scale = min(1.0, SSIM_EDGE / max(width, height))
+    size = (max(SSIM_WINDOW, round(width * scale)), max(SSIM_WINDOW, round(height * scale)))
+    a = list(_luma(reference).resize(size, Image.BILINEAR).getdata())
+    b = list(_luma(distorted).resize(size, Image.BILINEAR).getdata())
+
+    total = 0.0
+    blocks = 0
+    n = SSIM_WINDOW * SSIM_WINDOW
+    for top in range(0, size[1] - SSIM_WINDOW + 1, SSIM_WINDOW):
+        for left in range(0, size[0] - SSIM_WINDOW + 1, SSIM_WINDOW):
+            xs = []
+            ys = []
+            for row in range(top, top + SSIM_WINDOW):
+                start = row * size[0] + left
+                xs.extend(a[start:start + SSIM_WINDOW])
+                ys.extend(b[start:start + SSIM_WINDOW])
+            mean_x = sum(xs) / n
+            mean_y = sum(ys) / n
+            var_x = sum((x - mean_x) ** 2 for x in xs) / (n - 1)
+            var_y = sum((y - mean_y) ** 2 for y in ys) / (n - 1)
+            covariance = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / (n - 1)
+            total += ((2 * mean_x * mean_y + _C1) * (2 * covariance + _C2)) / (
+                (mean_x ** 2 + mean_y ** 2 + _C1) * (var_x + var_y + _C2))
+            blocks += 1
+    return total / blocks if blocks else 1.0
+
+
+def _luma(image: Image.Image) -> Image.Image:
+    if image.mode in ("RGBA", "LA", "PA", "P"):
+        # transparent areas compared as if on white, like the feed shows them
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert("RGBA"))
+    return image.convert("L")
+
+
+def peak_rss_bytes():
+    """Peak resident memory of this process so far, None where it can't be read."""
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return None
+        return counters.PeakWorkingSetSize
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
@@ -0,0 +1,93 @@
+from PySide6.QtCore import QObject, QTimer, Signal, Qt
+from PySide6.QtGui import QMovie
+
+from modal.constants import Constants
+
+
+class AnimationScheduler(QObject):
+    """
+    Central playback control for animated images.
+    Only movies whose label is actually on screen are played, at most
+    MAX_PLAYING of them at a time (the most visible ones win). Everything else
+    is paused on its current frame. Movies don't cache decoded frames.
+    """
+
+    CHECK_INTERVAL_MS = 250
+    MAX_PLAYING = Constants.MAX_PLAYING_ANIMATIONS
+
+    _instance = None
+    _update_requested = Signal()
+
+    @classmethod
+    def instance(cls) -> "AnimationScheduler":
+        if cls._instance is None:
+            cls._instance = AnimationScheduler()
+        return cls._instance
+
+    def __init__(self):
+        super().__init__()
+        self._movies = {}  # movie -> label
+        self._timer = QTimer(self)
+        self._timer.setInterval(self.CHECK_INTERVAL_MS)
+        self._timer.timeout.connect(self.update_playback)
+        # register() may be called from anywhere, the checks always run on our thread
+        self._update_requested.connect(self.update_playback, Qt.QueuedConnection)
+
+    def register(self, movie: QMovie, label) -> None:
+        movie.setCacheMode(QMovie.CacheNone)
+        movie.finished.connect(lambda: self._on_finished(movie))
+        movie.destroyed.connect(lambda: self._movies.pop(movie, None))
+        label.destroyed.connect(lambda: self._movies.pop(movie, None))
+        self._movies[movie] = label
+        self.schedule_update()
+
+    def unregister(self, movie: QMovie) -> None:
+        self._movies.pop(movie, None)
+        self.schedule_update()
+
+    def schedule_update(self) -> None:
+        """Re-check visibility soon, e.g. after a scroll."""
+        self._update_requested.emit()
+
+    @property
+    def playing_count(self) -> int:
+        return sum(1 for movie in self._movies if movie.state() == QMovie.Running)
+
+    def update_playback(self) -> None:
+        if not self._movies:
+            self._timer.stop()
+            return
+        if not self._timer.isActive():
+            self._timer.start()
+
+        visible = []
+        for movie, label in list(self._movies.items()):
+            try:
+                area = 0
+                if label.isVisible():
+                    rect = label.visibleRegion().boundingRect()
+                    area = rect.width() * rect.height()
+            except RuntimeError:
+                # label already deleted on the C++ side
+                self._movies.pop(movie, None)
+                continue
+            if area > 0:
+                visible.append((area, movie))
+
+        visible.sort(key=lambda item: item[0], reverse=True)
+        should_play = {movie for _, movie in visible[:self.MAX_PLAYING]}
+
+        for movie in list(self._movies):
+            state = movie.state()
+            if movie in should_play:
+                if state == QMovie.Paused:
+                    movie.setPaused(False)
+                elif state == QMovie.NotRunning:
+                    movie.start()
+            elif state == QMovie.Running:
+                movie.setPaused(True)
+
+    def _on_finished(self, movie: QMovie) -> None:
+        # loop forever, but only while we still want it playing
+        if movie in self._movies:
+            self.schedule_update()
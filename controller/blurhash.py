@@ -0,0 +1,157 @@
+import math
+
+from PySide6.QtCore import QSize, Qt
+from PySide6.QtGui import QImage
+
+# https://github.com/woltapp/blurhash/blob/master/Algorithm.md
+BASE83_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+# decoding more pixels than this only adds cost, the placeholder is smooth anyway
+PLACEHOLDER_DECODE_SIZE = 32
+
+
+def _encode83(value: int, length: int) -> str:
+    result = ""
+    for i in range(1, length + 1):
+        digit = (value // 83 ** (length - i)) % 83
+        result += BASE83_CHARS[digit]
+    return result
+
+
+def _decode83(text: str) -> int:
+    value = 0
+    for char in text:
+        value = value * 83 + BASE83_CHARS.index(char)
+    return value
+
+
+def _srgb_to_linear(value: int) -> float:
+    v = value / 255
+    if v <= 0.04045:
+        return v / 12.92
+    return ((v + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = max(0.0, min(1.0, value))
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value: float, exp: float) -> float:
+    return math.copysign(abs(value) ** exp, value)
+
+
+def encode(pixels, width: int, height: int, x_components: int = 4, y_components: int = 3) -> str:
+    """
+    Blurhash of an image given as a flat, row major sequence of (r, g, b) tuples.
+    Meant for small images (a few dozen pixels per side), the hash is the same either way.
+    """
+    if not 1 <= x_components <= 9 or not 1 <= y_components <= 9:
+        raise ValueError("blurhash components must be between 1 and 9")
+    if width * height != len(pixels):
+        raise ValueError("pixel count doesn't match the size")
+
+    linear = [(_srgb_to_linear(r), _srgb_to_linear(g), _srgb_to_linear(b)) for r, g, b, *_ in pixels]
+    cos_x = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    cos_y = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                row = y * width
+                basis_y = normalisation * cos_y[j][y]
+                for x in range(width):
+                    basis = basis_y * cos_x[i][x]
+                    pr, pg, pb = linear[row + x]
+                    r += basis * pr
+                    g += basis * pg
+                    b += basis * pb
+            scale = 1 / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    result = _encode83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        actual_max = max(abs(c) for factor in ac for c in factor)
+        quantised_max = int(max(0, min(82, math.floor(actual_max * 166 - 0.5))))
+        max_value = (quantised_max + 1) / 166
+        result += _encode83(quantised_max, 1)
+    else:
+        max_value = 1
+        result += _encode83(0, 1)
+
+    result += _encode83((_linear_to_srgb(dc[0]) << 16) + (_linear_to_srgb(dc[1]) << 8) + _linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        quant = [int(max(0, min(18, math.floor(_sign_pow(c / max_value, 0.5) * 9 + 9.5)))) for c in factor]
+        result += _encode83(quant[0] * 19 * 19 + quant[1] * 19 + quant[2], 2)
+    return result
+
+
+def decode(blurhash: str, width: int, height: int, punch: float = 1.0) -> bytes:
+    """Decode a blurhash to width x height RGB888 pixels, raises ValueError for an invalid hash."""
+    if not blurhash or len(blurhash) < 6 or any(char not in BASE83_CHARS for char in blurhash):
+        raise ValueError("invalid blurhash")
+    size_flag = _decode83(blurhash[0])
+    x_components = size_flag % 9 + 1
+    y_components = size_flag // 9 + 1
+    if len(blurhash) != 4 + 2 * x_components * y_components:
+        raise ValueError("invalid blurhash length")
+
+    max_value = (_decode83(blurhash[1]) + 1) / 166
+    dc = _decode83(blurhash[2:6])
+    colors = [(_srgb_to_linear(dc >> 16), _srgb_to_linear((dc >> 8) & 255), _srgb_to_linear(dc & 255))]
+    for i in range(1, x_components * y_components):
+        value = _decode83(blurhash[4 + i * 2:6 + i * 2])
+        quant = (value // (19 * 19), (value // 19) % 19, value % 19)
+        colors.append(tuple(_sign_pow((q - 9) / 9, 2) * max_value * punch for q in quant))
+
+    cos_x = [[math.cos(math.pi * x * i / width) for i in range(x_components)] for x in range(width)]
+    cos_y = [[math.cos(math.pi * y * j / height) for j in range(y_components)] for y in range(height)]
+
+    pixels = bytearray(width * height * 3)
+    offset = 0
+    for y in range(height):
+        for x in range(width):
+            r = g = b = 0.0
+            for j in range(y_components):
+                basis_y = cos_y[y][j]
+                for i in range(x_components):
+                    basis = cos_x[x][i] * basis_y
+                    cr, cg, cb = colors[i + j * x_components]
+                    r += cr * basis
+                    g += cg * basis
+                    b += cb * basis
+            pixels[offset] = _linear_to_srgb(r)
+            pixels[offset + 1] = _linear_to_srgb(g)
+            pixels[offset + 2] = _linear_to_srgb(b)
+            offset += 3
+    return bytes(pixels)
+
+
+def placeholder_image(blurhash: str, display_size: QSize, device_pixel_ratio: float = 1.0):
+    """
+    Blurred placeholder QImage of display_size (device independent pixels),
+    or None if the hash is invalid. Decodes a tiny image and lets Qt scale it up.
+    """
+    aspect = display_size.width() / max(1, display_size.height())
+    if aspect >= 1:
+        width, height = PLACEHOLDER_DECODE_SIZE, max(1, round(PLACEHOLDER_DECODE_SIZE / aspect))
+    else:
+        width, height = max(1, round(PLACEHOLDER_DECODE_SIZE * aspect)), PLACEHOLDER_DECODE_SIZE
+    try:
+        pixels = decode(blurhash, width, height)
+    except ValueError as e:
+        print(f"Invalid blurhash {blurhash!r}: {e}")
+        return None
+
+    small = QImage(pixels, width, height, width * 3, QImage.Format_RGB888)
+    image = small.scaled(round(display_size.width() * device_pixel_ratio),
+                         round(display_size.height() * device_pixel_ratio),
+                         Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    image.setDevicePixelRatio(device_pixel_ratio)
+    return image
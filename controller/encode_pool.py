@@ -0,0 +1,192 @@
+import atexit
+import io
+import itertools
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+from modal.constants import Constants
+
+
+class EncodeCancelled(Exception):
+    pass
+
+
+# set in every worker process by _init_worker
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _encode_in_worker(job_id, image_path, cancel_flag_name):
+    """
+    Runs in a pool process: compress the image, reporting progress and checking
+    the cancel flag between encode attempts. The result is handed back in a
+    shared memory block, only its name and size go through the pool's pipe.
+    """
+    from controller.image_uploader import ImageUploader
+
+    cancel_flag = SharedMemory(name=cancel_flag_name)
+    try:
+        def checkpoint(done, total):
+            if cancel_flag.buf[0]:
+                raise EncodeCancelled()
+            _progress_queue.put((job_id, min(1.0, done / max(1, total))))
+
+        uploader = ImageUploader()
+        uploader.checkpoint = checkpoint
+        data = uploader.compress_image(image_path).getbuffer()
+
+        result = SharedMemory(create=True, size=max(1, len(data)))
+        result.buf[:len(data)] = data
+        name, size = result.name, len(data)
+        result.close()
+        return name, size
+    finally:
+        cancel_flag.close()
+
+
+class EncodeJob:
+    """
+    An image being compressed in the encode pool.
+    result() blocks until the compressed BytesIO is ready, raises EncodeCancelled
+    after cancel() or the encoder's own error. on_progress gets a fraction in
+    [0, 1], called from the pool's listener thread.
+    """
+
+    def __init__(self, job_id, on_progress=None):
+        self.job_id = job_id
+        self.on_progress = on_progress
+        self.future = Future()
+        self._cancel_requested = False
+        self._flag_lock = threading.Lock()  # cancel() vs. releasing the flag
+        self._cancel_flag = SharedMemory(create=True, size=1)  # read by the worker
+        self._cancel_flag.buf[0] = 0
+
+    @property
+    def cancel_flag_name(self) -> str:
+        return self._cancel_flag.name
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel_requested
+
+    def cancel(self) -> None:
+        """Stop at the next encode attempt, or before starting if still queued."""
+        with self._flag_lock:
+            if not self.future.done():
+                self._cancel_requested = True
+                self._cancel_flag.buf[0] = 1
+
+    def result(self, timeout=None) -> io.BytesIO:
+        return self.future.result(timeout)
+
+    def _finish(self, pool_future) -> None:
+        try:
+            if pool_future.cancelled():
+                raise EncodeCancelled()
+            name, size = pool_future.result()
+            block = SharedMemory(name=name)
+            try:
+                output = io.BytesIO(bytes(block.buf[:size]))
+            finally:
+                block.close()
+                block.unlink()
+        except BaseException as e:
+            output, error = None, e
+        else:
+            error = EncodeCancelled() if self.cancelled else None
+        # resolved and flag released together, so cancel() never sees a released flag
+        with self._flag_lock:
+            if error is None:
+                self.future.set_result(output)
+            else:
+                self.future.set_exception(error)
+            self._cancel_flag.close()
+            self._cancel_flag.unlink()
+
+
+class EncodePool:
+    """
+    Image compression in separate processes, so Pillow encodes neither hold the
+    GIL against the Qt main thread nor share one core between uploads.
+    Workers are spawned lazily, Constants.ENCODE_PROCESSES of them (0: one per
+    core but one, for the UI).
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> "EncodePool":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = EncodePool()
+                atexit.register(cls._instance.shutdown)
+            return cls._instance
+
+    def __init__(self, max_workers: int = None):
+        self.max_workers = max_workers or Constants.ENCODE_PROCESSES or max(1, (os.cpu_count() or 2) - 1)
+        self._context = multiprocessing.get_context("spawn")
+        self._executor = None
+        self._progress_queue = None
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> None:
+        if self._executor is not None:
+            return
+        self._progress_queue = self._context.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=self._context,
+            initializer=_init_worker,
+            initargs=(self._progress_queue,),
+        )
+        threading.Thread(target=self._listen_for_progress, args=(self._progress_queue,),
+                         name="encode-progress", daemon=True).start()
+
+    def submit(self, image_path: str, on_progress=None) -> EncodeJob:
+        with self._lock:
+            self._ensure_started()
+            job = EncodeJob(next(self._job_ids), on_progress)
+            self._jobs[job.job_id] = job
+            pool_future = self._executor.submit(_encode_in_worker, job.job_id, image_path, job.cancel_flag_name)
+
+        def done(finished_future):
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+            job._finish(finished_future)
+
+        pool_future.add_done_callback(done)
+        return job
+
+    def _listen_for_progress(self, progress_queue) -> None:
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            job_id, fraction = message
+            with self._lock:
+                job = self._jobs.get(job_id)
+            if job is not None and job.on_progress is not None and not job.cancelled:
+                try:
+                    job.on_progress(fraction)
+                except Exception as e:
+                    print(f"Error in encode progress callback: {e}")
+
+    def shutdown(self) -> None:
+        with self._lock:
+            jobs = list(self._jobs.values())
+            executor, self._executor = self._executor, None
+        for job in jobs:
+            job.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            self._progress_queue.put(None)
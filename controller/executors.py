@@ -0,0 +1,120 @@
+import os
+import threading
+from concurrent.futures import Future
+
+from PySide6.QtCore import QRunnable, QThreadPool
+
+from modal.constants import Constants
+
+
+class _TrackedRunnable(QRunnable):
+    def __init__(self, name, target, future=None):
+        super().__init__()
+        self.name = name
+        self.target = target  # QRunnable or callable
+        self.future = future
+
+    def run(self):
+        ExecutorRegistry._on_started(self.name)
+        try:
+            if self.future is not None:
+                if not self.future.set_running_or_notify_cancel():
+                    return
+                try:
+                    self.future.set_result(self.target())
+                except BaseException as e:
+                    self.future.set_exception(e)
+            elif isinstance(self.target, QRunnable):
+                self.target.run()
+            else:
+                self.target()
+        finally:
+            ExecutorRegistry._on_finished(self.name)
+
+
+class ExecutorRegistry:
+    """
+    Shared, fixed size thread pools by purpose, so blocking network I/O, CPU heavy
+    image decoding/encoding and backend calls don't compete for the same threads
+    and no view has to create its own pool.
+    Counts what each pool has queued, running and completed (see stats()).
+    """
+
+    IO = "io"  # image downloads
+    CPU = "cpu"  # decoding, scaling, encoding
+    BACKEND = "backend"  # firestore calls
+    UPLOAD = "upload"  # image uploads, each waits for its encode and the upload request
+
+    DEFAULT_SIZES = {
+        IO: Constants.IO_THREADS,
+        CPU: Constants.CPU_THREADS or os.cpu_count() or 2,
+        BACKEND: Constants.BACKEND_THREADS,
+        UPLOAD: Constants.UPLOAD_THREADS,
+    }
+
+    _pools = {}
+    _sizes = {}
+    _counters = {}  # name -> {"queued", "active", "completed"}
+    _lock = threading.Lock()
+
+    @classmethod
+    def configure(cls, name: str, max_threads: int) -> None:
+        """Set a pool's size, before or after it was first used."""
+        with cls._lock:
+            cls._sizes[name] = max_threads
+            if name in cls._pools:
+                cls._pools[name].setMaxThreadCount(max_threads)
+
+    @classmethod
+    def pool(cls, name: str) -> QThreadPool:
+        with cls._lock:
+            if name not in cls._pools:
+                pool = QThreadPool()
+                pool.setObjectName(f"{name}-pool")
+                pool.setMaxThreadCount(cls._sizes.get(name) or cls.DEFAULT_SIZES.get(name, 2))
+                cls._pools[name] = pool
+                cls._counters[name] = {"queued": 0, "active": 0, "completed": 0}
+            return cls._pools[name]
+
+    @classmethod
+    def start(cls, name: str, runnable, priority: int = 0) -> None:
+        """Run a QRunnable or a callable on the named pool, fire and forget."""
+        pool = cls.pool(name)
+        cls._on_queued(name)
+        pool.start(_TrackedRunnable(name, runnable), priority)
+
+    @classmethod
+    def submit(cls, name: str, fn, *args, priority: int = 0, **kwargs) -> Future:
+        """Run fn(*args, **kwargs) on the named pool, returns a Future of its result."""
+        pool = cls.pool(name)
+        future = Future()
+        cls._on_queued(name)
+        pool.start(_TrackedRunnable(name, lambda: fn(*args, **kwargs), future), priority)
+        return future
+
+    @classmethod
+    def stats(cls) -> dict:
+        with cls._lock:
+            return {
+                name: dict(counters, max_threads=cls._pools[name].maxThreadCount())
+                for name, counters in cls._counters.items()
+            }
+
+    @classmethod
+    def _on_queued(cls, name):
+        with cls._lock:
+            cls._counters[name]["queued"] += 1
+
+    @classmethod
+    def _on_started(cls, name):
+        with cls._lock:
+            counters = cls._counters[name]
+            counters["queued"] -= 1
+            counters["active"] += 1
+
+    @classmethod
+    def _on_finished(cls, name):
+        with cls._lock:
+            counters = cls._counters[name]
+            counters["active"] -= 1
+            counters["completed"] += 1
@@ -3,6 +3,7 @@ from builtins import bool
 from datetime import datetime
 
 import requests
+from google.api_core.exceptions import AlreadyExists
 from PySide6.QtCore import Signal, QObject
 from PySide6.QtWidgets import QMessageBox
 from google.cloud import firestore
@@ -11,6 +12,7 @@ from google.cloud.firestore_v1 import Query, SERVER_TIMESTAMP
 from google.oauth2.credentials import Credentials
 from requests.exceptions import HTTPError
 
+from controller.executors import ExecutorRegistry
 from controller.user_session import UserSession
 from modal import post
 from modal.post import PostData
@@ -240,15 +242,24 @@ def fetch_post_by_id(post_id):
 
 def create_new_post(post_data):
     try:
-        post_dict = post_data.to_dict(post_data)  # ???
-
-        db.collection("posts").add(post_dict, post_dict["id"])
+        create_post_document(post_data.to_dict(post_data))
         return True
     except Exception as e:
         print(f"Error creating post: {e}")
         return False
 
 
+def create_post_document(post_dict):
+    """
+    Create the post under its own id, raises on failure. Safe to repeat: if an
+    earlier attempt already created it, the existing post (and its likes) is kept.
+    """
+    try:
+        db.collection("posts").document(post_dict["id"]).create(post_dict)
+    except AlreadyExists:
+        print(f"Post {post_dict['id']} already exists")
+
+
 def delete_post(post_id):
     try:
         post_ref = db.collection("posts").document(post_id)
@@ -350,6 +361,11 @@ def update_user_profile(user_id, profile_data):
         return False
 
 
+def set_user_profile(user_id, profile_dict):
+    """Merge the fields into the user's profile, raises on failure (for the outbox)."""
+    db.collection("userdata").document(user_id).set(profile_dict, merge=True)
+
+
 def create_user_profile(user_id, profile_data):
     try:
         user_ref = db.collection("userdata").document(user_id)
@@ -430,7 +446,7 @@ class FirestoreListener(QObject):
 
     def delete_post_2(self, post_id):
         print("signal received")
-        delete_post(post_id)
+        ExecutorRegistry.start(ExecutorRegistry.BACKEND, lambda: delete_post(post_id))
 
     def stop_listening(self):
         if self._post_watch:
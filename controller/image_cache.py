@@ -0,0 +1,257 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from modal.constants import Constants
+
+
+class DiskImageCache:
+    """
+    Size capped image cache on disk.
+    Files are named by a hash of their url (plus an optional variant name), written
+    through a temp file and renamed into place, and tracked in an index with their
+    size and last access time. When the cache grows over max_bytes the least recently
+    used files are evicted on a background thread. Variants are dropped together with
+    their original, so they never outlive the file they were made from.
+    Changes to the index are written in batches (see _index_changed) and at exit,
+    a crash loses at most the last few entries, whose files are dropped on the next start.
+    """
+
+    INDEX_FILE = "index.json"
+    TEMP_FOLDER = "tmp"
+    LOW_WATERMARK = 0.9  # evict down to 90% of the cap so we don't evict on every write
+    SAVE_DELAY_SECONDS = 2.0  # a changed index is written this long after the first change
+    SAVE_EVERY_CHANGES = 64  # or right away after this many changes
+
+    def __init__(self, folder: str = Constants.IMAGE_CACHE_FOLDER,
+                 max_bytes: int = Constants.IMAGE_CACHE_MAX_BYTES):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        self._entries = {}  # key -> {"size": int, "atime": float, "meta": dict, "variants": [key] of originals}
+        self._total_bytes = 0
+        self._dirty = False
+        self._changes = 0  # since the index was last written
+        self._save_timer = None
+        self._evicting = False
+        os.makedirs(os.path.join(self.folder, self.TEMP_FOLDER), exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key_for(url: str, variant: str = None) -> str:
+        raw = url if not variant else f"{url}#{variant}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path_for_key(self, key: str) -> str:
+        return os.path.join(self.folder, key[:2], key)
+
+    @property
+    def total_bytes(self) -> int:
+        return self._total_bytes
+
+    def get_path(self, url: str, variant: str = None):
+        """Return the cached file path for url, or None on a miss. Counts as an access."""
+        key = self.key_for(url, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            entry["atime"] = time.time()
+            self._dirty = True
+        return self._path_for_key(key)
+
+    def get_meta(self, url: str, variant: str = None):
+        with self._lock:
+            entry = self._entries.get(self.key_for(url, variant))
+            return dict(entry["meta"]) if entry else None
+
+    def update_meta(self, url: str, meta: dict, variant: str = None) -> None:
+        with self._lock:
+            entry = self._entries.get(self.key_for(url, variant))
+            if entry is not None:
+                entry["meta"].update(meta)
+                self._dirty = True
+
+    def new_temp_path(self) -> str:
+        """A unique path inside the cache folder, to be passed to commit() once written."""
+        return os.path.join(self.folder, self.TEMP_FOLDER, uuid.uuid4().hex + ".tmp")
+
+    def put_bytes(self, url: str, data: bytes, variant: str = None, meta: dict = None) -> str:
+        temp_path = self.new_temp_path()
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        return self.commit(url, temp_path, variant, meta)
+
+    def commit(self, url: str, temp_path: str, variant: str = None, meta: dict = None) -> str:
+        """Atomically move a fully written temp file into the cache and return its final path."""
+        key = self.key_for(url, variant)
+        path = self._path_for_key(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+        size = os.path.getsize(path)
+
+        stale = []
+        with self._lock:
+            old_entry = self._entries.get(key)
+            if old_entry is not None:
+                self._total_bytes -= old_entry["size"]
+                # variants were made from the old file
+                stale = self._pop_variants(old_entry)
+            self._entries[key] = {"size": size, "atime": time.time(), "meta": dict(meta or {})}
+            self._total_bytes += size
+            if variant:
+                original = self._entries.get(self.key_for(url))
+                if original is not None and key not in original.setdefault("variants", []):
+                    original["variants"].append(key)
+            self._index_changed()
+            self._maybe_evict()
+        for stale_key in stale:
+            self._remove_file(self._path_for_key(stale_key))
+        return path
+
+    def discard(self, url: str, variant: str = None) -> None:
+        """Drop an entry, e.g. when its file turned out to be unreadable. An original takes its variants along."""
+        key = self.key_for(url, variant)
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return
+            self._total_bytes -= entry["size"]
+            removed = [key] + self._pop_variants(entry)
+            self._index_changed()
+        for removed_key in removed:
+            self._remove_file(self._path_for_key(removed_key))
+
+    def flush(self) -> None:
+        with self._lock:
+            self._save_timer = None
+            if self._dirty:
+                self._save_index()
+
+    def _index_changed(self) -> None:
+        """Called with the lock held. Writes the index now after SAVE_EVERY_CHANGES changes, else soon."""
+        self._dirty = True
+        self._changes += 1
+        if self._changes >= self.SAVE_EVERY_CHANGES:
+            self._save_index()
+        elif self._save_timer is None:
+            self._save_timer = threading.Timer(self.SAVE_DELAY_SECONDS, self.flush)
+            self._save_timer.daemon = True
+            self._save_timer.start()
+
+    def _pop_variants(self, entry: dict) -> list:
+        """Called with the lock held. Removes the variants of an original from the index and returns their keys."""
+        removed = []
+        for variant_key in entry.pop("variants", []):
+            variant_entry = self._entries.pop(variant_key, None)
+            if variant_entry is not None:
+                self._total_bytes -= variant_entry["size"]
+                removed.append(variant_key)
+        return removed
+
+    def _maybe_evict(self) -> None:
+        if self._total_bytes <= self.max_bytes or self._evicting:
+            return
+        self._evicting = True
+        thread = threading.Thread(target=self._evict, daemon=True)
+        thread.start()
+
+    def _evict(self) -> None:
+        try:
+            target = int(self.max_bytes * self.LOW_WATERMARK)
+            with self._lock:
+                victims = []
+                for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["atime"]):
+                    if self._total_bytes <= target:
+                        break
+                    if key not in self._entries:
+                        continue  # already went with its original
+                    del self._entries[key]
+                    self._total_bytes -= entry["size"]
+                    victims.append(key)
+                    victims.extend(self._pop_variants(entry))
+                self._index_changed()
+
+            for key in victims:
+                self._remove_file(self._path_for_key(key))
+            print(f"Image cache: evicted {len(victims)} files, {self._total_bytes / 1000:.0f} KB left")
+        finally:
+            self._evicting = False
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _index_path(self) -> str:
+        return os.path.join(self.folder, self.INDEX_FILE)
+
+    def _load_index(self) -> None:
+        # leftovers of writes interrupted by a crash
+        temp_folder = os.path.join(self.folder, self.TEMP_FOLDER)
+        for name in os.listdir(temp_folder):
+            self._remove_file(os.path.join(temp_folder, name))
+
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            entries = {}
+
+        for key, entry in entries.items():
+            path = self._path_for_key(key)
+            if os.path.exists(path) and os.path.getsize(path) == entry.get("size"):
+                entry.setdefault("meta", {})
+                self._entries[key] = entry
+                self._total_bytes += entry["size"]
+            else:
+                self._remove_file(path)
+        for entry in self._entries.values():
+            if "variants" in entry:
+                entry["variants"] = [key for key in entry["variants"] if key in self._entries]
+
+        # files the index doesn't know about (old flat cache layout, lost index) are dropped
+        for name in os.listdir(self.folder):
+            path = os.path.join(self.folder, name)
+            if os.path.isfile(path) and name != self.INDEX_FILE:
+                self._remove_file(path)
+            elif os.path.isdir(path) and len(name) == 2:
+                for file_name in os.listdir(path):
+                    if file_name not in self._entries:
+                        self._remove_file(os.path.join(path, file_name))
+
+        self._dirty = True
+        self._save_index()
+        self._maybe_evict()
+
+    def _save_index(self) -> None:
+        temp_path = self.new_temp_path()
+        try:
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(self._entries, file)
+            os.replace(temp_path, self._index_path())
+            self._dirty = False
+            self._changes = 0
+        except OSError as e:
+            print(f"Error saving image cache index: {e}")
+            self._remove_file(temp_path)
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_image_cache(folder: str = Constants.IMAGE_CACHE_FOLDER) -> DiskImageCache:
+    """Shared cache instance per folder"""
+    with _caches_lock:
+        if folder not in _caches:
+            cache = DiskImageCache(folder)
+            atexit.register(cache.flush)
+            _caches[folder] = cache
+        return _caches[folder]
@@ -0,0 +1,158 @@
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+HEADER_SIZE = 64
+MAX_BOXES = 512  # safety net against garbage or hostile files
+
+# ISOBMFF boxes we descend into on the way to the sample table
+_CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+_AVIF_BRANDS = {b"avif", b"avis"}
+
+
+@dataclass
+class ImageInfo:
+    format: Optional[str]  # "GIF", "AVIF", "WEBP", "PNG", "JPEG" or None if unknown
+    animated: bool = False
+
+
+def sniff_image(file_path) -> ImageInfo:
+    """
+    Identify an image file from a single header read and report whether it is animated.
+    Animation is detected by walking the container structure with bounded seeks
+    (ISOBMFF boxes, PNG chunks, GIF blocks), never by reading the whole file.
+    """
+    try:
+        with open(file_path, "rb") as file:
+            header = file.read(HEADER_SIZE)
+
+            if header[:6] in (b"GIF87a", b"GIF89a"):
+                return ImageInfo("GIF", _gif_is_animated(file, header))
+            if header[:8] == b"\x89PNG\r\n\x1a\n":
+                return ImageInfo("PNG", _png_is_animated(file))
+            if header[:3] == b"\xff\xd8\xff":
+                return ImageInfo("JPEG")
+            if header[:4] == b"RIFF" and header[8:12] == b"WEBP":
+                # VP8X extended header, flags byte has the animation bit
+                return ImageInfo("WEBP", header[12:16] == b"VP8X" and bool(header[20] & 0x02))
+            if header[4:8] == b"ftyp" and _is_avif_ftyp(file, header):
+                return ImageInfo("AVIF", _avif_is_animated(file))
+    except (OSError, struct.error, IndexError) as e:
+        print(f"Error reading file: {e}")
+    return ImageInfo(None)
+
+
+def _read_box_header(file, end):
+    """Returns (type, payload start, box end) of the box at the current position, or None."""
+    start = file.tell()
+    if start + 8 > end:
+        return None
+    size, box_type = struct.unpack(">I4s", file.read(8))
+    payload = start + 8
+    if size == 1:
+        size = struct.unpack(">Q", file.read(8))[0]
+        payload += 8
+    elif size == 0:
+        size = end - start
+    if size < payload - start:
+        return None
+    return box_type, payload, min(start + size, end)
+
+
+def _is_avif_ftyp(file, header):
+    ftyp_size = struct.unpack(">I", header[:4])[0]
+    if header[8:12] in _AVIF_BRANDS:
+        return True
+    # compatible brands after major brand + minor version
+    file.seek(16)
+    brands = file.read(max(0, min(ftyp_size, 256) - 16))
+    return any(brands[i:i + 4] in _AVIF_BRANDS for i in range(0, len(brands) - 3, 4))
+
+
+def _avif_is_animated(file):
+    file.seek(0, 2)
+    end = file.tell()
+    file.seek(0)
+    budget = [MAX_BOXES]
+    return _max_sample_count(file, 0, end, budget) > 1
+
+
+def _max_sample_count(file, start, end, budget):
+    """Walks the boxes in [start, end), returns the largest stsz sample count found."""
+    count = 0
+    file.seek(start)
+    while budget[0] > 0:
+        budget[0] -= 1
+        box = _read_box_header(file, end)
+        if box is None:
+            break
+        box_type, payload, box_end = box
+        if box_type in _CONTAINER_BOXES:
+            count = max(count, _max_sample_count(file, payload, box_end, budget))
+        elif box_type == b"stsz":
+            # version/flags, sample size, sample count
+            file.seek(payload)
+            _, _, sample_count = struct.unpack(">III", file.read(12))
+            count = max(count, sample_count)
+        file.seek(box_end)
+    return count
+
+
+def _png_is_animated(file):
+    # an APNG has an acTL chunk somewhere before the first IDAT
+    file.seek(8)
+    for _ in range(MAX_BOXES):
+        chunk = file.read(8)
+        if len(chunk) < 8:
+            return False
+        length, chunk_type = struct.unpack(">I4s", chunk)
+        if chunk_type == b"acTL":
+            return True
+        if chunk_type in (b"IDAT", b"IEND"):
+            return False
+        file.seek(length + 4, 1)  # data + crc
+    return False
+
+
+def _skip_gif_sub_blocks(file):
+    while True:
+        size = file.read(1)
+        if not size or size[0] == 0:
+            return
+        file.seek(size[0], 1)
+
+
+def _gif_is_animated(file, header):
+    # an image is animated once a second image descriptor shows up
+    flags = header[10]
+    position = 13
+    if flags & 0x80:
+        position += 3 * (2 ** ((flags & 0x07) + 1))
+    file.seek(position)
+
+    images = 0
+    while True:
+        block = file.read(1)
+        if not block or block == b"\x3b":
+            return False
+        if block == b"\x21":
+            label = file.read(1)
+            if label == b"\xff" and images == 0:
+                app_block = file.read(12)
+                if app_block[1:12] in (b"NETSCAPE2.0", b"ANIMEXTS1.0"):
+                    return True
+                file.seek(-12, 1)
+            _skip_gif_sub_blocks(file)
+        elif block == b"\x2c":
+            images += 1
+            if images > 1:
+                return True
+            descriptor = file.read(9)
+            if len(descriptor) < 9:
+                return False
+            if descriptor[8] & 0x80:
+                file.seek(3 * (2 ** ((descriptor[8] & 0x07) + 1)), 1)
+            file.seek(1, 1)  # LZW minimum code size
+            _skip_gif_sub_blocks(file)
+        else:
+            return False
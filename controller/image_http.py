@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from modal.constants import Constants
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+
+class DownloadTooLarge(requests.RequestException):
+    pass
+
+
+class ImageHttpClient:
+    """
+    Shared HTTP client for image downloads.
+    Keeps connections alive in a pool (at most max_per_host per host, extra
+    requests wait for a free connection), applies timeouts and retries
+    transient server errors. Supports conditional requests for revalidation.
+    """
+
+    def __init__(self, max_per_host: int = Constants.IMAGE_HTTP_MAX_PER_HOST,
+                 timeout: tuple = Constants.IMAGE_HTTP_TIMEOUT):
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_per_host, pool_block=True, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url: str, etag: str = None, last_modified: str = None, stream: bool = False) -> requests.Response:
+        """GET url, conditional if a validator is given (a 304 response means unchanged)."""
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return self.session.get(url, headers=headers, timeout=self.timeout, stream=stream)
+
+
+def stream_to_file(response: requests.Response, path: str,
+                   max_bytes: int = Constants.IMAGE_DOWNLOAD_MAX_BYTES) -> int:
+    """
+    Write the body of a streamed response to path chunk by chunk, so memory use
+    doesn't depend on the image size. Raises DownloadTooLarge (and removes the
+    partial file) once the body is known to exceed max_bytes. Returns the size.
+    """
+    try:
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit() and int(content_length) > max_bytes:
+            raise DownloadTooLarge(f"{response.url} is {content_length} bytes, limit is {max_bytes}")
+
+        written = 0
+        with open(path, "wb") as file:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                written += len(chunk)
+                if written > max_bytes:
+                    raise DownloadTooLarge(f"{response.url} is over the {max_bytes} byte limit")
+                file.write(chunk)
+        return written
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    finally:
+        response.close()
+
+
+def cache_validators(response: requests.Response) -> dict:
+    """What to store in the cache entry to revalidate it later"""
+    meta = {"fetched_at": time.time()}
+    if response.headers.get("ETag"):
+        meta["etag"] = response.headers["ETag"]
+    if response.headers.get("Last-Modified"):
+        meta["last_modified"] = response.headers["Last-Modified"]
+    return meta
+
+
+def is_stale(meta: dict, max_age: float = Constants.IMAGE_CACHE_REVALIDATE_SECONDS) -> bool:
+    # entries without a fetch time predate revalidation and have nothing to revalidate with
+    if not meta or "fetched_at" not in meta:
+        return False
+    return time.time() - meta["fetched_at"] > max_age
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_image_http_client() -> ImageHttpClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ImageHttpClient()
+        return _client
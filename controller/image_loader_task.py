@@ -1,141 +1,266 @@
 import os
-from io import BytesIO
+import time
 
 import requests
-from PySide6.QtCore import QRunnable, Slot, Signal, QObject
-from PySide6.QtGui import QPixmap
-
-
-def is_gif(file_path):
-    try:
-        # Check if the file starts with GIF header bytes
-        if file_path.endswith(".gif"):
-            return True
-
-        with open(file_path, "rb") as file:
-            header = file.read(6)
-            return header in [b"GIF87a", b"GIF89a"]
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return False
-
-
-def is_avif(file_path):
-    try:
-        with open(file_path, "rb") as file:
-            # Check ftyp section
-            file.seek(8)
-            ftyp = file.read(4).decode("ascii", errors="ignore")
-            if ftyp not in ["avis", "avif"]:
-                return False  # Not an AVIF file
-
-            # Search for stsz section
-            file.seek(0)
-            data = file.read()
-            stsz_index = data.find(b"stsz")
-            if stsz_index == -1:
-                return False  # No stsz section found
-
-            num_frames = int.from_bytes(data[stsz_index + 12:stsz_index + 16], "big")
-            return num_frames > 1  # True if more than 1 frame
-    except Exception as e:
-        print(f"Error reading file: {e}")
-        return False
-
-
-class ImageLoaderSignals(QObject):
-    loaded_gif_signal = Signal(tuple)
+from PySide6.QtCore import QRunnable, Slot, QSize, Qt, QUrl
+from PySide6.QtGui import QImage, QImageReader
+
+from controller.executors import ExecutorRegistry
+from controller.image_cache import get_image_cache
+from controller.image_format import sniff_image
+from controller.image_http import get_image_http_client, cache_validators, is_stale, stream_to_file
+from controller.single_flight import SingleFlight
+from controller.thumbnail_store import get_thumbnail_store
+from controller.ui_dispatcher import UiDispatcher
+from modal.constants import Constants
+
+# one download per url at a time, every other loader waits for it
+_downloads = SingleFlight()
+
+# animated AVIF -> WebP transcodes, Qt can't play AVIF
+TRANSCODED_VARIANT = "anim_webp"
+_transcodes = SingleFlight()
+
+
+def download_image(image_url, cache, use_cached=True, max_bytes=Constants.IMAGE_DOWNLOAD_MAX_BYTES):
+    """
+    Download image_url into the disk cache and return the cached file path.
+    A cached copy is returned as is while fresh, stale copies are revalidated with a
+    conditional request (and kept if the server can't be reached).
+    Concurrent calls for the same url share a single request. The body is streamed
+    into a temp file in the cache (never held in memory) and downloads over
+    max_bytes are aborted, so readers never see a half written or oversized image.
+    """
+
+    def fetch():
+        # an earlier flight may have finished between the cache check and now
+        cached_path = cache.get_path(image_url) if use_cached else None
+        meta = cache.get_meta(image_url) if cached_path else None
+        if cached_path and not is_stale(meta):
+            return cached_path
+
+        client = get_image_http_client()
+        temp_path = cache.new_temp_path()
+        try:
+            if cached_path:
+                response = client.get(image_url, etag=meta.get("etag"), last_modified=meta.get("last_modified"),
+                                      stream=True)
+            else:
+                response = client.get(image_url, stream=True)
+            if response.status_code == 304:
+                response.close()
+                cache.update_meta(image_url, {"fetched_at": time.time()})
+                return cached_path
+            if not response.ok:
+                response.close()
+            response.raise_for_status()
+            stream_to_file(response, temp_path, max_bytes)
+        except requests.RequestException as e:
+            if cached_path:
+                print(f"Revalidating image failed, using cached copy: {e}")
+                return cached_path
+            raise
+
+        # replacing the original also drops whatever was derived from the old one
+        return cache.commit(image_url, temp_path, meta=cache_validators(response))
+
+    return _downloads.do(image_url, fetch)
+
+
+def decode_image(file_name, target_size=None, device_pixel_ratio=1.0, aspect_mode=Qt.KeepAspectRatio):
+    """
+    Decode an image file straight to its display size.
+    target_size is in device independent pixels, the decoded image is
+    target_size * device_pixel_ratio physical pixels and never upscaled.
+    Safe to call off the GUI thread, returns a QImage or None.
+    """
+    reader = QImageReader(file_name)
+    reader.setAutoTransform(True)
+    if target_size is not None:
+        if not isinstance(target_size, QSize):
+            target_size = QSize(*target_size)
+        source_size = reader.size()
+        if source_size.isValid():
+            wanted = QSize(round(target_size.width() * device_pixel_ratio),
+                           round(target_size.height() * device_pixel_ratio))
+            scaled_size = source_size.scaled(wanted, aspect_mode)
+            if scaled_size.width() < source_size.width():
+                reader.setScaledSize(scaled_size)
+
+    image = reader.read()
+    if image.isNull():
+        print(f"Error decoding image: {reader.errorString()}")
+        return None
+    if target_size is not None:
+        image.setDevicePixelRatio(device_pixel_ratio)
+    return image
+
+
+def local_image_url(path) -> str:
+    """file: url of an image on this machine, ImageLoaderTask reads those in place"""
+    return QUrl.fromLocalFile(os.path.abspath(path)).toString()
+
+
+def stored_image_url(name: str) -> str:
+    """Url of a stored image name. Images not uploaded yet have local file: urls, used as they are."""
+    return name if name.startswith("file:") else Constants.STORAGE_URL + name
+
+
+def transcode_animated_avif(image_url, file_name, cache):
+    """
+    Return the path of a Qt playable animated WebP version of a cached animated AVIF.
+    The result is stored in the cache next to the original, so it is only transcoded
+    once. Frames are decoded and encoded one by one on the CPU pool.
+    """
+
+    def transcode():
+        from PIL import Image
+
+        temp_path = cache.new_temp_path()
+        with Image.open(file_name) as image:
+            image.load()  # the frame duration is only known once a frame is decoded
+            duration = image.info.get("duration", 100)
+            image.save(
+                temp_path,
+                format="WEBP",
+                save_all=True,
+                method=0,
+                duration=max(10, duration - 5),
+                loop=0,
+            )
+        return cache.commit(image_url, temp_path, TRANSCODED_VARIANT)
+
+    def cached_or_transcode():
+        webp_path = cache.get_path(image_url, TRANSCODED_VARIANT)
+        if webp_path:
+            return webp_path
+        return ExecutorRegistry.submit(ExecutorRegistry.CPU, transcode).result()
+
+    return _transcodes.do(image_url, cached_or_transcode)
+
 
 class ImageLoaderTask(QRunnable):
     """
     A QRunnable task to load an image from a URL and cache it.
+    file: urls (see local_image_url) are read where they are, without caching.
+    callback is called on the GUI thread (see UiDispatcher) with a QImage, a
+    ("gif_data", bytes) tuple for animations, or None on failure.
     allow_gif: If True, allows GIFs to be loaded and cached as QMovie.
-    If False, GIFs will be treated as regular images and loaded as QPixmap.
+    If False, GIFs will be treated as regular images and decoded as QImage.
+    target_size: Display size (QSize or (width, height)) to decode still images to,
+    scaled with aspect_mode at device_pixel_ratio. None decodes at full resolution.
     """
 
-    def __init__(self, image_url, callback, allow_gif=False, save_folder="cache", allow_cache_file=True):
+    def __init__(self, image_url, callback, allow_gif=False, save_folder=Constants.IMAGE_CACHE_FOLDER,
+                 allow_cache_file=True, target_size=None, device_pixel_ratio=1.0,
+                 aspect_mode=Qt.KeepAspectRatio):
         super().__init__()
         self.image_url = image_url
         self.callback = callback
+        self.target_size = target_size
+        self.device_pixel_ratio = device_pixel_ratio
+        self.aspect_mode = aspect_mode
         self.save_folder = save_folder
         self.allow_cache_file = allow_cache_file
         self.allow_gif = allow_gif
-        self.signals = ImageLoaderSignals()
-        self.loaded_gif_signal = self.signals.loaded_gif_signal
+        self.cancelled = False
 
-    @Slot()
-    def run(self):
-        try:
-            file_name = os.path.join(self.save_folder, os.path.basename(self.image_url))
-            if self.allow_cache_file:
-                if os.path.exists(file_name):
-                    gif_bool = is_gif(file_name)
-                    avif_bool = is_avif(file_name)
-                    if gif_bool and self.allow_gif:
-                        with open(file_name, "rb") as file:
-                            gif_data = file.read()
-                        self.loaded_gif_signal.emit(("gif_data", gif_data))
-                        return
-                    elif avif_bool and self.allow_gif:
-                        self.handle_animated_avif(file_name)
-                        return
-                    else:
-                        pixmap = QPixmap()
-                        if pixmap.load(file_name):
-                            self.callback(pixmap)
-                            return
+    def cancel(self):
+        """The requester is gone, skip remaining work and never call back."""
+        self.cancelled = True
 
-            # if self.image_url in ImageLoaderTask.cache:
-            #    self.callback(ImageLoaderTask.cache[self.image_url])
-            #    return
+    def deliver(self, result):
+        # callbacks touch widgets, so they always run on the GUI thread
+        if not self.cancelled:
+            UiDispatcher.instance().post(self._deliver_on_gui_thread, result)
 
-            if self.save_folder:
-                os.makedirs(self.save_folder, exist_ok=True)
+    def _deliver_on_gui_thread(self, result):
+        # the requester may have gone away while the result was queued
+        if not self.cancelled:
+            self.callback(result)
 
-            response = requests.get(self.image_url)
-            response.raise_for_status()
-            image_data = BytesIO(response.content)
+    def deliver_movie(self, gif_data):
+        self.deliver(("gif_data", gif_data))
 
-            with open(file_name, "wb") as file:
-                file.write(response.content)
+    @Slot()
+    def run(self):
+        if self.cancelled:
+            return
+        try:
+            if self.image_url.startswith("file:"):
+                self.load_local_file(QUrl(self.image_url).toLocalFile())
+                return
+            cache = get_image_cache(self.save_folder or Constants.IMAGE_CACHE_FOLDER)
+            file_name = cache.get_path(self.image_url) if self.allow_cache_file else None
+            if file_name and is_stale(cache.get_meta(self.image_url)):
+                file_name = download_image(self.image_url, cache)
+            if file_name:
+                info = sniff_image(file_name)
+                if info.format == "GIF" and info.animated and self.allow_gif:
+                    with open(file_name, "rb") as file:
+                        self.deliver_movie(file.read())
+                    return
+                elif info.format == "AVIF" and info.animated and self.allow_gif:
+                    self.handle_animated_avif(file_name, cache)
+                    return
+                else:
+                    image = self.decode_on_cpu_pool(cache, file_name)
+                    if image is not None:
+                        self.deliver(image)
+                        return
+                # unreadable or evicted under us, fetch it again
+                cache.discard(self.image_url)
 
-            gif_bool = is_gif(file_name)
-            avif_bool = is_avif(file_name)
-            if gif_bool and self.allow_gif:
-                self.callback(("gif_data", response.content))
-            elif avif_bool and self.allow_gif:
-                self.handle_animated_avif(file_name)
+            file_name = download_image(self.image_url, cache, self.allow_cache_file)
+            if self.cancelled:
                 return
+
+            info = sniff_image(file_name)
+            if info.format == "GIF" and info.animated and self.allow_gif:
+                with open(file_name, "rb") as file:
+                    self.deliver_movie(file.read())
+            elif info.format == "AVIF" and info.animated and self.allow_gif:
+                self.handle_animated_avif(file_name, cache)
             else:
-                pixmap = QPixmap()
-                if pixmap.loadFromData(bytes(image_data.getbuffer())):
-                    self.callback(pixmap)
+                # None when the download isn't a readable image, the caller still gets its answer
+                self.deliver(self.decode_on_cpu_pool(cache, file_name))
         except Exception as e:
             print(f"Error loading image: {e}")
-            self.callback(None)
-        finally:
-            self.loaded_gif_signal.disconnect()
-
-    def handle_animated_avif(self, file_name):
-        from PIL import Image
-        image = Image.open(file_name)
+            self.deliver(None)
 
-        if image.mode != "RGBA":
-            frames = [image.seek(i) or image.convert("RGBA") for i in range(image.n_frames)]
+    def load_local_file(self, file_name):
+        # e.g. an image of a post that isn't uploaded yet
+        info = sniff_image(file_name)
+        if info.format == "GIF" and info.animated and self.allow_gif:
+            with open(file_name, "rb") as file:
+                self.deliver_movie(file.read())
         else:
-            frames = [image.seek(i) or image.copy() for i in range(image.n_frames)]
+            self.deliver(ExecutorRegistry.submit(ExecutorRegistry.CPU, self.decode, file_name).result())
 
-        with BytesIO() as gif_buffer:
-            frames[0].save(
-                gif_buffer,
-                format="WEBP",
-                save_all=True,
-                append_images=frames[1:],
-                method=0,
-                duration=max(10, image.info.get('duration', 100) - 5),
-                loop=0
+    def decode(self, file_name) -> QImage:
+        return decode_image(file_name, self.target_size, self.device_pixel_ratio, self.aspect_mode)
+
+    def decode_on_cpu_pool(self, cache, file_name) -> QImage:
+        # this thread is for I/O, decoding parallelism is bounded by the CPU pool
+        return ExecutorRegistry.submit(ExecutorRegistry.CPU, self.decode_best, cache, file_name).result()
+
+    def decode_best(self, cache, file_name) -> QImage:
+        """Decode from the closest stored thumbnail, falling back to the original."""
+        if self.target_size is not None and self.allow_cache_file:
+            thumbnails = get_thumbnail_store(cache)
+            variant = thumbnails.best_variant(
+                self.image_url, self.target_size, self.device_pixel_ratio, self.aspect_mode
             )
-            gif_data = gif_buffer.getvalue()
+            if variant:
+                image = self.decode(variant)
+                if image is not None:
+                    return image
+            else:
+                # first time shown: this load decodes the original, later ones get the variants
+                thumbnails.ensure_in_background(self.image_url, file_name)
+        return self.decode(file_name)
 
-        self.loaded_gif_signal.emit(("gif_data", gif_data))
-        return
+    def handle_animated_avif(self, file_name, cache):
+        webp_path = transcode_animated_avif(self.image_url, file_name, cache)
+        with open(webp_path, "rb") as file:
+            self.deliver_movie(file.read())
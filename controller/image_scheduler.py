@@ -0,0 +1,127 @@
+import heapq
+import itertools
+import threading
+from enum import IntEnum
+
+from PySide6.QtCore import QRunnable
+
+from controller.executors import ExecutorRegistry
+
+
+class ImagePriority(IntEnum):
+    VISIBLE = 0
+    NEAR_VISIBLE = 1
+    PREFETCH = 2
+
+
+class _Entry:
+    def __init__(self, task, owner_key, priority, sequence):
+        self.task = task
+        self.owner_key = owner_key
+        self.priority = priority
+        self.sequence = sequence
+        self.started = False
+        self.cancelled = False
+
+    def __lt__(self, other):
+        # heap ties (same entry pushed again at the same priority) need no ordering
+        return False
+
+
+class _ScheduledRunnable(QRunnable):
+    def __init__(self, scheduler, entry):
+        super().__init__()
+        self.scheduler = scheduler
+        self.entry = entry
+
+    def run(self):
+        try:
+            if not self.entry.cancelled:
+                self.entry.task.run()
+        except Exception as e:
+            print(f"Error in image task: {e}")
+        finally:
+            self.scheduler._on_finished(self.entry)
+
+
+class ImageScheduler:
+    """
+    Runs image loading tasks on the I/O pool in priority order instead of creation order.
+    Tasks belong to an owner widget: their priority can be changed while they wait
+    (e.g. on scroll), and they are cancelled when the owner is destroyed, so a task
+    never calls back into a dead widget and queued work for it is dropped.
+    Tasks need run() and cancel(), like ImageLoaderTask.
+    """
+
+    _instance = None
+
+    @classmethod
+    def instance(cls) -> "ImageScheduler":
+        if cls._instance is None:
+            cls._instance = ImageScheduler()
+        return cls._instance
+
+    def __init__(self, executor: str = ExecutorRegistry.IO, max_running: int = None):
+        self.executor = executor
+        self.max_running = max_running or ExecutorRegistry.pool(executor).maxThreadCount()
+        self._lock = threading.Lock()
+        self._heap = []  # (priority, sequence, entry), stale items are skipped when popped
+        self._owners = {}  # owner key -> set of entries
+        self._running = 0
+        self._sequence = itertools.count()
+
+    def submit(self, task, owner=None, priority: ImagePriority = ImagePriority.VISIBLE) -> None:
+        owner_key = id(owner) if owner is not None else None
+        with self._lock:
+            entry = _Entry(task, owner_key, priority, next(self._sequence))
+            if owner_key is not None:
+                if owner_key not in self._owners:
+                    self._owners[owner_key] = set()
+                    owner.destroyed.connect(lambda: self.cancel_owner_key(owner_key))
+                self._owners[owner_key].add(entry)
+            heapq.heappush(self._heap, (entry.priority, entry.sequence, entry))
+        self._dispatch()
+
+    def set_priority(self, owner, priority: ImagePriority) -> None:
+        """Reorder the owner's waiting tasks, running ones are unaffected."""
+        with self._lock:
+            for entry in self._owners.get(id(owner), ()):
+                if not entry.started and entry.priority != priority:
+                    entry.priority = priority
+                    heapq.heappush(self._heap, (entry.priority, entry.sequence, entry))
+
+    def cancel_owner(self, owner) -> None:
+        self.cancel_owner_key(id(owner))
+
+    def cancel_owner_key(self, owner_key) -> None:
+        with self._lock:
+            entries = self._owners.pop(owner_key, set())
+        for entry in entries:
+            entry.cancelled = True
+            entry.task.cancel()
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return len({id(entry) for _, _, entry in self._heap if not entry.started and not entry.cancelled})
+
+    def _dispatch(self) -> None:
+        to_start = []
+        with self._lock:
+            while self._running < self.max_running and self._heap:
+                priority, _, entry = heapq.heappop(self._heap)
+                if entry.started or entry.cancelled or priority != entry.priority:
+                    continue
+                entry.started = True
+                self._running += 1
+                to_start.append(entry)
+        for entry in to_start:
+            ExecutorRegistry.start(self.executor, _ScheduledRunnable(self, entry))
+
+    def _on_finished(self, entry) -> None:
+        with self._lock:
+            self._running -= 1
+            entries = self._owners.get(entry.owner_key)
+            if entries is not None:
+                entries.discard(entry)
+        self._dispatch()
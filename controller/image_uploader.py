@@ -1,22 +1,105 @@
 import io
+import math
 import os
-import threading
+import uuid
+from dataclasses import dataclass
 from datetime import datetime
+from typing import List
 
 import requests
-from PIL import Image
-from PySide6.QtCore import Signal, QObject
+from PIL import Image, ImageChops
 
+from controller import blurhash
+from controller.encode_pool import EncodePool, EncodeCancelled
+from controller.executors import ExecutorRegistry
 from controller.profiler import track_execution_time
+from controller.resumable_upload import ResumableUploader, UploadInterrupted
+from controller.upload_index import UploadIndex, content_key
 from modal.constants import Constants
 
 
-class ImageUploaderSignals(QObject):
-    success_signal = Signal(str)
-    failure_signal = Signal(str)
+@dataclass
+class GifFrames:
+    """Decoded frames of an animation, reused by every encode attempt."""
+    frames: List[Image.Image]  # RGBA
+    durations: List[int]  # ms
+    loop: int = 0
 
-    def __init__(self):
-        super().__init__()
+    @property
+    def frame_rate(self) -> float:
+        """Average frames per second"""
+        return len(self.frames) * 1000 / max(1, sum(self.durations))
+
+    def every_second_frame(self) -> "GifFrames":
+        """Half the frames, each kept frame also shows for the dropped one's time."""
+        durations = [sum(self.durations[i:i + 2]) for i in range(0, len(self.frames), 2)]
+        return GifFrames(self.frames[::2], durations, self.loop)
+
+    def at_frame_rate(self, fps: float) -> "GifFrames":
+        """
+        At most fps frames per second: a frame is kept when its start time reaches
+        the next 1/fps slot, otherwise its time is added to the kept frame before it,
+        so the animation plays as long as before.
+        """
+        if fps >= self.frame_rate:
+            return self
+        slot = 1000 / fps
+        frames, durations = [], []
+        time = 0
+        next_slot = 0
+        for frame, duration in zip(self.frames, self.durations):
+            if not frames or time >= next_slot:
+                frames.append(frame)
+                durations.append(duration)
+                while next_slot <= time:
+                    next_slot += slot
+            else:
+                durations[-1] += duration
+            time += duration
+        return GifFrames(frames, durations, self.loop)
+
+    def merge_similar(self, max_difference: float) -> "GifFrames":
+        """
+        Merge runs of frames that look (almost) the same, the first of the run shows
+        for all of their time. Frames are compared to the last kept one on 64x64
+        copies, by the largest channel difference of any pixel (0..255): a small
+        moving object still counts as a change, dithering noise averages out.
+        """
+        frames, durations = [], []
+        previous = None
+        for frame, duration in zip(self.frames, self.durations):
+            small = frame.resize((64, 64), Image.BILINEAR)
+            if previous is not None and _max_difference(previous, small) <= max_difference:
+                durations[-1] += duration
+                continue
+            frames.append(frame)
+            durations.append(duration)
+            previous = small
+        return GifFrames(frames, durations, self.loop)
+
+    def trim_borders(self) -> "GifFrames":
+        """
+        Crop away borders (letterboxing, padding) that have the top left pixel's
+        color in every frame. Only the box that has content in some frame is kept.
+        """
+        background = Image.new(self.frames[0].mode, self.frames[0].size, self.frames[0].getpixel((0, 0)))
+        box = None
+        for frame in self.frames:
+            frame_box = ImageChops.difference(frame, background).getbbox(alpha_only=False)
+            if frame_box is None:
+                continue
+            if box is None:
+                box = frame_box
+            else:
+                box = (min(box[0], frame_box[0]), min(box[1], frame_box[1]),
+                       max(box[2], frame_box[2]), max(box[3], frame_box[3]))
+        if box is None or box == (0, 0) + self.frames[0].size:
+            return self
+        return GifFrames([frame.crop(box) for frame in self.frames], list(self.durations), self.loop)
+
+
+def _max_difference(a, b) -> int:
+    return max(high for _, high in ImageChops.difference(a, b).getextrema())
 
 
 class ImageUploader:
@@ -25,9 +108,35 @@ class ImageUploader:
     UPLOAD_URL = Constants.UPLOAD_URL
     STORAGE_URL = Constants.STORAGE_URL
     MAX_FILE_SIZE = Constants.MAX_FILE_SIZE
+    RESUMABLE_UPLOADS = Constants.RESUMABLE_UPLOADS
+    CHUNKED_UPLOAD_MIN_BYTES = Constants.CHUNKED_UPLOAD_MIN_BYTES  # bigger ones use ResumableUploader if enabled
+
+    # still image compression search, see search_still_encoding
+    QUALITY_RANGE = (95, 60)
+    SCALE_RANGE = (1.0, 0.5)
+    ENCODE_BUDGET = 5  # full size encodes, the probes are small
+    LEVEL_TOLERANCE = 0.03  # about 2 quality steps
+    PROBE_EDGE = 256
+    PROBE_QUALITIES = (60, 80, 95)
+    ESTIMATE_MARGIN = 0.9  # aim this far below the limit
+    ACCEPT_RATIO = 0.7  # a fitting encode at least this big is good enough
+    GIF_ATTEMPTS = 12  # AVIF encodes at most, see search_gif_encoding
+    GIF_MERGE_DIFFERENCE = 16  # frames changing no pixel of a 64x64 copy more than this are merged (0..255)
+    GIF_TRIM_BORDERS = True
+    GIF_MAX_FPS = 25  # more isn't worth the bytes
+    GIF_MIN_FPS = 10  # frame rate is traded for quality down to this
+    GIF_QUALITY_RANGE = (85, 30)
+    GIF_FPS_QUALITY = 45  # below this quality, lower the frame rate first
+    GIF_QUALITY_PER_HALVING = 15  # quality steps that about halve an AVIF, until measured
+    COMPRESSION_VERSION = 2  # bump when the encoder output changes, so earlier uploads aren't reused
 
     def __init__(self):
-        self.signals = ImageUploaderSignals()
+        # called as checkpoint(done, total) between encode attempts, may raise to stop
+        # (the encode pool uses it for progress and cancellation)
+        self.checkpoint = lambda done, total: None
+        self._jobs = set()
+        self._cancelled = False
+        self.upload_index = UploadIndex.instance()
 
     def get_file_url(self, file_name: str) -> str:
         return self.STORAGE_URL + file_name
@@ -41,7 +150,7 @@ class ImageUploader:
 
         Args:
             image_path: Path to the image file
-            max_size: Maximum dimensions (width, height)
+            max_size: Maximum dimensions (width, height) of still images, bigger ones are downscaled first
 
         Returns:
             BytesIO object containing the compressed image
@@ -56,155 +165,412 @@ class ImageUploader:
             if not support or support is None:
                 raise RuntimeError("AVIF support is not available")
 
-            quality = 85
-            speed = 7
-            drop_every_second_frame = False
-            # some basic algo
-            buffer = self.gif_to_avif_buffer(image_path, quality=quality, speed=speed,
-                                             drop_every_second_frame=drop_every_second_frame)
-            while buffer.getbuffer().nbytes > self.MAX_FILE_SIZE and quality > 30:
-                over_with = self.MAX_FILE_SIZE - buffer.getbuffer().nbytes
-                quality -= max(5, abs(int(12 * (over_with / 350000))))
-                quality = min(100, max(quality, 22))
-                if quality < 50:
-                    speed = 4
-                    print("Reducing quality to", quality, "and speed to", speed)
-                buffer = self.gif_to_avif_buffer(image_path, quality=quality, speed=speed,
-                                                 drop_every_second_frame=drop_every_second_frame)
-                if not drop_every_second_frame and quality < 40:
-                    quality = quality + 30
-                    drop_every_second_frame = True
-                    print("Dropping every second frame to reduce size")
-
-            else:
-                if buffer.getbuffer().nbytes > self.MAX_FILE_SIZE:
-                    print("AVIF (converting from GIF) is still too large after compression, upload unsuccessful")
-                    self.signals.failure_signal.emit("AVIF is too large after compression")
-                    raise RuntimeError("AVIF is too large after compression")
-                return buffer
+            # decoded once, every attempt below only encodes
+            return self.search_gif_encoding(self.decode_gif_frames(image_path))
 
-        quality = 95
-        current_size = float("inf")
+        img = self.downscale_for_encoding(img, max_size)
+        return self.search_still_encoding(img, img_format)
 
-        while current_size > self.MAX_FILE_SIZE and quality > 60:
-            output = io.BytesIO()
-            img.save(output, format=img_format, quality=quality, optimize=True)
-            current_size = output.tell()
-            output.seek(0)
+    def downscale_for_encoding(self, img, max_size: tuple):
+        """
+        Shrink an opened (not yet loaded) image to fit max_size, cheaply: JPEGs are
+        decoded at 1/2, 1/4 or 1/8 scale right in the DCT (draft mode), then
+        Image.reduce box-averages by the largest whole factor that stays above the
+        target, and only the last, less than 2x step is a LANCZOS resize.
+        A 48MP photo is never decoded at full size this way.
+        """
+        target = self.fit_size(img.width, img.height, max_size)
+        if target == (img.width, img.height):
+            return img
+        if img.format == "JPEG":
+            # keeps at least the requested size, and updates img.size to the decode size
+            img.draft("RGB", target)
+        if img.mode in ("1", "P"):
+            # reduce() doesn't take these and resize() would use nearest neighbour
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        factor = min(img.width // target[0], img.height // target[1])
+        if factor >= 2:
+            img = img.reduce(factor)
+        if (img.width, img.height) != target:
+            img = img.resize(target, Image.LANCZOS)
+        return img
+
+    @staticmethod
+    def fit_size(width: int, height: int, max_size: tuple) -> tuple:
+        """(width, height) scaled down to fit max_size with the aspect ratio kept, never up."""
+        scale = min(1.0, max_size[0] / width, max_size[1] / height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def reduce_gif_frames(self, frames: GifFrames) -> GifFrames:
+        """Drop what costs bytes without being seen: repeated frames, static borders, frames above GIF_MAX_FPS."""
+        frames = frames.merge_similar(self.GIF_MERGE_DIFFERENCE)
+        if self.GIF_TRIM_BORDERS:
+            frames = frames.trim_borders()
+        return frames.at_frame_rate(self.GIF_MAX_FPS)
+
+    def search_gif_encoding(self, frames: GifFrames) -> io.BytesIO:
+        """
+        Animated AVIF below MAX_FILE_SIZE, at most GIF_ATTEMPTS encodes. Each next
+        quality is aimed at the limit from the size of the last attempt, assuming
+        the size halves every GIF_QUALITY_PER_HALVING quality steps (the slope is
+        measured once two attempts are there). When the quality needed would fall
+        below GIF_FPS_QUALITY, the frame rate is halved instead, down to GIF_MIN_FPS.
+        Raises RuntimeError if even the lowest setting doesn't fit.
+        """
+        source = self.reduce_gif_frames(frames)
+        frames = source
+        best_quality, worst_quality = self.GIF_QUALITY_RANGE
+        quality = best_quality
+        previous = None  # (quality, size) of the last attempt with the same frames
+        for attempt in range(self.GIF_ATTEMPTS):
+            self.checkpoint(attempt, self.GIF_ATTEMPTS)
+            speed = 4 if quality < 50 else 7  # slower, but smaller at low quality
+            buffer = self.encode_avif(frames, quality=quality, speed=speed)
+            size = buffer.getbuffer().nbytes
+            if size <= self.MAX_FILE_SIZE:
+                return buffer
 
-            if current_size > self.MAX_FILE_SIZE:
-                # faster quality drop if file is still too big
-                if current_size - self.MAX_FILE_SIZE > 320000:
-                    quality -= 15
-                else:
-                    quality -= 5
-            else:
+            slope = self.GIF_QUALITY_PER_HALVING
+            if previous is not None and previous[1] > size:
+                slope = min(40.0, max(5.0, (previous[0] - quality) / math.log2(previous[1] / size)))
+            previous = (quality, size)
+            target = quality + slope * math.log2(self.MAX_FILE_SIZE * self.ESTIMATE_MARGIN / size)
+            next_quality = max(worst_quality, min(quality - 3, round(target)))
+
+            if next_quality < self.GIF_FPS_QUALITY and frames.frame_rate > self.GIF_MIN_FPS:
+                frames = source.at_frame_rate(max(self.GIF_MIN_FPS, frames.frame_rate / 2))
+                previous = None
+                print(f"Reducing frame rate to {frames.frame_rate:.1f} fps")
+            elif quality == worst_quality:
                 break
+            else:
+                quality = next_quality
+                print("Reducing quality to", quality)
 
-        if current_size > self.MAX_FILE_SIZE:
-            print("Reducing image dimensions to fit within size limit")
-            reduction_factor = 0.9
-            while current_size > self.MAX_FILE_SIZE and reduction_factor > 0.5:
-                new_dimensions = (
-                    int(img.width * reduction_factor),
-                    int(img.height * reduction_factor),
-                )
-                resized_img = img.resize(new_dimensions, Image.LANCZOS)
-
-                output = io.BytesIO()
-                resized_img.save(
-                    output, format=img_format, quality=quality, optimize=True
-                )
-                current_size = output.tell()
-                output.seek(0)
-
-                if current_size <= self.MAX_FILE_SIZE:
-                    img = resized_img
-                    break
-
-                reduction_factor -= 0.1
+        print("AVIF (converting from GIF) is still too large after compression, upload unsuccessful")
+        raise RuntimeError("AVIF is too large after compression")
 
+    def quality_and_scale(self, level: float) -> tuple:
+        """
+        Map a compression level in [0, 1] to (quality, scale). The first half lowers
+        quality at full size, the second half shrinks the image at the lowest quality,
+        so the encoded size falls (roughly) monotonically with the level.
+        """
+        best_quality, worst_quality = self.QUALITY_RANGE
+        largest_scale, smallest_scale = self.SCALE_RANGE
+        if level <= 0.5:
+            return round(best_quality - (best_quality - worst_quality) * level * 2), largest_scale
+        return worst_quality, largest_scale - (largest_scale - smallest_scale) * (level - 0.5) * 2
+
+    def encode_still(self, img, img_format: str, level: float) -> io.BytesIO:
+        quality, scale = self.quality_and_scale(level)
+        if scale < 1:
+            img = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.LANCZOS)
         output = io.BytesIO()
         img.save(output, format=img_format, quality=quality, optimize=True)
-        output.seek(0)
         return output
 
-    def upload_image(self, image_path: str, compress: bool = True) -> None:
+    def probe(self, img, img_format: str):
         """
-        Upload an image file to Supabase storage
-
-        Args:
-            image_path: Path to the image file
-            on_success: Signal. self.signals for success (takes image URL as parameter)
-            on_failure: Signal. self.signals for failure (takes error message as parameter)
-            compress: Whether to compress the image before uploading only compresses to 512kb!
+        Encode small copies of the image to learn how it compresses: at
+        PROBE_EDGE for every PROBE_QUALITIES entry, and once more at twice that
+        edge to see how the size grows with the pixel count.
+        Returns {"scale", "sizes": {quality: bytes}, "exponent"}, or None when
+        there is nothing to learn from.
         """
+        longest = max(img.width, img.height)
+        if longest <= self.PROBE_EDGE * 2:
+            return None
 
-        def upload_task():
+        def encoded_size(scale, quality):
+            small = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale))), Image.BILINEAR)
+            output = io.BytesIO()
+            small.save(output, format=img_format, quality=quality, optimize=True)
+            return output.tell()
+
+        probe_scale = self.PROBE_EDGE / longest
+        sizes = {quality: encoded_size(probe_scale, quality) for quality in self.PROBE_QUALITIES}
+        if not all(sizes.values()):
+            return None
+        middle_quality = self.PROBE_QUALITIES[len(self.PROBE_QUALITIES) // 2]
+        double_size = encoded_size(probe_scale * 2, middle_quality)
+        if double_size:
+            # 4x the pixels
+            exponent = math.log(double_size / sizes[middle_quality]) / math.log(4)
+        else:
+            exponent = 1.0
+        return {"scale": probe_scale, "sizes": sizes, "exponent": min(1.2, max(0.5, exponent))}
+
+    def estimate_size(self, probe: dict, level: float) -> float:
+        """Probe sizes interpolated in log space over quality, extrapolated by pixels ** exponent"""
+        quality, scale = self.quality_and_scale(level)
+        points = sorted(probe["sizes"].items())
+        (quality_a, size_a), (quality_b, size_b) = points[0], points[1]
+        for i in range(len(points) - 1):
+            if quality <= points[i + 1][0] or i == len(points) - 2:
+                (quality_a, size_a), (quality_b, size_b) = points[i], points[i + 1]
+                break
+        log_size = math.log(size_a) + (math.log(size_b) - math.log(size_a)) * (quality - quality_a) / (
+                quality_b - quality_a)
+        pixel_ratio = (scale / probe["scale"]) ** 2
+        return math.exp(log_size) * pixel_ratio ** probe["exponent"]
+
+    def estimate_level(self, probe: dict, correction: float = 1.0) -> float:
+        """Lowest level (best quality) whose estimated size fits, 0 without a probe."""
+        if probe is None:
+            return 0.0
+        for step in range(51):
+            level = step / 50
+            if self.estimate_size(probe, level) * correction <= self.MAX_FILE_SIZE * self.ESTIMATE_MARGIN:
+                return level
+        return 1.0
+
+    def interpolate_level(self, samples: list):
+        """
+        Level where the size should hit the target, interpolating log(size) between
+        the encodes closest to it on both sides (or the last two). None if unknown.
+        """
+        target = self.MAX_FILE_SIZE * self.ESTIMATE_MARGIN
+        usable = [(level, size) for level, size in samples if size > 0]
+        if len(usable) < 2:
+            return None
+        bigger = [sample for sample in usable if sample[1] > target]
+        smaller = [sample for sample in usable if sample[1] <= target]
+        if bigger and smaller:
+            (level_a, size_a), (level_b, size_b) = max(bigger), min(smaller)
+        else:
+            (level_a, size_a), (level_b, size_b) = usable[-2], usable[-1]
+        if level_a == level_b or size_a == size_b:
+            return None
+        slope = (math.log(size_b) - math.log(size_a)) / (level_b - level_a)
+        return level_a + (math.log(target) - math.log(size_a)) / slope
 
-            current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
-            file_name = "JPEG_" + current_datetime + ".dat"
-            if compress:
-                file_data = self.compress_image(image_path)
-                files = {"file": (file_name, file_data, "image/jpeg")}
+    @track_execution_time
+    def search_still_encoding(self, img, img_format: str) -> io.BytesIO:
+        """
+        Best quality encoding below MAX_FILE_SIZE. The level is bisected, with each
+        guess taken from a size model while it falls inside the current bracket: the
+        probe's estimate at first, then log-linear interpolation between real encodes.
+        Never does more than ENCODE_BUDGET full encodes; if nothing fits, the smallest
+        attempt is returned.
+        """
+        low, high = 0.0, 1.0  # low: too big (or unknown), high: fits (or assumed to)
+        probe = self.probe(img, img_format)
+        level = self.estimate_level(probe)
+        samples = []  # (level, size) of the full encodes so far
+        best = None
+        smallest = None
+        for attempt in range(self.ENCODE_BUDGET):
+            self.checkpoint(attempt, self.ENCODE_BUDGET)
+            if best is None and attempt == self.ENCODE_BUDGET - 1:
+                level = 1.0  # last chance, use the most compressed setting
+            output = self.encode_still(img, img_format, level)
+            size = output.tell()
+            output.seek(0)
+            samples.append((level, size))
+            if smallest is None or size < smallest[0]:
+                smallest = (size, output)
+
+            if size <= self.MAX_FILE_SIZE:
+                best = output
+                high = level
+                if size >= self.MAX_FILE_SIZE * self.ACCEPT_RATIO:
+                    break  # close enough to the limit, more encodes won't buy visible quality
             else:
-                files = {"file": (file_name, open(image_path, "rb"))}
-
-            response = requests.post(self.UPLOAD_URL, files=files)
+                low = level
+                if level >= 1.0:
+                    break
+            if best is not None and high - low <= self.LEVEL_TOLERANCE:
+                break
 
-            if response.status_code == 200:
-                print("Uploaded: " + str(response.text))
-                self.signals.success_signal.emit(response.text)
-            else:
-                error_msg = f"Server error: {response.status_code}, {response.text}"
-                self.signals.failure_signal.emit(error_msg)
+            guess = self.interpolate_level(samples)
+            if guess is None and probe is not None and size:
+                guess = self.estimate_level(probe, size / self.estimate_size(probe, level))
+            if guess is None or not low + self.LEVEL_TOLERANCE / 2 < guess < high - self.LEVEL_TOLERANCE / 2:
+                guess = (low + high) / 2
+            level = guess
 
-        thread = threading.Thread(target=upload_task)
-        thread.daemon = True
-        thread.start()
+        if best is None:
+            print("Image is still too large after compression")
+            return smallest[1]
+        return best
 
-    @track_execution_time
-    def gif_to_avif_buffer(self, image_path: str, quality: int = 90, speed: int = 5,
-                           drop_every_second_frame: bool = False) -> io.BytesIO:
+    def describe_image(self, file_data) -> dict:
         """
-        Convert an animated GIF to AVIF format and return it as a BytesIO buffer.
+        Size and blurhash of the image that gets uploaded, stored with the post so
+        the feed can show a correctly sized placeholder before the image loads.
 
         Args:
-            image_path: Path to the GIF file.
-            quality: Quality of the AVIF output (default is 90).
-            drop_every_second_frame: Whether to drop every second frame.
+            file_data: Path or file object of the (compressed) image
 
         Returns:
-            BytesIO object containing the AVIF image.
+            {"width", "height", "blurhash"}, or {} if the image can't be read
         """
-        img = Image.open(image_path)
-        frames = []
-        durations = []
+        try:
+            with Image.open(file_data) as img:
+                width, height = img.size
+                img.draft("RGB", (64, 64))  # JPEG only, decodes at 1/8 scale
+                small = img.convert("RGB")
+                small.thumbnail((32, 32))
+                if width >= height:
+                    components = (4, 3)
+                else:
+                    components = (3, 4)
+                hash_value = blurhash.encode(list(small.getdata()), small.width, small.height, *components)
+        except Exception as e:
+            print(f"Could not describe image: {e}")
+            return {}
+        finally:
+            if hasattr(file_data, "seek"):
+                file_data.seek(0)
+        return {"width": width, "height": height, "blurhash": hash_value}
+
+    def cancel(self) -> None:
+        """Cancel the running uploads, compression stops at its next attempt."""
+        self._cancelled = True
+        for job in list(self._jobs):
+            job.cancel()
+
+    def upload_file(self, image_path: str, compress: bool = True, on_progress=None) -> tuple:
+        """
+        Compress (optionally) and upload one file, blocking. Runs on a worker thread.
+        With RESUMABLE_UPLOADS on, files of CHUNKED_UPLOAD_MIN_BYTES or more are
+        streamed from disk in resumable chunks, everything else goes in one request.
+        A file that was already uploaded with the same settings isn't uploaded again,
+        the earlier object is reused.
 
-        if drop_every_second_frame:
-            # dropping frames
-            for frame in range(0, img.n_frames, 2):
-                img.seek(frame)
-                frames.append(img.convert("RGBA"))
-                duration = img.info.get('duration', 100)
-                durations.append(duration)
+        Returns:
+            (stored file name, describe_image() result)
+
+        Raises:
+            EncodeCancelled after cancel(), any other exception on failure
+        """
+        key = content_key(image_path, self.compression_params(compress))
+        earlier = self.find_uploaded(key)
+        if earlier is not None:
+            print("Already uploaded: " + earlier["name"])
+            if on_progress:
+                on_progress(1.0)
+            return earlier["name"], earlier["media_info"]
+
+        current_datetime = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
+        file_name = "JPEG_" + current_datetime + "_" + uuid.uuid4().hex[:6] + ".dat"
+        # with compression the first half of the progress is the encode, the rest the upload
+        encode_share = 0.5 if compress else 0.0
+        if compress:
+            # encoded in another process, this thread only waits for it
+            job = EncodePool.instance().submit(
+                image_path, on_progress and (lambda fraction: on_progress(fraction * encode_share)))
+            self._jobs.add(job)
+            try:
+                file_data = job.result()
+            finally:
+                self._jobs.discard(job)
+            size = file_data.getbuffer().nbytes
+            content_type = "image/jpeg"
+        else:
+            file_data = image_path
+            size = os.path.getsize(image_path)
+            content_type = "application/octet-stream"
+        media_info = ExecutorRegistry.submit(ExecutorRegistry.CPU, self.describe_image, file_data).result()
+        if self._cancelled:
+            raise EncodeCancelled()
+
+        def on_upload_progress(fraction):
+            if on_progress:
+                on_progress(encode_share + fraction * (1 - encode_share))
+
+        if self.RESUMABLE_UPLOADS and size >= self.CHUNKED_UPLOAD_MIN_BYTES:
+            try:
+                name = ResumableUploader().upload(file_data, file_name, content_type,
+                                                  on_upload_progress, lambda: self._cancelled)
+            except UploadInterrupted:
+                raise EncodeCancelled()
+        else:
+            name = self.post_file(file_data, file_name, content_type)
+            on_upload_progress(1.0)
+        print("Uploaded: " + name)
+        self.upload_index.add(key, name, media_info)
+        return name, media_info
+
+    def compression_params(self, compress: bool) -> tuple:
+        """Everything besides the source bytes that decides what gets stored."""
+        if not compress:
+            return ("original",)
+        return ("compressed", self.COMPRESSION_VERSION, self.MAX_FILE_SIZE, self.QUALITY_RANGE, self.SCALE_RANGE)
+
+    def find_uploaded(self, key: str):
+        """
+        The index entry of an earlier upload of the same content, if its object
+        is still in storage (a HEAD request, nothing is downloaded).
+        """
+        entry = self.upload_index.get(key)
+        if entry is None:
+            return None
+        try:
+            response = requests.head(self.get_file_url(entry["name"]), timeout=Constants.IMAGE_HTTP_TIMEOUT)
+        except requests.RequestException as e:
+            # can't check, the upload would most likely fail the same way
+            print(f"Could not check earlier upload {entry['name']}: {e}")
+            return None
+        if response.status_code in (400, 404):
+            # deleted from storage since
+            self.upload_index.remove(key)
+            return None
+        return entry if response.ok else None
+
+    def post_file(self, file_data, file_name: str, content_type: str) -> str:
+        """Upload in a single request to the upload function, returns the stored name."""
+        if isinstance(file_data, str):
+            with open(file_data, "rb") as file:
+                response = requests.post(self.UPLOAD_URL, files={"file": (file_name, file, content_type)})
         else:
-            # Keep all frames and their durations
+            response = requests.post(self.UPLOAD_URL, files={"file": (file_name, file_data, content_type)})
+        if response.status_code != 200:
+            raise requests.HTTPError(f"Server error: {response.status_code}, {response.text}", response=response)
+        return response.text
+
+    def decode_gif_frames(self, image_path: str) -> GifFrames:
+        """Decode every frame of an animated GIF to RGBA, with its duration."""
+        with Image.open(image_path) as img:
+            frames = []
+            durations = []
             for frame in range(img.n_frames):
                 img.seek(frame)
                 frames.append(img.convert("RGBA"))
-                duration = img.info.get('duration', 100)
+                durations.append(img.info.get('duration', 100))
+            return GifFrames(frames, durations, img.info.get('loop', 0))
 
-                durations.append(duration)
+    @track_execution_time
+    def encode_avif(self, frames: GifFrames, quality: int = 90, speed: int = 5) -> io.BytesIO:
+        """Encode decoded frames as an animated AVIF, returned as a BytesIO buffer."""
         output = io.BytesIO()
-        frames[0].save(
+        frames.frames[0].save(
             output,
             format="AVIF",
-            append_images=frames[1:],
+            append_images=frames.frames[1:],
             quality=quality,
             speed=speed,
-            duration=durations,
-            loop=img.info.get('loop', 0)
+            duration=frames.durations,
+            loop=frames.loop
         )
         output.seek(0)
         return output
+
+    def gif_to_avif_buffer(self, image_path: str, quality: int = 90, speed: int = 5,
+                           drop_every_second_frame: bool = False) -> io.BytesIO:
+        """
+        Convert an animated GIF to AVIF format and return it as a BytesIO buffer.
+
+        Args:
+            image_path: Path to the GIF file.
+            quality: Quality of the AVIF output (default is 90).
+            drop_every_second_frame: Whether to drop every second frame.
+
+        Returns:
+            BytesIO object containing the AVIF image.
+        """
+        frames = self.decode_gif_frames(image_path)
+        if drop_every_second_frame:
+            frames = frames.every_second_frame()
+        return self.encode_avif(frames, quality=quality, speed=speed)
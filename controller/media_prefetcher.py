@@ -0,0 +1,75 @@
+import time
+from dataclasses import dataclass
+
+from modal.constants import Constants
+
+
+@dataclass
+class PrefetchCandidate:
+    key: object  # whatever identifies the post for the caller, e.g. its widget
+    top: int
+    bottom: int
+    cost_bytes: int  # decoded size of its media
+    requested: bool  # loading was already started
+    loaded: bool  # media is decoded and held by the post
+
+
+class ScrollPrefetcher:
+    """
+    Decides which posts below (or above, when scrolling up) the fold should load
+    their media ahead of time. Looks further ahead the faster the feed is scrolled,
+    but never more than MAX_POSTS posts, more than MAX_IN_FLIGHT loads at once
+    (leaving connections for what's on screen) or more than MEMORY_BUDGET bytes of
+    decoded images that aren't visible yet.
+    """
+
+    MAX_POSTS = Constants.PREFETCH_POSTS
+    MAX_IN_FLIGHT = Constants.PREFETCH_MAX_IN_FLIGHT
+    MEMORY_BUDGET = Constants.PREFETCH_MEMORY_BYTES
+    LOOKAHEAD_SECONDS = 1.5  # how far ahead to look, in scrolling time
+    SMOOTHING = 0.3  # weight of the newest velocity sample
+
+    def __init__(self):
+        self.velocity = 0.0  # px/s, positive when scrolling down
+        self._last_value = None
+        self._last_time = None
+
+    def on_scroll(self, value: int, now: float = None) -> None:
+        now = time.monotonic() if now is None else now
+        if self._last_value is not None and now > self._last_time:
+            sample = (value - self._last_value) / (now - self._last_time)
+            self.velocity = self.SMOOTHING * sample + (1 - self.SMOOTHING) * self.velocity
+        self._last_value = value
+        self._last_time = now
+
+    def lookahead(self, viewport_height: int) -> int:
+        """Distance past the viewport to prefetch, in pixels"""
+        return viewport_height + int(abs(self.velocity) * self.LOOKAHEAD_SECONDS)
+
+    def plan(self, candidates, top: int, viewport_height: int) -> list:
+        """Keys of the candidates to start loading now, nearest first."""
+        bottom = top + viewport_height - 1  # last visible pixel row
+        distance = self.lookahead(viewport_height)
+        scrolling_up = self.velocity < 0
+
+        off_screen = [c for c in candidates if c.bottom < top or c.top > bottom]
+        in_flight = sum(1 for c in off_screen if c.requested and not c.loaded)
+        memory = sum(c.cost_bytes for c in off_screen if c.requested)
+
+        if scrolling_up:
+            ahead = [c for c in off_screen if c.bottom < top and c.bottom >= top - distance]
+            ahead.sort(key=lambda c: -c.bottom)
+        else:
+            ahead = [c for c in off_screen if c.top > bottom and c.top <= bottom + distance]
+            ahead.sort(key=lambda c: c.top)
+
+        chosen = []
+        for candidate in ahead[:self.MAX_POSTS]:
+            if candidate.requested:
+                continue
+            if in_flight >= self.MAX_IN_FLIGHT or memory + candidate.cost_bytes > self.MEMORY_BUDGET:
+                break
+            chosen.append(candidate.key)
+            in_flight += 1
+            memory += candidate.cost_bytes
+        return chosen
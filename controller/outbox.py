@@ -0,0 +1,532 @@
+import json
+import os
+import random
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import as_completed
+from datetime import datetime
+
+from PySide6.QtCore import QObject, Signal
+
+from modal.constants import Constants
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL UNIQUE,
+    user_id TEXT,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    failed INTEGER NOT NULL DEFAULT 0
+)
+"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    Whether a failed send may get through later: network errors, timeouts and
+    server side errors (5xx, 429). Anything else, e.g. a 4xx or an image that
+    can't be compressed enough, fails the same way on every attempt.
+    """
+    import requests
+    from google.api_core import exceptions as api_exceptions
+    from google.auth import exceptions as auth_exceptions
+
+    def retryable_status(status):
+        return status is None or status >= 500 or status == 429
+
+    if isinstance(error, requests.RequestException):
+        return retryable_status(None if error.response is None else error.response.status_code)
+    if isinstance(error, api_exceptions.GoogleAPICallError):
+        return retryable_status(error.code)
+    return isinstance(error, (api_exceptions.RetryError, auth_exceptions.TransportError,
+                              ConnectionError, TimeoutError))
+
+
+def remove_files(paths: list) -> None:
+    """Delete copies of images, and their folder once it's empty."""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        try:
+            os.rmdir(os.path.dirname(path))
+        except OSError:
+            pass  # not empty yet, or gone already
+
+
+def to_json_value(value):
+    """Firestore values to JSON: datetimes and SERVER_TIMESTAMP are tagged, see from_json_value"""
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+
+    if value is SERVER_TIMESTAMP:
+        return {"$server_timestamp": True}
+    if isinstance(value, datetime):
+        return {"$datetime": value.isoformat()}
+    if isinstance(value, dict):
+        return {name: to_json_value(item) for name, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [to_json_value(item) for item in value]
+    return value
+
+
+def from_json_value(value):
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+
+    if isinstance(value, dict):
+        if value.get("$server_timestamp"):
+            return SERVER_TIMESTAMP
+        if "$datetime" in value:
+            return datetime.fromisoformat(value["$datetime"])
+        return {name: from_json_value(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [from_json_value(item) for item in value]
+    return value
+
+
+class EntryDiscarded(Exception):
+    """The entry was discarded while it was being sent."""
+    pass
+
+
+class SendProgress:
+    """
+    The progress callback of an entry being sent.
+    progress(fraction, payload=None, parts=None) reports the fraction of the whole
+    send and of its parts (e.g. one per image), and stores payload when given.
+    Once the entry is discarded it raises EntryDiscarded, and the callbacks given to
+    on_discard() run, e.g. to cancel uploads that won't report progress for a while.
+    """
+
+    def __init__(self, outbox, row_id, key: str, sent: str):
+        self.outbox = outbox
+        self.row_id = row_id
+        self.key = key
+        self.sent = sent  # the stored payload this attempt is sending
+        self.discarded = False
+        self._on_discard = []
+        self._lock = threading.Lock()
+
+    def __call__(self, fraction: float, payload: dict = None, parts: list = None) -> None:
+        if self.discarded:
+            raise EntryDiscarded()
+        if payload is not None:
+            self.sent = self.outbox._store_payload(self.row_id, self.sent, payload)
+        self.outbox.entry_progress.emit(self.key, fraction, list(parts or []))
+
+    def on_discard(self, callback) -> None:
+        with self._lock:
+            if not self.discarded:
+                self._on_discard.append(callback)
+                return
+        callback()
+
+    def discard(self) -> None:
+        with self._lock:
+            self.discarded = True
+            callbacks, self._on_discard = self._on_discard, []
+        for callback in callbacks:
+            callback()
+
+
+class Outbox(QObject):
+    """
+    Writes that must reach the backend, kept in SQLite until they did.
+    enqueue() only touches the local disk; a drainer thread sends the entries in
+    order, each through the handler registered for its kind, and retries failed
+    ones with exponential backoff, also after a restart. Entries that fail in a
+    way retrying can't fix (see is_retryable) are kept as failed, without being
+    retried, until they are discarded or replaced. Every entry has a key
+    (e.g. the post id) that makes replaying it idempotent: the handler may run
+    again after a crash between sending and deleting the entry.
+
+    payload["images"], if there, are copies of images the outbox owns: they are
+    deleted once no waiting entry refers to them any more.
+
+    A handler is called as handler(payload, progress) on the drainer thread and
+    raises on failure. progress is a SendProgress: progress(fraction, payload=None,
+    parts=None) reports progress, and stores the payload when given, so finished
+    steps (uploaded images) aren't repeated on the next attempt.
+    """
+
+    entry_progress = Signal(str, float, list)  # key, 0..1, 0..1 per part (image) if it has parts
+    entry_sent = Signal(str, str, dict)  # kind, key, the payload as sent (e.g. with the uploaded names)
+    entry_failed = Signal(str, str, float)  # key, error, seconds until the next attempt
+    entry_rejected = Signal(str, str)  # key, error, not retried
+
+    RETRY_BASE_SECONDS = Constants.OUTBOX_RETRY_BASE_SECONDS
+    RETRY_MAX_SECONDS = Constants.OUTBOX_RETRY_MAX_SECONDS
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> "Outbox":
+        with cls._instance_lock:
+            if cls._instance is None:
+                outbox = Outbox(os.path.join(Constants.OUTBOX_FOLDER, "outbox.sqlite3"))
+                outbox.register("post", send_post)
+                outbox.register("profile", send_profile)
+                cls._instance = outbox
+            return cls._instance
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(SCHEMA)
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(outbox)")]
+        if "failed" not in columns:
+            # made before permanent failures were told apart
+            self._db.execute("ALTER TABLE outbox ADD COLUMN failed INTEGER NOT NULL DEFAULT 0")
+        # whatever was waiting before the restart is tried right away
+        self._db.execute("UPDATE outbox SET next_attempt = 0")
+        self._db.commit()
+        self._handlers = {}
+        self._user_id = None
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopped = False
+        self._sending = None  # SendProgress of the entry being sent
+
+    def register(self, kind: str, handler) -> None:
+        self._handlers[kind] = handler
+
+    def enqueue(self, kind: str, key: str, payload: dict, user_id: str = None, replace: bool = False,
+                merge=None) -> None:
+        """
+        Store a write to send. If the key is already waiting, nothing changes, or
+        with replace the waiting payload is replaced (a newer version of the same write),
+        which also gives a failed entry a new chance. merge(waiting, payload), if given,
+        returns what replaces the waiting payload instead.
+        """
+        if replace:
+            query = ("INSERT INTO outbox (kind, key, user_id, payload) VALUES (?, ?, ?, ?)"
+                     " ON CONFLICT(key) DO UPDATE SET payload = excluded.payload, attempts = 0, next_attempt = 0,"
+                     " failed = 0")
+        else:
+            query = "INSERT OR IGNORE INTO outbox (kind, key, user_id, payload) VALUES (?, ?, ?, ?)"
+        replaced = None
+        with self._lock:
+            if replace:
+                row = self._db.execute("SELECT payload FROM outbox WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    replaced = json.loads(row[0])
+                    if merge is not None:
+                        payload = merge(replaced, payload)
+            self._db.execute(query, (kind, key, user_id, json.dumps(payload)))
+            self._db.commit()
+        if replaced is not None:
+            self._release_files(replaced)
+        self._wake.set()
+
+    def pending(self, kind: str = None, user_id: str = None) -> list:
+        """(key, payload) of the entries not sent yet, oldest first"""
+        query = "SELECT key, payload FROM outbox WHERE (? IS NULL OR kind = ?) AND (? IS NULL OR user_id = ?) ORDER BY id"
+        with self._lock:
+            rows = self._db.execute(query, (kind, kind, user_id, user_id)).fetchall()
+        return [(key, json.loads(payload)) for key, payload in rows]
+
+    def rejected(self, kind: str = None, user_id: str = None) -> dict:
+        """key -> error of the entries that failed for good, a subset of pending()"""
+        query = "SELECT key, last_error FROM outbox WHERE failed AND (? IS NULL OR kind = ?) AND (? IS NULL OR user_id = ?)"
+        with self._lock:
+            return dict(self._db.execute(query, (kind, kind, user_id, user_id)).fetchall())
+
+    def discard(self, key: str) -> None:
+        """
+        Give up on an entry (e.g. the user cancelled the post), with the copies of its
+        images. An entry being sent stops at its next progress report, or goes through
+        if it's already past the last one.
+        """
+        with self._lock:
+            row = self._db.execute("SELECT payload FROM outbox WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return
+            self._db.execute("DELETE FROM outbox WHERE key = ?", (key,))
+            self._db.commit()
+            sending = self._sending if self._sending is not None and self._sending.key == key else None
+        if sending is not None:
+            # its handler may still be reading the images, _send removes them
+            sending.discard()
+        else:
+            self._release_files(json.loads(row[0]))
+
+    def _release_files(self, payload: dict) -> None:
+        """Delete the image copies of a payload that no waiting entry refers to."""
+        with self._lock:
+            referenced = {path for (stored,) in self._db.execute("SELECT payload FROM outbox")
+                          for path in json.loads(stored).get("images", [])}
+        remove_files([path for path in payload.get("images", []) if path not in referenced])
+
+    def start(self, user_id: str = None) -> None:
+        """Start draining the entries of user_id (all entries if None) in the background."""
+        self._user_id = user_id
+        self._wake.set()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="outbox", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wake.set()
+
+    def retry_delay(self, attempts: int) -> float:
+        delay = min(self.RETRY_MAX_SECONDS, self.RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        # spread out, so entries failed together don't retry together
+        return delay * random.uniform(0.8, 1.0)
+
+    def drain_once(self, now: float = None) -> float:
+        """
+        Send every entry that is due. Returns the seconds until the next entry
+        is due, None if nothing is waiting.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, kind, key, payload, attempts FROM outbox"
+                " WHERE NOT failed AND next_attempt <= ? AND (? IS NULL OR user_id = ?) ORDER BY id",
+                (now, self._user_id, self._user_id)).fetchall()
+        for row_id, kind, key, payload, attempts in rows:
+            if self._stopped:
+                break
+            self._send(row_id, kind, key, payload, attempts)
+
+        with self._lock:
+            next_attempt = self._db.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE NOT failed AND (? IS NULL OR user_id = ?)",
+                (self._user_id, self._user_id)).fetchone()[0]
+        return None if next_attempt is None else max(0.0, next_attempt - time.time())
+
+    def _store_payload(self, row_id, sent: str, payload: dict) -> str:
+        """Store the payload of an entry being sent, unless it was replaced since. Returns it as stored."""
+        stored = json.dumps(payload)
+        with self._lock:
+            self._db.execute("UPDATE outbox SET payload = ? WHERE id = ? AND payload = ?", (stored, row_id, sent))
+            self._db.commit()
+        return stored
+
+    def _send(self, row_id, kind, key, stored_payload, attempts) -> None:
+        progress = SendProgress(self, row_id, key, stored_payload)
+        with self._lock:
+            self._sending = progress
+        try:
+            handler = self._handlers.get(kind)
+            if handler is None:
+                raise RuntimeError(f"no outbox handler for {kind}")
+            handler(json.loads(stored_payload), progress)
+        except Exception as e:
+            if progress.discarded:
+                # whatever stopped it, the entry is gone
+                print(f"Outbox: {kind} {key} discarded while sending")
+                self._release_files(json.loads(progress.sent))
+                return
+            attempts += 1
+            if not is_retryable(e):
+                print(f"Outbox: sending {kind} {key} failed ({e}), not retrying")
+                with self._lock:
+                    self._db.execute("UPDATE outbox SET attempts = ?, failed = 1, last_error = ?"
+                                     " WHERE id = ? AND payload = ?",
+                                     (attempts, str(e), row_id, progress.sent))
+                    self._db.commit()
+                self.entry_rejected.emit(key, str(e))
+                return
+            delay = self.retry_delay(attempts)
+            print(f"Outbox: sending {kind} {key} failed ({e}), attempt {attempts}, retrying in {delay:.0f}s")
+            with self._lock:
+                self._db.execute("UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ?"
+                                 " WHERE id = ? AND payload = ?",
+                                 (attempts, time.time() + delay, str(e), row_id, progress.sent))
+                self._db.commit()
+            self.entry_failed.emit(key, str(e), delay)
+            return
+        finally:
+            with self._lock:
+                self._sending = None
+
+        with self._lock:
+            # replaced while it was being sent: the new version stays for the next round
+            self._db.execute("DELETE FROM outbox WHERE id = ? AND payload = ?", (row_id, progress.sent))
+            self._db.commit()
+        sent = json.loads(progress.sent)
+        self._release_files(sent)
+        self.entry_sent.emit(kind, key, sent)
+
+    def _run(self) -> None:
+        while not self._stopped:
+            self._wake.clear()
+            try:
+                wait = self.drain_once()
+            except Exception as e:
+                print(f"Outbox error: {e}")
+                wait = self.RETRY_BASE_SECONDS
+            self._wake.wait(wait)
+
+
+def copy_images(folder: str, image_paths: list) -> list:
+    """Copy images into an outbox folder, under names that don't clash with earlier copies."""
+    copies = []
+    if image_paths:
+        os.makedirs(folder, exist_ok=True)
+    for path in image_paths:
+        copy = os.path.join(folder, uuid.uuid4().hex + os.path.splitext(path)[1])
+        shutil.copyfile(path, copy)
+        copies.append(copy)
+    return copies
+
+
+def enqueue_post(post_data, image_paths: list) -> list:
+    """
+    Queue a new post with the images to upload for it. The images are copied
+    next to the outbox first, so the post doesn't depend on the originals.
+    Returns the copies, they stay until the post is sent or discarded.
+    """
+    from modal.post import PostData
+
+    images = copy_images(os.path.join(Constants.OUTBOX_FOLDER, post_data.id), image_paths)
+    post_dict = PostData.to_dict(post_data)
+    del post_dict["timestamp"]  # set by the server when it arrives
+    payload = {
+        "post": post_dict,
+        "created": datetime.now().astimezone().isoformat(),
+        "images": images,
+        "uploaded": [None] * len(images),
+    }
+    Outbox.instance().enqueue("post", post_data.id, payload, post_data.userId)
+    return images
+
+
+def enqueue_profile(user_id: str, profile_data=None, images: dict = None) -> dict:
+    """
+    Queue a profile save: the profile's fields (all of them, or none without
+    profile_data) and images to upload for picture fields, {"profileImageUrl": path}.
+    The images are copied next to the outbox like a post's, returns the copies by field.
+    """
+    from modal.user import ProfileData
+
+    fields = list(images or {})
+    profile = ProfileData.to_dict_without_id(profile_data) if profile_data is not None else {}
+    copies = copy_images(os.path.join(Constants.OUTBOX_FOLDER, f"profile-{user_id}"),
+                         [images[field] for field in fields])
+    payload = {
+        "user_id": user_id,
+        "profile": to_json_value(profile),
+        "images": copies,
+        "image_fields": fields,
+        "uploaded": [None] * len(copies),
+    }
+    # a newer save replaces the waiting one, an older one can't be sent after it
+    Outbox.instance().enqueue("profile", profile_key(user_id), payload, user_id, replace=True,
+                              merge=merge_profile)
+    return dict(zip(fields, copies))
+
+
+def profile_key(user_id: str) -> str:
+    """Outbox key of a user's profile saves"""
+    return f"profile:{user_id}"
+
+
+def profile_pictures(payload: dict) -> dict:
+    """{field: stored name} of a profile entry's pictures uploaded so far"""
+    return {field: done[0] for field, done in zip(payload.get("image_fields", []), payload["uploaded"]) if done}
+
+
+def merge_profile(waiting: dict, payload: dict) -> dict:
+    """A newer profile save on top of a waiting one, which keeps the pictures the newer doesn't change."""
+    merged = dict(payload, profile=dict(waiting["profile"], **payload["profile"]),
+                  images=[], image_fields=[], uploaded=[])
+    for source in (waiting, payload):
+        for field, path, done in zip(source.get("image_fields", []), source.get("images", []),
+                                     source.get("uploaded", [])):
+            if source is waiting and field in payload["image_fields"]:
+                continue
+            merged["images"].append(path)
+            merged["image_fields"].append(field)
+            merged["uploaded"].append(done)
+    return merged
+
+
+def upload_images(payload: dict, progress, share: float) -> None:
+    """
+    Upload an entry's images that aren't up yet, in parallel, into payload["uploaded"].
+    Reports up to share of the progress, and stores every finished upload, so the
+    next attempt only uploads what's still missing.
+    """
+    from controller.executors import ExecutorRegistry
+    from controller.image_uploader import ImageUploader
+
+    images = payload["images"]
+    uploaded = payload["uploaded"]
+    if not images:
+        return
+    uploader = ImageUploader()
+    progress.on_discard(uploader.cancel)
+    fractions = [1.0 if done else 0.0 for done in uploaded]
+    lock = threading.Lock()
+
+    def on_file_progress(index, fraction):
+        with lock:
+            fractions[index] = fraction
+            parts = list(fractions)
+        progress(sum(parts) / len(parts) * share, parts=parts)
+
+    futures = {
+        ExecutorRegistry.submit(ExecutorRegistry.UPLOAD, uploader.upload_file, path, True,
+                                lambda fraction, i=index: on_file_progress(i, fraction)): index
+        for index, path in enumerate(images) if uploaded[index] is None
+    }
+    try:
+        for future in as_completed(futures):
+            uploaded[futures[future]] = list(future.result())
+            with lock:
+                parts = list(fractions)
+            progress(sum(parts) / len(parts) * share, payload, parts)
+    except Exception:
+        uploader.cancel()
+        raise
+
+
+def send_post(payload: dict, progress) -> None:
+    """Upload the post's images that aren't up yet, then create the post document."""
+    from controller.firestore import create_post_document
+    from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+
+    upload_images(payload, progress, 0.95)
+    uploaded = payload["uploaded"]
+    post_dict = dict(payload["post"])
+    post_dict["mediaUrls"] = [name for name, _ in uploaded]
+    post_dict["mediaInfo"] = [info for _, info in uploaded]
+    post_dict["timestamp"] = SERVER_TIMESTAMP
+    progress(0.95)  # raises if the post was cancelled meanwhile, after this it's too late
+    create_post_document(post_dict)
+    progress(1.0)
+
+
+def send_profile(payload: dict, progress) -> None:
+    """Upload the new pictures, if any, then merge the profile with their names."""
+    from controller.firestore import set_user_profile
+    from controller.user_session import UserSession
+
+    upload_images(payload, progress, 0.9)
+    profile = from_json_value(payload["profile"])
+    pictures = profile_pictures(payload)
+    profile.update(pictures)
+    set_user_profile(payload["user_id"], profile)
+    # later saves start from the session's profile, they must not put the old pictures back
+    session = UserSession()
+    if session.user_id == payload["user_id"] and session.profile_data is not None:
+        for field, name in pictures.items():
+            setattr(session.profile_data, field, name)
+    progress(1.0)
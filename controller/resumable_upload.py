@@ -0,0 +1,239 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+
+import requests
+
+from modal.constants import Constants
+
+TUS_VERSION = "1.0.0"
+
+
+class UploadInterrupted(Exception):
+    """The upload was stopped by the caller, it can be resumed later."""
+    pass
+
+
+class UploadSessionStore:
+    """
+    Remembers unfinished resumable uploads in a small JSON file, so an upload of
+    the same data (after a crash or a failed attempt) continues where it stopped.
+    Entries are keyed by a fingerprint of the data, see fingerprint().
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self, sessions: dict) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(sessions, file)
+        os.replace(temp_path, self.path)
+
+    def get(self, key: str):
+        with self._lock:
+            return self._read().get(key)
+
+    def save(self, key: str, session: dict) -> None:
+        with self._lock:
+            sessions = self._read()
+            sessions[key] = session
+            self._write(sessions)
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            sessions = self._read()
+            if sessions.pop(key, None) is not None:
+                self._write(sessions)
+
+
+def fingerprint(source) -> str:
+    """Identifies the data to upload: path, size and mtime of a file, a hash of a buffer."""
+    if isinstance(source, str):
+        stat = os.stat(source)
+        return f"file:{os.path.abspath(source)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return "sha1:" + hashlib.sha1(_as_memoryview(source)).hexdigest()
+
+
+def _as_memoryview(source) -> memoryview:
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer()
+    return memoryview(source)
+
+
+class _FileSource:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.size = os.fstat(self.file.fileno()).st_size
+
+    def read(self, offset, length):
+        self.file.seek(offset)
+        return self.file.read(length)
+
+    def close(self):
+        self.file.close()
+
+
+class _BufferSource:
+    def __init__(self, buffer):
+        self.view = _as_memoryview(buffer)
+        self.size = self.view.nbytes
+
+    def read(self, offset, length):
+        # a slice of the view, the buffer isn't copied
+        return self.view[offset:offset + length]
+
+    def close(self):
+        self.view.release()
+
+
+class ResumableUploader:
+    """
+    Uploads with the tus resumable upload protocol (https://tus.io/protocols/resumable-upload),
+    which Supabase storage speaks at /storage/v1/upload/resumable.
+
+    The data is sent in chunk_size parts, read from the file (or a slice of the
+    buffer) one part at a time, so memory use doesn't grow with the file size.
+    After a network error or a server error the server is asked how much it
+    already has and only the rest is sent, up to max_retries times in a row.
+    The upload's URL is kept in the session store, so even a new attempt later
+    resumes instead of starting over.
+    """
+
+    def __init__(self, endpoint: str = Constants.RESUMABLE_UPLOAD_URL,
+                 headers: dict = None,
+                 chunk_size: int = Constants.UPLOAD_CHUNK_SIZE,
+                 store: UploadSessionStore = None,
+                 max_retries: int = 5,
+                 retry_delay: float = 0.5,
+                 timeout: tuple = Constants.IMAGE_HTTP_TIMEOUT):
+        self.endpoint = endpoint
+        self.headers = dict(Constants.RESUMABLE_UPLOAD_HEADERS if headers is None else headers)
+        if headers is None and "Authorization" not in self.headers:
+            raise ValueError("Resumable uploads need Constants.RESUMABLE_UPLOAD_HEADERS with the storage auth")
+        self.headers["Tus-Resumable"] = TUS_VERSION
+        self.chunk_size = chunk_size
+        self.store = store or UploadSessionStore(
+            os.path.join(Constants.UPLOAD_STATE_FOLDER, "upload_sessions.json"))
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+        self.session = requests.Session()
+
+    def upload(self, source, object_name: str, content_type: str = "application/octet-stream",
+               on_progress=None, should_stop=None) -> str:
+        """
+        Upload source (a file path, a BytesIO or any bytes-like buffer) as object_name.
+
+        Args:
+            on_progress: called with the fraction of bytes the server has, 0..1
+            should_stop: checked before every chunk, raise UploadInterrupted when it returns True
+
+        Returns:
+            the stored object name, which is the one of the earlier attempt when resuming
+        """
+        key = fingerprint(source)
+        data = _FileSource(source) if isinstance(source, str) else _BufferSource(source)
+        try:
+            session = self.store.get(key)
+            if session is None or session.get("size") != data.size:
+                session = self._create(data.size, object_name, content_type)
+                self.store.save(key, session)
+                offset = 0
+            else:
+                offset = self._server_offset(session)
+                if offset is None:
+                    # expired or unknown on the server, start a new upload
+                    session = self._create(data.size, object_name, content_type)
+                    self.store.save(key, session)
+                    offset = 0
+                else:
+                    print(f"Resuming upload of {session['name']} at {offset}/{data.size} bytes")
+
+            failures = 0
+            resync = False  # ask the server for the offset before sending more
+            while resync or offset < data.size:
+                if on_progress:
+                    on_progress(offset / data.size)
+                if should_stop and should_stop():
+                    raise UploadInterrupted()
+                try:
+                    if resync:
+                        # the server may have kept part of the failed chunk
+                        offset = self._server_offset(session)
+                        resync = False
+                        if offset is None:
+                            self.store.remove(key)
+                            raise RuntimeError(f"Upload {session['url']} expired on the server")
+                        continue
+                    offset = self._send_chunk(session, offset, data.read(offset, self.chunk_size))
+                    failures = 0
+                except requests.RequestException as e:
+                    failures += 1
+                    if failures > self.max_retries:
+                        raise
+                    print(f"Upload chunk failed ({e}), retrying")
+                    time.sleep(self.retry_delay * 2 ** (failures - 1))
+                    resync = True
+
+            if on_progress:
+                on_progress(1.0)
+            self.store.remove(key)
+            return session["name"]
+        finally:
+            data.close()
+
+    def _create(self, size: int, object_name: str, content_type: str) -> dict:
+        metadata = {
+            "bucketName": Constants.STORAGE_BUCKET,
+            "objectName": object_name,
+            "contentType": content_type,
+        }
+        headers = dict(self.headers)
+        headers["Upload-Length"] = str(size)
+        headers["Upload-Metadata"] = ",".join(
+            f"{name} {base64.b64encode(value.encode()).decode()}" for name, value in metadata.items())
+        response = self.session.post(self.endpoint, headers=headers, timeout=self.timeout)
+        if response.status_code != 201 or "Location" not in response.headers:
+            raise requests.HTTPError(f"Creating upload failed: {response.status_code}, {response.text}",
+                                     response=response)
+        url = requests.compat.urljoin(self.endpoint, response.headers["Location"])
+        return {"url": url, "name": object_name, "size": size}
+
+    def _server_offset(self, session: dict):
+        """Bytes the server has of the upload, None if it doesn't know the upload."""
+        response = self.session.head(session["url"], headers=self.headers, timeout=self.timeout)
+        if 400 <= response.status_code < 500:
+            return None
+        if response.status_code >= 500 or "Upload-Offset" not in response.headers:
+            raise requests.HTTPError(f"Upload status failed: {response.status_code}", response=response)
+        return int(response.headers["Upload-Offset"])
+
+    def _send_chunk(self, session: dict, offset: int, chunk) -> int:
+        headers = dict(self.headers)
+        headers["Upload-Offset"] = str(offset)
+        headers["Content-Type"] = "application/offset+octet-stream"
+        headers["Content-Length"] = str(len(chunk) if isinstance(chunk, bytes) else chunk.nbytes)
+        response = self.session.patch(session["url"], data=chunk, headers=headers, timeout=self.timeout)
+        if response.status_code == 409:
+            # offsets out of sync, e.g. an earlier attempt's chunk arrived after all
+            raise requests.RequestException("Upload offset conflict")
+        if response.status_code != 204 or "Upload-Offset" not in response.headers:
+            raise requests.HTTPError(f"Upload chunk failed: {response.status_code}, {response.text}",
+                                     response=response)
+        return int(response.headers["Upload-Offset"])
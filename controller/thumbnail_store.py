@@ -0,0 +1,136 @@
+from PySide6.QtCore import QBuffer, QIODevice, QSize, Qt
+from PySide6.QtGui import QImageReader
+
+import threading
+
+from controller.executors import ExecutorRegistry
+from controller.image_cache import DiskImageCache
+from controller.single_flight import SingleFlight
+
+# longest edge of the stored variants, in physical pixels.
+# covers 30/40px avatars, 120px profile pictures and 150px high covers at 1x and 2x
+THUMBNAIL_SIZES = (64, 128, 256, 512, 1024)
+THUMBNAIL_FORMAT = "WEBP"
+THUMBNAIL_QUALITY = 85
+BACKGROUND_PRIORITY = -1  # behind the decodes waiting on the CPU pool
+
+
+class ThumbnailStore:
+    """
+    Downscaled variants of cached images, generated once and stored in the disk
+    cache next to the original. Lookups return the smallest variant that is still
+    big enough for the requested display size.
+    """
+
+    def __init__(self, cache: DiskImageCache):
+        self.cache = cache
+        self._generating = SingleFlight()
+        self._queued = set()  # urls waiting for ensure_in_background
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def variant_name(size: int) -> str:
+        return f"thumb{size}"
+
+    def ensure(self, url: str, file_name: str) -> None:
+        """Generate the variants for a cached original unless that was already done."""
+        meta = self.cache.get_meta(url)
+        if meta is None or "thumbnails" in meta:
+            return
+        self._generating.do(url, lambda: self._generate(url, file_name))
+
+    def ensure_in_background(self, url: str, file_name: str) -> None:
+        """Like ensure(), as a low priority job on the CPU pool, so nobody waits for it."""
+        meta = self.cache.get_meta(url)
+        if meta is None or "thumbnails" in meta:
+            return
+        with self._lock:
+            if url in self._queued:
+                return
+            self._queued.add(url)
+
+        def generate():
+            try:
+                self.ensure(url, file_name)
+            except Exception as e:
+                print(f"Generating thumbnails failed: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(url)
+
+        ExecutorRegistry.start(ExecutorRegistry.CPU, generate, priority=BACKGROUND_PRIORITY)
+
+    def _generate(self, url: str, file_name: str) -> None:
+        meta = self.cache.get_meta(url)
+        if meta is None or "thumbnails" in meta:
+            return
+
+        reader = QImageReader(file_name)
+        reader.setAutoTransform(True)
+        source_size = reader.size()
+        if not source_size.isValid():
+            self.cache.update_meta(url, {"thumbnails": []})
+            return
+
+        sizes = [size for size in THUMBNAIL_SIZES if size < max(source_size.width(), source_size.height())]
+        if not sizes:
+            self.cache.update_meta(url, {"width": source_size.width(), "height": source_size.height(),
+                                         "thumbnails": []})
+            return
+
+        # decode once at the largest variant, the smaller ones are scaled from that
+        largest = sizes[-1]
+        scaled_size = source_size.scaled(largest, largest, Qt.KeepAspectRatio)
+        reader.setScaledSize(scaled_size)
+        image = reader.read()
+        if image.isNull():
+            self.cache.update_meta(url, {"thumbnails": []})
+            return
+        if (image.width() > image.height()) != (scaled_size.width() > scaled_size.height()):
+            # rotated by the exif orientation
+            source_size.transpose()
+
+        stored = []
+        for size in reversed(sizes):
+            if max(image.width(), image.height()) > size:
+                image = image.scaled(size, size, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            buffer = QBuffer()
+            buffer.open(QIODevice.WriteOnly)
+            if image.save(buffer, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY):
+                self.cache.put_bytes(url, bytes(buffer.data()), self.variant_name(size))
+                stored.append(size)
+            buffer.close()
+
+        self.cache.update_meta(url, {"width": source_size.width(), "height": source_size.height(),
+                                     "thumbnails": sorted(stored)})
+
+    def best_variant(self, url: str, target_size, device_pixel_ratio=1.0, aspect_mode=Qt.KeepAspectRatio):
+        """Path of the smallest stored variant covering target_size, or None to use the original."""
+        meta = self.cache.get_meta(url)
+        if not meta or not meta.get("thumbnails"):
+            return None
+        if not isinstance(target_size, QSize):
+            target_size = QSize(*target_size)
+
+        wanted = QSize(round(target_size.width() * device_pixel_ratio),
+                       round(target_size.height() * device_pixel_ratio))
+        needed = QSize(meta["width"], meta["height"]).scaled(wanted, aspect_mode)
+        needed_edge = max(needed.width(), needed.height())
+
+        for size in meta["thumbnails"]:
+            if size >= needed_edge:
+                path = self.cache.get_path(url, self.variant_name(size))
+                if path:
+                    return path
+        return None
+
+
+_stores = {}
+
+
+def get_thumbnail_store(cache: DiskImageCache) -> ThumbnailStore:
+    """Shared store per cache"""
+    store = _stores.get(cache.folder)
+    if store is None:
+        store = _stores.setdefault(cache.folder, ThumbnailStore(cache))
+    return store
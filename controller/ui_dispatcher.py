@@ -0,0 +1,55 @@
+import threading
+
+from PySide6.QtCore import QObject, Signal, Qt, QCoreApplication
+
+
+class UiDispatcher(QObject):
+    """
+    Runs callbacks on the GUI thread, from any thread.
+    Everything posted before the GUI thread gets to it runs in one batch in a
+    single event loop pass, so a burst of finished image loads updates all its
+    labels before the next paint instead of interleaving 50 paints with them.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+    _flush_requested = Signal()
+
+    @classmethod
+    def instance(cls) -> "UiDispatcher":
+        with cls._instance_lock:
+            if cls._instance is None:
+                dispatcher = UiDispatcher()
+                app = QCoreApplication.instance()
+                if app is not None:
+                    # may be first used from a worker thread, which has no event loop
+                    dispatcher.moveToThread(app.thread())
+                cls._instance = dispatcher
+            return cls._instance
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._scheduled = False
+        self.batches = 0  # flushes so far, for stats
+        self._flush_requested.connect(self._flush, Qt.QueuedConnection)
+
+    def post(self, callback, *args) -> None:
+        with self._lock:
+            self._pending.append((callback, args))
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._flush_requested.emit()
+
+    def _flush(self) -> None:
+        with self._lock:
+            batch, self._pending = self._pending, []
+            self._scheduled = False
+        self.batches += 1
+        for callback, args in batch:
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Error in UI callback: {e}")
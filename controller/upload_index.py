@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import threading
+
+from modal.constants import Constants
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def content_key(image_path: str, params) -> str:
+    """
+    SHA-256 of the file's bytes and the parameters it's uploaded with (compression
+    settings), read in chunks. The same image uploaded with other settings gets
+    another key, since the stored object would differ.
+    """
+    digest = hashlib.sha256(repr(params).encode())
+    with open(image_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadIndex:
+    """
+    Objects uploaded from this machine, by content_key(): the stored name and the
+    media info of each. Kept in memory and written through to a JSON file.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    @classmethod
+    def instance(cls) -> "UploadIndex":
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = UploadIndex(os.path.join(Constants.UPLOAD_STATE_FOLDER, "upload_index.json"))
+            return cls._instance
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None  # loaded on first use
+
+    def _load(self) -> dict:
+        if self._entries is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as file:
+                    self._entries = json.load(file)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self._entries, file)
+        os.replace(temp_path, self.path)
+
+    def get(self, key: str):
+        """{"name", "media_info"} of an earlier upload, or None"""
+        with self._lock:
+            return self._load().get(key)
+
+    def add(self, key: str, name: str, media_info: dict) -> None:
+        with self._lock:
+            self._load()[key] = {"name": name, "media_info": media_info}
+            self._save()
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            if self._load().pop(key, None) is not None:
+                self._save()
@@ -1,6 +1,35 @@
 class Constants:
     UPLOAD_URL = "https://lhojsvnzsgqzalyzmkne.supabase.co/functions/v1/storage-upload"
+    RESUMABLE_UPLOAD_URL = "https://lhojsvnzsgqzalyzmkne.supabase.co/storage/v1/upload/resumable"
+    # resumable (tus) uploads of big files, off until the storage API auth below is filled in:
+    # RESUMABLE_UPLOAD_HEADERS = {"Authorization": "Bearer <anon key>", "apikey": "<anon key>"}
+    RESUMABLE_UPLOADS = False
+    RESUMABLE_UPLOAD_HEADERS = {}
+    STORAGE_BUCKET = "faktw2"
     STORAGE_URL = (
         "https://lhojsvnzsgqzalyzmkne.supabase.co/storage/v1/object/public/faktw2/"
     )
     MAX_FILE_SIZE = 512 * 1000  # 500KB in bytes
+    UPLOAD_CHUNK_SIZE = 6 * 1024 * 1024  # resumable upload parts, Supabase only accepts 6MB
+    CHUNKED_UPLOAD_MIN_BYTES = 6 * 1024 * 1024  # smaller files go in a single request
+    IMAGE_CACHE_FOLDER = "cache"
+    UPLOAD_STATE_FOLDER = "uploads"  # upload sessions and index, not in the cache folder, which drops unknown files
+    IMAGE_CACHE_MAX_BYTES = 256 * 1000 * 1000  # downloaded images, evicted LRU above this
+    MAX_PLAYING_ANIMATIONS = 4  # animated images playing at the same time, the rest is paused
+    IMAGE_HTTP_MAX_PER_HOST = 6  # open connections per image host
+    IMAGE_HTTP_TIMEOUT = (5, 20)  # connect, read in seconds
+    IMAGE_CACHE_REVALIDATE_SECONDS = 24 * 60 * 60  # cached images older than this are revalidated
+    IMAGE_DOWNLOAD_MAX_BYTES = 20 * 1000 * 1000  # bigger downloads are aborted
+    PREFETCH_POSTS = 6  # feed posts ahead of the viewport whose media may be loaded early
+    PREFETCH_MAX_IN_FLIGHT = 2  # prefetch loads at the same time
+    PREFETCH_MEMORY_BYTES = 32 * 1000 * 1000  # decoded, not yet visible prefetched images
+    FEED_PARKED_WIDGETS = 12  # feed posts scrolled out of view that keep their widget and images
+    IO_THREADS = 8  # image downloads
+    CPU_THREADS = 0  # image decoding and encoding, 0 means one per core
+    BACKEND_THREADS = 4  # firestore calls
+    UPLOAD_THREADS = 4  # images uploaded at the same time
+    MAX_POST_IMAGES = 4  # attachments per post
+    OUTBOX_FOLDER = "outbox"  # unsent posts and profile writes, with copies of their images
+    OUTBOX_RETRY_BASE_SECONDS = 2  # first retry of a failed write, doubled per failure
+    OUTBOX_RETRY_MAX_SECONDS = 5 * 60
+    ENCODE_PROCESSES = 0  # image compression processes, 0 means one per core but one
@@ -1,4 +1,4 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import List, Optional
 
@@ -21,6 +21,8 @@ class PostData:
     likesCount: int
     timestamp: datetime
     userData: Optional["ProfileData"] = None
+    # per media url: {"width", "height", "blurhash"}, empty for older posts
+    mediaInfo: List[dict] = field(default_factory=list)
 
     @classmethod
     def from_dict(cls, data):
@@ -38,6 +40,7 @@ class PostData:
             likesCount=data.get("likesCount", 0),
             timestamp=a.astimezone(tz=None),
             userData=data.get("userData", None),
+            mediaInfo=data.get("mediaInfo", []),
         )
 
     @classmethod
@@ -47,6 +50,7 @@ class PostData:
             "commentsCount": post.commentsCount,
             "userProfilePicUrl": post.userProfilePicUrl,
             "mediaUrls": post.mediaUrls,
+            "mediaInfo": post.mediaInfo,
             "userName": post.userName,
             "id": post.id,
             "userId": post.userId,
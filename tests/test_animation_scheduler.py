@@ -0,0 +1,77 @@
+import io
+import sys
+import unittest
+
+from PIL import Image
+from PySide6.QtCore import QBuffer, QByteArray
+from PySide6.QtGui import QMovie
+from PySide6.QtWidgets import QApplication, QLabel, QScrollArea, QVBoxLayout, QWidget
+
+from controller.animation_scheduler import AnimationScheduler
+
+
+def make_gif_bytes():
+    frames = [Image.new("RGB", (50, 50), (i * 60, 0, 0)) for i in range(3)]
+    output = io.BytesIO()
+    frames[0].save(output, format="GIF", save_all=True, append_images=frames[1:], duration=50, loop=0)
+    return output.getvalue()
+
+
+class TestAnimationScheduler(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+
+    def setUp(self):
+        self.scheduler = AnimationScheduler()
+        self.scroll = QScrollArea()
+        self.scroll.resize(200, 200)
+        container = QWidget()
+        layout = QVBoxLayout(container)
+        self.movies = []
+        self.buffers = []
+        gif_data = make_gif_bytes()
+        for _ in range(10):
+            label = QLabel()
+            label.setFixedSize(100, 100)
+            buffer = QBuffer()
+            buffer.setData(QByteArray(gif_data))
+            movie = QMovie()
+            movie.setDevice(buffer)
+            label.setMovie(movie)
+            layout.addWidget(label)
+            self.scheduler.register(movie, label)
+            self.movies.append(movie)
+            self.buffers.append(buffer)
+        self.scroll.setWidget(container)
+        self.scroll.show()
+        self.app.processEvents()
+
+    def tearDown(self):
+        for movie in self.movies:
+            movie.stop()
+        self.scroll.close()
+
+    def test_plays_only_visible_movies(self):
+        self.scheduler.update_playback()
+        self.assertEqual(self.movies[0].state(), QMovie.Running)
+        self.assertNotEqual(self.movies[-1].state(), QMovie.Running)
+        self.assertLessEqual(self.scheduler.playing_count, AnimationScheduler.MAX_PLAYING)
+
+    def test_scrolling_swaps_playing_movies(self):
+        self.scheduler.update_playback()
+        self.scroll.verticalScrollBar().setValue(self.scroll.verticalScrollBar().maximum())
+        self.app.processEvents()
+        self.scheduler.update_playback()
+        self.assertEqual(self.movies[0].state(), QMovie.Paused)
+        self.assertEqual(self.movies[-1].state(), QMovie.Running)
+
+    def test_hidden_view_pauses_everything(self):
+        self.scheduler.update_playback()
+        self.scroll.hide()
+        self.scheduler.update_playback()
+        self.assertEqual(self.scheduler.playing_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from PySide6.QtCore import QSize
+from PySide6.QtGui import QGuiApplication
+
+from controller import blurhash
+
+
+class TestBlurhash(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QGuiApplication.instance() or QGuiApplication([])
+
+    def test_matches_reference_encoder(self):
+        width, height = 16, 4
+        pixels = [(x * 16, 255 - x * 16, (x * y * 13) % 256) for y in range(height) for x in range(width)]
+        self.assertEqual(blurhash.encode(pixels, width, height, 4, 3), "L[GvOO8itwk*%EO,oykBfMfRfTfS")
+
+    def test_uniform_image_round_trip(self):
+        hash_value = blurhash.encode([(200, 30, 60)] * (8 * 6), 8, 6, 1, 1)
+        self.assertEqual(blurhash.decode(hash_value, 2, 2), bytes((200, 30, 60)) * 4)
+
+    def test_gradient_keeps_direction(self):
+        width, height = 16, 4
+        pixels = [(x * 16, x * 16, x * 16) for _ in range(height) for x in range(width)]
+        decoded = blurhash.decode(blurhash.encode(pixels, width, height, 4, 1), width, 1)
+        self.assertLess(decoded[0], decoded[-3])
+
+    def test_invalid_hash(self):
+        with self.assertRaises(ValueError):
+            blurhash.decode("LEHV6n", 4, 4)  # size flag says more components
+        with self.assertRaises(ValueError):
+            blurhash.decode("not a hash!", 4, 4)
+        self.assertIsNone(blurhash.placeholder_image("", QSize(30, 20)))
+
+    def test_placeholder_has_display_size(self):
+        hash_value = blurhash.encode([(10, 120, 240)] * 4, 2, 2, 2, 2)
+        image = blurhash.placeholder_image(hash_value, QSize(300, 150), device_pixel_ratio=2.0)
+        self.assertEqual((image.width(), image.height()), (600, 300))
+        self.assertEqual(image.devicePixelRatio(), 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import os
+import tempfile
+import unittest
+
+from PIL import Image
+
+from controller.encode_pool import EncodePool, EncodeCancelled
+
+
+class TestEncodePool(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.image_path = os.path.join(cls.temp_dir.name, "photo.png")
+        Image.effect_noise((600, 400), 40).convert("RGB").save(cls.image_path)
+        cls.pool = EncodePool(max_workers=1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+        cls.temp_dir.cleanup()
+
+    def test_encodes_in_worker_process(self):
+        progress = []
+        job = self.pool.submit(self.image_path, progress.append)
+
+        output = job.result(60)
+
+        with Image.open(output) as image:
+            self.assertEqual(image.format, "WEBP")
+            self.assertEqual(image.size, (600, 400))
+        self.assertTrue(progress)
+        self.assertTrue(all(0 <= fraction <= 1 for fraction in progress))
+
+    def test_cancelled_job_raises(self):
+        job = self.pool.submit(self.image_path)
+        job.cancel()
+
+        with self.assertRaises(EncodeCancelled):
+            job.result(60)
+        self.assertTrue(job.cancelled)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import threading
+import unittest
+
+from controller.executors import ExecutorRegistry
+
+
+class TestExecutorRegistry(unittest.TestCase):
+    def test_pools_are_shared_and_sized(self):
+        ExecutorRegistry.configure("test-sized", 3)
+        pool = ExecutorRegistry.pool("test-sized")
+        self.assertIs(ExecutorRegistry.pool("test-sized"), pool)
+        self.assertEqual(pool.maxThreadCount(), 3)
+
+        ExecutorRegistry.configure("test-sized", 5)
+        self.assertEqual(pool.maxThreadCount(), 5)
+
+    def test_submit_returns_result_and_exceptions(self):
+        self.assertEqual(ExecutorRegistry.submit("test-submit", pow, 2, 10).result(2), 1024)
+        with self.assertRaises(ZeroDivisionError):
+            ExecutorRegistry.submit("test-submit", lambda: 1 / 0).result(2)
+
+    def test_stats_report_queue_depth(self):
+        ExecutorRegistry.configure("test-stats", 1)
+        gate = threading.Event()
+        started = threading.Event()
+
+        def blocker():
+            started.set()
+            gate.wait(2)
+
+        first = ExecutorRegistry.submit("test-stats", blocker)
+        second = ExecutorRegistry.submit("test-stats", lambda: None)
+        started.wait(2)
+        stats = ExecutorRegistry.stats()["test-stats"]
+        self.assertEqual((stats["active"], stats["queued"], stats["max_threads"]), (1, 1, 1))
+
+        gate.set()
+        first.result(2)
+        second.result(2)
+        ExecutorRegistry.pool("test-stats").waitForDone(2000)
+        stats = ExecutorRegistry.stats()["test-stats"]
+        self.assertEqual((stats["active"], stats["queued"], stats["completed"]), (0, 0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import os
+import tempfile
+import time
+import unittest
+
+from controller.image_cache import DiskImageCache
+
+
+class TestDiskImageCache(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = self.temp_dir.name
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def wait_for_eviction(self, cache):
+        for _ in range(100):
+            if not cache._evicting:
+                return
+            time.sleep(0.01)
+
+    def test_put_and_get(self):
+        cache = DiskImageCache(self.folder, max_bytes=1000)
+        self.assertIsNone(cache.get_path("https://example.com/a.png"))
+
+        path = cache.put_bytes("https://example.com/a.png", b"abc", meta={"etag": "x"})
+        self.assertEqual(cache.get_path("https://example.com/a.png"), path)
+        self.assertEqual(cache.get_meta("https://example.com/a.png"), {"etag": "x"})
+        self.assertEqual(cache.total_bytes, 3)
+
+    def test_same_file_name_in_different_buckets_does_not_collide(self):
+        cache = DiskImageCache(self.folder, max_bytes=1000)
+        first = cache.put_bytes("https://example.com/one/image.png", b"one")
+        second = cache.put_bytes("https://example.com/two/image.png", b"two")
+        self.assertNotEqual(first, second)
+
+    def test_evicts_least_recently_used(self):
+        cache = DiskImageCache(self.folder, max_bytes=250)
+        cache.put_bytes("a", b"x" * 100)
+        time.sleep(0.01)
+        cache.put_bytes("b", b"x" * 100)
+        time.sleep(0.01)
+        cache.get_path("a")
+        time.sleep(0.01)
+        cache.put_bytes("c", b"x" * 100)
+        self.wait_for_eviction(cache)
+
+        self.assertIsNotNone(cache.get_path("a"))
+        self.assertIsNone(cache.get_path("b"))
+        self.assertIsNotNone(cache.get_path("c"))
+        self.assertLessEqual(cache.total_bytes, 250)
+
+    def test_index_survives_restart_and_drops_leftovers(self):
+        cache = DiskImageCache(self.folder, max_bytes=1000)
+        path = cache.put_bytes("a", b"abc")
+        # a write interrupted by a crash and a file from the old flat layout
+        with open(cache.new_temp_path(), "wb") as file:
+            file.write(b"half")
+        with open(os.path.join(self.folder, "old.png"), "wb") as file:
+            file.write(b"old")
+        cache.flush()  # done at exit
+
+        reopened = DiskImageCache(self.folder, max_bytes=1000)
+        self.assertEqual(reopened.get_path("a"), path)
+        self.assertEqual(reopened.total_bytes, 3)
+        self.assertEqual(os.listdir(os.path.join(self.folder, DiskImageCache.TEMP_FOLDER)), [])
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "old.png")))
+
+    def test_index_writes_are_batched(self):
+        cache = DiskImageCache(self.folder, max_bytes=1000)
+        index_path = os.path.join(self.folder, DiskImageCache.INDEX_FILE)
+        written = os.path.getmtime(index_path), os.path.getsize(index_path)
+        cache.put_bytes("a", b"abc")
+        cache.put_bytes("b", b"def")
+        self.assertEqual((os.path.getmtime(index_path), os.path.getsize(index_path)), written)
+
+        cache.flush()
+        reopened = DiskImageCache(self.folder, max_bytes=1000)
+        self.assertIsNotNone(reopened.get_path("a"))
+        self.assertIsNotNone(reopened.get_path("b"))
+
+    def test_variants_go_with_their_original(self):
+        cache = DiskImageCache(self.folder, max_bytes=1000)
+        cache.put_bytes("a", b"original")
+        thumb = cache.put_bytes("a", b"thumb", variant="thumb64")
+        cache.discard("a")
+
+        self.assertIsNone(cache.get_path("a", "thumb64"))
+        self.assertFalse(os.path.exists(thumb))
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_evicting_an_original_evicts_its_variants(self):
+        cache = DiskImageCache(self.folder, max_bytes=250)
+        cache.put_bytes("a", b"x" * 100)
+        time.sleep(0.01)
+        cache.put_bytes("b", b"x" * 50)
+        time.sleep(0.01)
+        cache.put_bytes("a", b"x" * 50, variant="thumb64")  # used more recently than b
+        time.sleep(0.01)
+        cache.put_bytes("c", b"x" * 100)
+        self.wait_for_eviction(cache)
+
+        self.assertIsNone(cache.get_path("a"))
+        self.assertIsNone(cache.get_path("a", "thumb64"))
+        self.assertIsNotNone(cache.get_path("b"))
+        self.assertEqual(cache.total_bytes, 150)
+
+    def test_replacing_an_original_drops_its_variants(self):
+        cache = DiskImageCache(self.folder, max_bytes=1000)
+        cache.put_bytes("a", b"old")
+        cache.put_bytes("a", b"thumb", variant="thumb64")
+        cache.flush()
+        reopened = DiskImageCache(self.folder, max_bytes=1000)
+        reopened.put_bytes("a", b"new")
+
+        self.assertIsNone(reopened.get_path("a", "thumb64"))
+        self.assertEqual(reopened.total_bytes, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
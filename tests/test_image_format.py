@@ -0,0 +1,61 @@
+import os
+import tempfile
+import unittest
+
+from PIL import Image, features
+
+from controller.image_format import sniff_image
+
+
+class TestSniffImage(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def save(self, name, frames, **params):
+        path = os.path.join(self.temp_dir.name, name)
+        if len(frames) > 1:
+            params.update(save_all=True, append_images=frames[1:], duration=100, loop=0)
+        frames[0].save(path, **params)
+        return path
+
+    def frames(self, count):
+        return [Image.new("RGB", (32, 32), (i * 40, 0, 0)) for i in range(count)]
+
+    def assert_sniffed(self, path, image_format, animated):
+        info = sniff_image(path)
+        self.assertEqual(info.format, image_format)
+        self.assertEqual(info.animated, animated)
+
+    def test_gif(self):
+        self.assert_sniffed(self.save("still.gif", self.frames(1)), "GIF", False)
+        self.assert_sniffed(self.save("anim.gif", self.frames(3)), "GIF", True)
+
+    def test_png(self):
+        self.assert_sniffed(self.save("still.png", self.frames(1)), "PNG", False)
+        self.assert_sniffed(self.save("anim.png", self.frames(3), format="PNG"), "PNG", True)
+
+    def test_jpeg(self):
+        self.assert_sniffed(self.save("still.jpg", self.frames(1)), "JPEG", False)
+
+    def test_webp(self):
+        self.assert_sniffed(self.save("still.webp", self.frames(1)), "WEBP", False)
+        self.assert_sniffed(self.save("anim.webp", self.frames(3)), "WEBP", True)
+
+    @unittest.skipUnless(features.check("avif"), "Pillow built without AVIF")
+    def test_avif(self):
+        self.assert_sniffed(self.save("still.avif", self.frames(1)), "AVIF", False)
+        self.assert_sniffed(self.save("anim.avif", self.frames(3)), "AVIF", True)
+
+    def test_unknown_and_missing(self):
+        path = os.path.join(self.temp_dir.name, "notes.txt")
+        with open(path, "wb") as file:
+            file.write(b"not an image")
+        self.assertIsNone(sniff_image(path).format)
+        self.assertIsNone(sniff_image(os.path.join(self.temp_dir.name, "missing")).format)
+
+
+if __name__ == '__main__':
+    unittest.main()
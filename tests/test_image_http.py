@@ -0,0 +1,130 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+from controller.image_cache import DiskImageCache
+from controller.image_http import ImageHttpClient, DownloadTooLarge, is_stale
+from controller.image_loader_task import download_image
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    body = b"image bytes"
+    etag = '"v1"'
+    send_length = True
+    requests_seen = []
+    connections = set()
+
+    def do_GET(self):
+        ImageHandler.requests_seen.append(dict(self.headers))
+        ImageHandler.connections.add(self.client_address)
+        if self.headers.get("If-None-Match") == ImageHandler.etag:
+            self.send_response(304)
+            self.send_header("ETag", ImageHandler.etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", ImageHandler.etag)
+        if ImageHandler.send_length:
+            self.send_header("Content-Length", str(len(ImageHandler.body)))
+        else:
+            # body ends when the connection closes
+            self.send_header("Connection", "close")
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(ImageHandler.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestImageHttp(unittest.TestCase):
+    def setUp(self):
+        ImageHandler.requests_seen = []
+        ImageHandler.connections = set()
+        ImageHandler.body = b"image bytes"
+        ImageHandler.etag = '"v1"'
+        ImageHandler.send_length = True
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/avatar.png"
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskImageCache(os.path.join(self.temp_dir.name, "cache"))
+        self.client = ImageHttpClient(max_per_host=2, timeout=(2, 2))
+        patcher = patch('controller.image_loader_task.get_image_http_client', return_value=self.client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.client.session.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def expire(self):
+        self.cache.update_meta(self.url, {"fetched_at": 0})
+
+    def test_stores_validators_and_serves_fresh_copy_without_request(self):
+        path = download_image(self.url, self.cache)
+        self.assertEqual(self.cache.get_meta(self.url)["etag"], '"v1"')
+        self.assertFalse(is_stale(self.cache.get_meta(self.url)))
+
+        self.assertEqual(download_image(self.url, self.cache), path)
+        self.assertEqual(len(ImageHandler.requests_seen), 1)
+
+    def test_unchanged_image_revalidates_with_304_on_same_connection(self):
+        path = download_image(self.url, self.cache)
+        self.expire()
+
+        self.assertEqual(download_image(self.url, self.cache), path)
+        self.assertEqual(ImageHandler.requests_seen[-1].get("If-None-Match"), '"v1"')
+        self.assertEqual(len(ImageHandler.connections), 1)
+        self.assertFalse(is_stale(self.cache.get_meta(self.url)))
+
+    def test_changed_image_replaces_cached_copy(self):
+        download_image(self.url, self.cache)
+        self.expire()
+        ImageHandler.body = b"new image bytes"
+        ImageHandler.etag = '"v2"'
+
+        path = download_image(self.url, self.cache)
+        with open(path, "rb") as file:
+            self.assertEqual(file.read(), b"new image bytes")
+        self.assertEqual(self.cache.get_meta(self.url)["etag"], '"v2"')
+
+    def test_unreachable_server_keeps_stale_copy(self):
+        path = download_image(self.url, self.cache)
+        self.expire()
+        self.server.shutdown()
+        self.server.server_close()
+        self.client.session.close()
+
+        self.assertEqual(download_image(self.url, self.cache), path)
+
+    def test_oversized_content_length_is_rejected(self):
+        ImageHandler.body = b"x" * 1000
+        with self.assertRaises(DownloadTooLarge):
+            download_image(self.url, self.cache, max_bytes=100)
+        self.assertIsNone(self.cache.get_path(self.url))
+        self.assertEqual(os.listdir(os.path.join(self.cache.folder, self.cache.TEMP_FOLDER)), [])
+
+    def test_body_over_limit_is_aborted_without_content_length(self):
+        ImageHandler.body = b"x" * 300 * 1000
+        ImageHandler.send_length = False
+        with self.assertRaises(DownloadTooLarge):
+            download_image(self.url, self.cache, max_bytes=100 * 1000)
+        self.assertIsNone(self.cache.get_path(self.url))
+        self.assertEqual(os.listdir(os.path.join(self.cache.folder, self.cache.TEMP_FOLDER)), [])
+
+        ImageHandler.body = b"x" * 1000
+        path = download_image(self.url, self.cache, max_bytes=100 * 1000)
+        self.assertEqual(os.path.getsize(path), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
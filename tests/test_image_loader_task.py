@@ -0,0 +1,169 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch, MagicMock
+
+from PIL import Image, features
+from PySide6.QtCore import Qt
+
+from controller.image_cache import DiskImageCache
+from controller.image_loader_task import (ImageLoaderTask, download_image, decode_image, transcode_animated_avif,
+                                          local_image_url)
+
+
+class TestDownloadImage(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskImageCache(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @patch('controller.image_loader_task.get_image_http_client')
+    def test_concurrent_downloads_share_one_request(self, mock_client):
+        """concurrent loaders of the same url only hit the network once"""
+
+        def slow_get(url, **kwargs):
+            time.sleep(0.2)
+            response = MagicMock()
+            response.status_code = 200
+            response.headers = {}
+            response.iter_content.return_value = [b'image ', b'bytes']
+            return response
+
+        mock_get = mock_client.return_value.get
+        mock_get.side_effect = slow_get
+        results = []
+
+        def worker():
+            results.append(download_image("https://example.com/avatar.png", self.cache))
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(len(set(results)), 1)
+        with open(results[0], "rb") as file:
+            self.assertEqual(file.read(), b'image bytes')
+
+    @patch('controller.image_loader_task.get_image_http_client')
+    def test_failed_download_reaches_every_waiter(self, mock_client):
+        """waiters get the leader's exception and no file is left behind"""
+
+        def failing_get(url, **kwargs):
+            time.sleep(0.2)
+            raise ConnectionError("offline")
+
+        mock_client.return_value.get.side_effect = failing_get
+        errors = []
+
+        def worker():
+            try:
+                download_image("https://example.com/avatar.png", self.cache)
+            except ConnectionError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(errors), 3)
+        self.assertIsNone(self.cache.get_path("https://example.com/avatar.png"))
+
+
+class TestImageLoaderTask(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @patch('controller.image_loader_task.get_image_http_client')
+    def test_undecodable_download_still_calls_back(self, mock_client):
+        """a download that isn't an image ends in a None result, not silence"""
+        response = MagicMock()
+        response.status_code = 200
+        response.headers = {}
+        response.iter_content.return_value = [b'<html>not an image</html>']
+        mock_client.return_value.get.return_value = response
+
+        task = ImageLoaderTask("https://example.com/broken.png", MagicMock(), save_folder=self.temp_dir.name)
+        cache = DiskImageCache(self.temp_dir.name)
+        with patch('controller.image_loader_task.get_image_cache', return_value=cache), \
+                patch.object(task, 'deliver') as mock_deliver:
+            task.run()
+        mock_deliver.assert_called_once_with(None)
+
+    @patch('controller.image_loader_task.get_image_cache')
+    def test_local_file_is_read_in_place(self, mock_get_cache):
+        """an image not uploaded yet is decoded from disk, nothing is downloaded or cached"""
+        path = os.path.join(self.temp_dir.name, "upload.png")
+        Image.new("RGB", (400, 300), "blue").save(path)
+
+        task = ImageLoaderTask(local_image_url(path), MagicMock(), target_size=(100, 100))
+        with patch.object(task, 'deliver') as mock_deliver:
+            task.run()
+
+        image = mock_deliver.call_args.args[0]
+        self.assertEqual((image.width(), image.height()), (100, 75))
+        mock_get_cache.assert_not_called()
+
+
+class TestDecodeImage(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file_name = os.path.join(self.temp_dir.name, "photo.png")
+        Image.new("RGB", (800, 600), "red").save(self.file_name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_decodes_at_display_size(self):
+        image = decode_image(self.file_name, (40, 40), device_pixel_ratio=2.0)
+        self.assertEqual((image.width(), image.height()), (80, 60))
+        self.assertEqual(image.devicePixelRatio(), 2.0)
+
+    def test_expanding_covers_target(self):
+        image = decode_image(self.file_name, (600, 150), aspect_mode=Qt.KeepAspectRatioByExpanding)
+        self.assertEqual((image.width(), image.height()), (600, 450))
+
+    def test_never_upscales(self):
+        image = decode_image(self.file_name, (2000, 2000))
+        self.assertEqual((image.width(), image.height()), (800, 600))
+
+
+@unittest.skipUnless(features.check("avif"), "Pillow built without AVIF")
+class TestTranscodeAnimatedAvif(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskImageCache(os.path.join(self.temp_dir.name, "cache"))
+        source = os.path.join(self.temp_dir.name, "anim.avif")
+        frames = [Image.new("RGB", (32, 32), (i * 60, 0, 0)) for i in range(4)]
+        frames[0].save(source, save_all=True, append_images=frames[1:], duration=80)
+        with open(source, "rb") as file:
+            self.file_name = self.cache.put_bytes("https://example.com/anim.avif", file.read())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_transcodes_once_and_reuses_result(self):
+        webp_path = transcode_animated_avif("https://example.com/anim.avif", self.file_name, self.cache)
+        with Image.open(webp_path) as webp:
+            self.assertEqual(webp.format, "WEBP")
+            self.assertEqual(webp.n_frames, 4)
+
+        with patch('PIL.Image.open') as mock_open:
+            again = transcode_animated_avif("https://example.com/anim.avif", self.file_name, self.cache)
+            mock_open.assert_not_called()
+        self.assertEqual(again, webp_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import sys
+import threading
+import time
+import unittest
+
+from PySide6.QtWidgets import QApplication, QWidget
+
+from controller.executors import ExecutorRegistry
+from controller.image_scheduler import ImageScheduler, ImagePriority
+
+
+class FakeTask:
+    def __init__(self, name, log, gate=None):
+        self.name = name
+        self.log = log
+        self.gate = gate
+        self.cancelled = False
+
+    def run(self):
+        if self.gate:
+            self.gate.wait(2)
+        self.log.append(self.name)
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class TestImageScheduler(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+
+    def setUp(self):
+        ExecutorRegistry.configure("test-images", 1)
+        self.pool = ExecutorRegistry.pool("test-images")
+        self.scheduler = ImageScheduler("test-images", max_running=1)
+        self.log = []
+        self.gate = threading.Event()
+        # keeps the only slot busy until the queue is set up
+        self.scheduler.submit(FakeTask("blocker", self.log, self.gate))
+
+    def finish(self):
+        self.gate.set()
+        self.pool.waitForDone(2000)
+        for _ in range(50):
+            if self.scheduler.pending_count == 0 and self.scheduler._running == 0:
+                break
+            time.sleep(0.01)
+        self.pool.waitForDone(2000)
+
+    def test_runs_in_priority_order(self):
+        self.scheduler.submit(FakeTask("prefetch", self.log), priority=ImagePriority.PREFETCH)
+        self.scheduler.submit(FakeTask("near", self.log), priority=ImagePriority.NEAR_VISIBLE)
+        self.scheduler.submit(FakeTask("visible", self.log), priority=ImagePriority.VISIBLE)
+        self.finish()
+        self.assertEqual(self.log, ["blocker", "visible", "near", "prefetch"])
+
+    def test_reprioritizes_waiting_tasks(self):
+        owner = QWidget()
+        self.scheduler.submit(FakeTask("first", self.log), priority=ImagePriority.VISIBLE)
+        self.scheduler.submit(FakeTask("scrolled_into_view", self.log), owner=owner,
+                              priority=ImagePriority.PREFETCH)
+        self.scheduler.set_priority(owner, ImagePriority.VISIBLE)
+        self.scheduler.submit(FakeTask("later", self.log), priority=ImagePriority.NEAR_VISIBLE)
+        self.finish()
+        self.assertEqual(self.log, ["blocker", "first", "scrolled_into_view", "later"])
+
+    def test_destroyed_owner_cancels_its_tasks(self):
+        owner = QWidget()
+        task = FakeTask("dead", self.log)
+        self.scheduler.submit(task, owner=owner)
+        self.scheduler.submit(FakeTask("alive", self.log))
+        del owner  # last reference, destroys the widget
+        self.finish()
+        self.assertTrue(task.cancelled)
+        self.assertEqual(self.log, ["blocker", "alive"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,12 @@
 import unittest
 from unittest.mock import patch, MagicMock
 import io
+import math
+import os
+import tempfile
 
 from controller.image_uploader import ImageUploader
+from controller.upload_index import UploadIndex, content_key
 
 
 class TestImageUploader(unittest.TestCase):
@@ -47,6 +51,7 @@ class TestImageUploader(unittest.TestCase):
                 output.write(b'x' * 400000)
 
         mock_img.save.side_effect = save_effect
+        mock_img.resize.return_value = mock_img
         mock_image_open.return_value = mock_img
 
         result = self.image_uploader.compress_image("fake_image.jpg")
@@ -54,6 +59,185 @@ class TestImageUploader(unittest.TestCase):
         self.assertIsInstance(result, io.BytesIO)
         self.assertTrue(mock_img.save.call_count > 1)
 
+    @patch('PIL.Image.open')
+    def test_compress_image_search_stays_within_budget(self, mock_image_open):
+        """a large image is searched to the size limit with a bounded number of full size encodes"""
+        full_encodes = []
+
+        def fake_image(width, height):
+            img = MagicMock()
+            img.width = width
+            img.height = height
+            img.format = "PNG"
+
+            def save_effect(output, format, quality, optimize):
+                if width >= 1000:
+                    full_encodes.append(quality)
+                pixels = width * height / (4000 * 3000)
+                output.write(b'x' * int(3000000 * pixels * math.exp(0.06 * (quality - 95))))
+
+            img.save.side_effect = save_effect
+            img.resize.side_effect = lambda size, resample: fake_image(*size)
+            img.reduce.side_effect = lambda factor: fake_image(-(-width // factor), -(-height // factor))
+            return img
+
+        mock_image_open.return_value = fake_image(4000, 3000)
+
+        result = self.image_uploader.compress_image("fake_image.png")
+
+        self.assertLessEqual(len(result.getvalue()), self.image_uploader.MAX_FILE_SIZE)
+        self.assertLessEqual(len(full_encodes), self.image_uploader.ENCODE_BUDGET)
+
+    def test_large_jpeg_is_decoded_small(self):
+        """draft mode and reduce() bring a big photo to max_size without a full size decode"""
+        from PIL import Image
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "photo.jpg")
+            Image.new("RGB", (4000, 3000), (30, 90, 150)).save(path, quality=90)
+
+            with Image.open(path) as img:
+                with patch.object(Image.Image, 'resize', autospec=True, side_effect=Image.Image.resize) as resize:
+                    small = self.image_uploader.downscale_for_encoding(img, (1200, 1200))
+                    # draft decoded at 1/2, the rest is done by a single resize
+                    self.assertEqual(resize.call_args.args[0].size, (2000, 1500))
+
+            self.assertEqual(small.size, (1200, 900))
+
+    def test_gif_frames_are_decoded_once_across_attempts(self):
+        """every AVIF attempt re-encodes the same decoded frames"""
+        from PIL import Image, features
+        if not features.check('avif'):
+            self.skipTest("AVIF support is not available")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "anim.gif")
+            frames = [Image.effect_noise((64, 64), 60 + i * 10).convert("P") for i in range(6)]
+            frames[0].save(path, save_all=True, append_images=frames[1:], duration=40, loop=0)
+            self.image_uploader.MAX_FILE_SIZE = 1  # nothing fits, every attempt is made
+
+            with patch.object(self.image_uploader, 'decode_gif_frames',
+                              wraps=self.image_uploader.decode_gif_frames) as decode, \
+                    patch.object(self.image_uploader, 'encode_avif',
+                                 wraps=self.image_uploader.encode_avif) as encode:
+                with self.assertRaises(RuntimeError):
+                    self.image_uploader.compress_image(path)
+
+            self.assertEqual(decode.call_count, 1)
+            self.assertGreater(encode.call_count, 2)
+            self.assertLessEqual(encode.call_count, self.image_uploader.GIF_ATTEMPTS)
+            # the last attempts used fewer frames, playing as long as the original
+            last_frames = encode.call_args.args[0]
+            self.assertLess(len(last_frames.frames), 6)
+            self.assertEqual(sum(last_frames.durations), 240)
+
+    def test_gif_frame_reduction(self):
+        """near duplicates merged and frame rates lowered without changing the playback time"""
+        from PIL import Image
+        from controller.image_uploader import GifFrames
+
+        red = Image.new("RGBA", (100, 80), (255, 0, 0, 255))
+        almost_red = red.copy()
+        almost_red.putpixel((50, 40), (250, 0, 0, 255))
+        blue = Image.new("RGBA", (100, 80), (0, 0, 255, 255))
+        frames = GifFrames([red, almost_red, blue, blue.copy()], [20, 30, 40, 50])
+
+        merged = frames.merge_similar(self.image_uploader.GIF_MERGE_DIFFERENCE)
+        self.assertEqual(merged.durations, [50, 90])
+        self.assertEqual(merged.frames, [red, blue])
+
+        slow = GifFrames([red] * 10, [20] * 10).at_frame_rate(20)
+        self.assertEqual(slow.durations, [60, 40, 60, 40])
+        self.assertEqual(sum(slow.durations), 200)
+        self.assertIs(frames.at_frame_rate(60), frames)
+
+    def test_gif_borders_trimmed(self):
+        from PIL import Image, ImageDraw
+        from controller.image_uploader import GifFrames
+
+        frames = []
+        for x in (20, 60):
+            frame = Image.new("RGBA", (100, 80), (0, 0, 0, 255))
+            ImageDraw.Draw(frame).rectangle((x, 10, x + 10, 60), fill=(255, 255, 255, 255))
+            frames.append(frame)
+
+        trimmed = GifFrames(frames, [100, 100]).trim_borders()
+
+        self.assertEqual(trimmed.frames[0].size, (51, 51))
+
+    def test_describe_image(self):
+        """size and blurhash of the uploaded image"""
+        from PIL import Image
+
+        data = io.BytesIO()
+        Image.new("RGB", (640, 480), (0, 128, 255)).save(data, format="WEBP")
+        data.seek(0)
+
+        info = self.image_uploader.describe_image(data)
+
+        self.assertEqual((info["width"], info["height"]), (640, 480))
+        self.assertEqual(len(info["blurhash"]), 4 + 2 * 4 * 3)
+        self.assertEqual(data.tell(), 0)
+        self.assertEqual(self.image_uploader.describe_image(io.BytesIO(b"nope")), {})
+
+    @patch('controller.image_uploader.requests.head')
+    @patch('controller.image_uploader.requests.post')
+    def test_same_file_is_uploaded_once(self, mock_post, mock_head):
+        """a repeat upload reuses the stored object while it exists"""
+        from PIL import Image
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.image_uploader.upload_index = UploadIndex(os.path.join(temp_dir, "index.json"))
+            path = os.path.join(temp_dir, "avatar.png")
+            Image.new("RGB", (32, 32), (200, 10, 10)).save(path)
+            mock_post.return_value = MagicMock(status_code=200, text="stored.dat")
+            mock_head.return_value = MagicMock(status_code=200, ok=True)
+
+            first = self.image_uploader.upload_file(path, compress=False)
+            second = self.image_uploader.upload_file(path, compress=False)
+
+            self.assertEqual(first, second)
+            self.assertEqual(mock_post.call_count, 1)
+
+            # gone from storage: uploaded again
+            mock_head.return_value = MagicMock(status_code=404, ok=False)
+            self.image_uploader.upload_file(path, compress=False)
+            self.assertEqual(mock_post.call_count, 2)
+
+    @patch('controller.image_uploader.ResumableUploader')
+    @patch('controller.image_uploader.requests.post')
+    def test_big_file_sent_in_one_request_by_default(self, mock_post, mock_resumable):
+        """resumable uploads stay off until they are configured"""
+        from PIL import Image
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            self.image_uploader.upload_index = UploadIndex(os.path.join(temp_dir, "index.json"))
+            self.image_uploader.CHUNKED_UPLOAD_MIN_BYTES = 1
+            path = os.path.join(temp_dir, "photo.png")
+            Image.new("RGB", (32, 32), (10, 200, 10)).save(path)
+            mock_post.return_value = MagicMock(status_code=200, text="stored.dat")
+
+            self.image_uploader.upload_file(path, compress=False)
+            mock_post.assert_called_once()
+            mock_resumable.assert_not_called()
+
+            self.image_uploader.upload_index = UploadIndex(os.path.join(temp_dir, "other.json"))
+            self.image_uploader.RESUMABLE_UPLOADS = True
+            mock_resumable.return_value.upload.return_value = "chunked.dat"
+            name, _ = self.image_uploader.upload_file(path, compress=False)
+            self.assertEqual(name, "chunked.dat")
+            self.assertEqual(mock_post.call_count, 1)
+
+    def test_content_key_depends_on_params(self):
+        with tempfile.NamedTemporaryFile(delete=False) as file:
+            file.write(b"image bytes")
+        try:
+            key = content_key(file.name, self.image_uploader.compression_params(True))
+            self.assertEqual(key, content_key(file.name, self.image_uploader.compression_params(True)))
+            self.assertNotEqual(key, content_key(file.name, self.image_uploader.compression_params(False)))
+        finally:
+            os.remove(file.name)
+
 
 if __name__ == '__main__':
     unittest.main()
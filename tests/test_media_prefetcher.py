@@ -0,0 +1,42 @@
+import unittest
+
+from controller.media_prefetcher import ScrollPrefetcher, PrefetchCandidate
+
+
+def feed(count, height=500, cost=1000, requested=()):
+    return [PrefetchCandidate(i, i * height, (i + 1) * height - 1, cost, i in requested, False)
+            for i in range(count)]
+
+
+class TestScrollPrefetcher(unittest.TestCase):
+    def setUp(self):
+        self.prefetcher = ScrollPrefetcher()
+        self.prefetcher.MAX_IN_FLIGHT = 10
+
+    def test_idle_prefetches_one_viewport_ahead(self):
+        # viewport shows posts 0 and 1
+        self.assertEqual(self.prefetcher.plan(feed(10), 0, 1000), [2, 3])
+
+    def test_fast_scrolling_looks_further_ahead(self):
+        self.prefetcher.on_scroll(0, now=0.0)
+        self.prefetcher.on_scroll(1000, now=0.1)  # 10000 px/s, smoothed
+        self.assertGreater(self.prefetcher.velocity, 0)
+        self.assertEqual(self.prefetcher.plan(feed(20), 0, 1000), [2, 3, 4, 5, 6, 7])
+
+    def test_scrolling_up_prefetches_above(self):
+        self.prefetcher.on_scroll(5000, now=0.0)
+        self.prefetcher.on_scroll(4900, now=0.1)
+        self.assertEqual(self.prefetcher.plan(feed(20), 5000, 1000), [9, 8, 7])
+
+    def test_in_flight_and_memory_budget(self):
+        self.prefetcher.MAX_IN_FLIGHT = 2
+        # post 2 is already loading, only one more may start
+        self.assertEqual(self.prefetcher.plan(feed(10, requested={2}), 0, 1000), [3])
+
+        self.prefetcher.MAX_IN_FLIGHT = 10
+        self.prefetcher.MEMORY_BUDGET = 1500
+        self.assertEqual(self.prefetcher.plan(feed(10), 0, 1000), [2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,259 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import requests
+from google.api_core.exceptions import NotFound, ServiceUnavailable
+from google.cloud.firestore_v1 import SERVER_TIMESTAMP
+
+from controller.outbox import (Outbox, is_retryable, merge_profile, profile_pictures, send_profile, to_json_value,
+                               from_json_value)
+
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "outbox.sqlite3")
+        self.sent = []
+        self.outbox = self.open_outbox()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def open_outbox(self):
+        outbox = Outbox(self.path)
+        outbox.register("post", lambda payload, progress: self.sent.append(payload))
+        return outbox
+
+    def test_sent_entries_are_removed(self):
+        sent_keys = []
+        self.outbox.entry_sent.connect(lambda kind, key, payload: sent_keys.append(key))
+        self.outbox.enqueue("post", "a", {"text": "hello"})
+        self.outbox.enqueue("post", "a", {"text": "twice"})  # same key, same write
+
+        self.assertIsNone(self.outbox.drain_once())
+
+        self.assertEqual(self.sent, [{"text": "hello"}])
+        self.assertEqual(sent_keys, ["a"])
+        self.assertEqual(self.outbox.pending(), [])
+
+    def test_entries_survive_a_restart(self):
+        self.outbox.enqueue("post", "a", {"text": "hello"}, user_id="u1")
+
+        reopened = self.open_outbox()
+
+        self.assertEqual(reopened.pending("post", "u1"), [("a", {"text": "hello"})])
+        self.assertEqual(reopened.pending("post", "u2"), [])
+
+    def test_failed_entries_back_off(self):
+        """retried only once the delay has passed, the delay doubles per failure"""
+        failures = []
+        self.outbox.register("post", lambda payload, progress: (_ for _ in ()).throw(ConnectionError("offline")))
+        self.outbox.entry_failed.connect(lambda key, error, delay: failures.append(delay))
+        self.outbox.enqueue("post", "a", {})
+
+        wait = self.outbox.drain_once()
+        self.assertGreaterEqual(wait, self.outbox.RETRY_BASE_SECONDS * 0.7)
+        self.outbox.drain_once()  # not due yet
+        self.assertEqual(len(failures), 1)
+
+        self.outbox.drain_once(now=time.time() + wait + 1)
+        self.assertEqual(len(failures), 2)
+        self.assertGreater(failures[1], failures[0])
+        self.assertEqual(len(self.outbox.pending()), 1)
+
+    def test_progress_is_kept_across_attempts(self):
+        """steps stored with progress() aren't repeated by the next attempt"""
+        uploads = []
+
+        def handler(payload, progress):
+            for index, done in enumerate(payload["uploaded"]):
+                if not done:
+                    uploads.append(index)
+                    payload["uploaded"][index] = True
+                    progress(0.5, payload)
+                    if index == 0 and len(uploads) == 1:
+                        raise ConnectionError("dropped")
+
+        sent = []
+        self.outbox.register("post", handler)
+        self.outbox.entry_sent.connect(lambda kind, key, payload: sent.append(payload))
+        self.outbox.enqueue("post", "a", {"uploaded": [False, False]})
+
+        self.outbox.drain_once()
+        self.outbox.drain_once(now=time.time() + 60)
+
+        self.assertEqual(uploads, [0, 1])
+        self.assertEqual(self.outbox.pending(), [])
+        self.assertEqual(sent, [{"uploaded": [True, True]}])
+
+    def test_permanent_failures_are_not_retried(self):
+        calls = []
+        rejected = []
+
+        def handler(payload, progress):
+            calls.append(payload)
+            raise RuntimeError("AVIF is too large after compression")
+
+        self.outbox.register("post", handler)
+        self.outbox.entry_rejected.connect(lambda key, error: rejected.append((key, error)))
+        self.outbox.enqueue("post", "a", {})
+
+        self.assertIsNone(self.outbox.drain_once())
+        self.outbox.drain_once(now=time.time() + 3600)
+        reopened = self.open_outbox()
+        reopened.register("post", handler)
+        reopened.drain_once()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(rejected, [("a", "AVIF is too large after compression")])
+        self.assertEqual(reopened.rejected("post"), {"a": "AVIF is too large after compression"})
+        self.assertEqual(len(reopened.pending("post")), 1)
+
+    def test_retryable_errors(self):
+        def http_error(status):
+            response = MagicMock()
+            response.status_code = status
+            return requests.HTTPError(f"{status}", response=response)
+
+        self.assertTrue(is_retryable(ConnectionError("offline")))
+        self.assertTrue(is_retryable(requests.ConnectionError("offline")))
+        self.assertTrue(is_retryable(http_error(503)))
+        self.assertTrue(is_retryable(http_error(429)))
+        self.assertTrue(is_retryable(ServiceUnavailable("down")))
+        self.assertFalse(is_retryable(http_error(400)))
+        self.assertFalse(is_retryable(NotFound("gone")))
+        self.assertFalse(is_retryable(RuntimeError("no AVIF support")))
+
+    def test_discard_removes_the_entry_and_its_images(self):
+        folder = os.path.join(self.temp_dir.name, "post1")
+        os.makedirs(folder)
+        image = os.path.join(folder, "0.png")
+        with open(image, "wb") as file:
+            file.write(b"png")
+        self.outbox.enqueue("post", "post1", {"images": [image]})
+
+        self.outbox.discard("post1")
+        self.outbox.drain_once()
+
+        self.assertEqual(self.outbox.pending(), [])
+        self.assertEqual(self.sent, [])
+        self.assertFalse(os.path.exists(folder))
+
+    def test_discard_while_sending_stops_the_handler(self):
+        folder = os.path.join(self.temp_dir.name, "post1")
+        os.makedirs(folder)
+        image = os.path.join(folder, "0.png")
+        with open(image, "wb") as file:
+            file.write(b"png")
+        cancelled, outcomes, progress_reports = [], [], []
+        self.outbox.entry_progress.connect(lambda key, fraction, parts: progress_reports.append(parts))
+        self.outbox.entry_failed.connect(lambda *args: outcomes.append("failed"))
+        self.outbox.entry_rejected.connect(lambda *args: outcomes.append("rejected"))
+        self.outbox.entry_sent.connect(lambda *args: outcomes.append("sent"))
+
+        def handler(payload, progress):
+            progress.on_discard(lambda: cancelled.append(True))
+            progress(0.25, parts=[0.5, 0.0])
+            self.outbox.discard("post1")  # the user cancels while the images upload
+            self.assertTrue(os.path.exists(image))
+            progress(0.5, parts=[1.0, 0.0])
+            self.sent.append(payload)
+
+        self.outbox.register("post", handler)
+        self.outbox.enqueue("post", "post1", {"images": [image]})
+        self.outbox.drain_once()
+
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(progress_reports, [[0.5, 0.0]])
+        self.assertEqual(self.sent, [])
+        self.assertEqual(outcomes, [])
+        self.assertEqual(self.outbox.pending(), [])
+        self.assertFalse(os.path.exists(folder))
+
+    def test_opens_an_outbox_made_before_failed_entries(self):
+        path = os.path.join(self.temp_dir.name, "old.sqlite3")
+        db = sqlite3.connect(path)
+        db.execute("CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT NOT NULL,"
+                   " key TEXT NOT NULL UNIQUE, user_id TEXT, payload TEXT NOT NULL,"
+                   " attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL DEFAULT 0, last_error TEXT)")
+        db.execute("INSERT INTO outbox (kind, key, payload) VALUES ('post', 'a', '{}')")
+        db.commit()
+        db.close()
+
+        outbox = Outbox(path)
+        outbox.register("post", lambda payload, progress: self.sent.append(payload))
+        outbox.drain_once()
+
+        self.assertEqual(self.sent, [{}])
+
+    def test_replaced_images_are_deleted_unless_still_used(self):
+        kept, dropped = [os.path.join(self.temp_dir.name, name) for name in ("kept.png", "dropped.png")]
+        for path in (kept, dropped):
+            with open(path, "wb") as file:
+                file.write(b"png")
+        self.outbox.enqueue("profile", "p", {"images": [kept, dropped]}, replace=True)
+
+        self.outbox.enqueue("profile", "p", {"images": [kept]}, replace=True)
+        self.assertTrue(os.path.exists(kept))
+        self.assertFalse(os.path.exists(dropped))
+
+        self.outbox.register("profile", lambda payload, progress: None)
+        self.outbox.drain_once()
+        self.assertFalse(os.path.exists(kept))
+
+    def test_newer_profile_save_keeps_waiting_pictures(self):
+        waiting = {"user_id": "u1", "profile": {"bio": "old", "profileImageUrl": ""},
+                   "images": ["avatar.png", "cover.png"], "image_fields": ["profileImageUrl", "coverImageUrl"],
+                   "uploaded": [["avatar.dat", {}], None]}
+        newer = {"user_id": "u1", "profile": {"bio": "new", "profileImageUrl": ""},
+                 "images": ["cover2.png"], "image_fields": ["coverImageUrl"], "uploaded": [None]}
+
+        merged = merge_profile(waiting, newer)
+
+        self.assertEqual(merged["profile"], {"bio": "new", "profileImageUrl": ""})
+        self.assertEqual(merged["images"], ["avatar.png", "cover2.png"])
+        self.assertEqual(merged["image_fields"], ["profileImageUrl", "coverImageUrl"])
+        self.assertEqual(merged["uploaded"], [["avatar.dat", {}], None])
+        self.assertEqual(profile_pictures(merged), {"profileImageUrl": "avatar.dat"})
+
+    @patch('controller.firestore.set_user_profile')
+    @patch('controller.image_uploader.ImageUploader')
+    def test_profile_pictures_are_uploaded_with_the_profile(self, mock_uploader, mock_set_profile):
+        mock_uploader.return_value.upload_file.side_effect = (
+            lambda path, compress, on_progress: (os.path.basename(path) + ".dat", {}))
+        payload = {"user_id": "u1", "profile": {"bio": "hi", "coverImageUrl": "old.dat"},
+                   "images": ["avatar.png", "cover.png"], "image_fields": ["profileImageUrl", "coverImageUrl"],
+                   "uploaded": [None, ["cover.dat", {}]]}
+
+        send_profile(payload, MagicMock())
+
+        mock_uploader.return_value.upload_file.assert_called_once()
+        mock_set_profile.assert_called_once_with(
+            "u1", {"bio": "hi", "profileImageUrl": "avatar.png.dat", "coverImageUrl": "cover.dat"})
+
+    def test_replace_keeps_only_the_newest(self):
+        self.outbox.enqueue("post", "profile", {"name": "old"}, replace=True)
+        self.outbox.enqueue("post", "profile", {"name": "new"}, replace=True)
+
+        self.outbox.drain_once()
+
+        self.assertEqual(self.sent, [{"name": "new"}])
+
+    def test_json_values(self):
+        created = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+        value = {"createdAt": SERVER_TIMESTAMP, "dateOfBirth": created, "tags": ["a"]}
+
+        restored = from_json_value(to_json_value(value))
+
+        self.assertIs(restored["createdAt"], SERVER_TIMESTAMP)
+        self.assertEqual(restored["dateOfBirth"], created)
+        self.assertEqual(restored["tags"], ["a"])
+
+
+if __name__ == '__main__':
+    unittest.main()
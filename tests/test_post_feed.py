@@ -0,0 +1,130 @@
+import sys
+import unittest
+from datetime import datetime
+
+from PySide6.QtWidgets import QApplication
+
+from modal.post import PostData
+from widgets.post_feed import PostFeedView
+from widgets.post_widget import PostWidget
+
+
+def make_post(index, content="Post"):
+    return PostData(
+        content=f"{content} {index}", commentsCount=0, userProfilePicUrl="", mediaUrls=[],
+        userName="Test User", id=f"post{index}", userId="user123", likedByCurrentUser=False,
+        likesCount=0, timestamp=datetime(2024, 5, 1, 12, 30),
+    )
+
+
+class TestPostFeedView(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+
+    def setUp(self):
+        self.created = []
+        self.feed = PostFeedView(self.create_widget)
+        self.feed.resize(600, 800)
+        self.feed.show()
+        self.app.processEvents()
+
+    def tearDown(self):
+        self.feed.close()
+        self.feed.deleteLater()
+        self.app.processEvents()
+
+    def create_widget(self, post):
+        widget = PostWidget(post, lazy_media=True)
+        self.created.append(post.id)
+        return widget
+
+    def add_posts(self, count):
+        for index in range(count):
+            self.feed.post_model.append_post(make_post(index))
+        self.app.processEvents()
+
+    def test_long_feed_keeps_the_widget_count_constant(self):
+        self.add_posts(1000)
+        on_screen = len(self.feed.post_widgets())
+        self.assertGreater(on_screen, 0)
+        self.assertLess(on_screen, 15)
+
+        scrollbar = self.feed.verticalScrollBar()
+        while scrollbar.value() < scrollbar.maximum():
+            scrollbar.setValue(scrollbar.value() + 700)
+            self.app.processEvents()
+
+        self.assertIn(len(self.feed.post_widgets()), range(1, 15))
+        self.assertLessEqual(self.feed.widget_count(), 15 + PostFeedView.MAX_PARKED)
+        rows = sorted(row for row, _ in self.feed.post_widgets())
+        self.assertEqual(rows[-1], 999)
+
+    def test_rows_take_the_measured_widget_height(self):
+        self.feed.post_model.append_post(make_post(0, "long text " * 80))
+        self.feed.post_model.append_post(make_post(1))
+        self.app.processEvents()
+
+        for row, widget in self.feed.post_widgets():
+            rect = self.feed.row_rect(row)
+            self.assertEqual(widget.geometry(), rect)
+            self.assertEqual(rect.height(), widget.heightForWidth(rect.width()))
+
+    def test_scrolling_back_reuses_parked_widgets(self):
+        self.add_posts(100)
+        scrollbar = self.feed.verticalScrollBar()
+        scrollbar.setValue(1500)
+        self.app.processEvents()
+        created = len(self.created)
+
+        scrollbar.setValue(0)
+        self.app.processEvents()
+
+        self.assertEqual(len(self.created), created)
+
+    def test_updates_reach_the_widget(self):
+        self.add_posts(3)
+        model = self.feed.post_model
+
+        model.set_pending("post1", "Sending... 50%")
+        self.assertEqual(self.feed.widget_for("post1").time_label.text(), "Sending... 50%")
+        self.assertTrue(self.feed.widget_for("post1").pending)
+
+        updated = make_post(1, "Edited")
+        model.set_pending("post1", None)
+        model.replace_post(1, updated)
+        self.assertEqual(self.feed.widget_for("post1").content_label.text(), "Edited 1")
+        self.assertFalse(self.feed.widget_for("post1").pending)
+
+        model.remove_post(1)
+        self.app.processEvents()
+        self.assertIsNone(self.feed.widget_for("post1"))
+        self.assertEqual([post.id for post in model.posts()], ["post0", "post2"])
+
+    def test_delete_cancels_a_pending_post(self):
+        self.add_posts(1)
+        cancelled, deleted = [], []
+        widget = self.feed.widget_for("post0")
+        widget.cancelClicked.connect(cancelled.append)
+        widget.deleteClicked.connect(deleted.append)
+
+        self.feed.post_model.set_pending("post0", "Sending...")
+        widget.delete_button.click()
+        self.feed.post_model.set_pending("post0", None)
+        widget.delete_button.click()
+
+        self.assertEqual(cancelled, ["post0"])
+        self.assertEqual(deleted, ["post0"])
+
+    def test_insert_at_top_keeps_widgets_with_their_posts(self):
+        self.add_posts(3)
+        self.feed.post_model.insert_post(0, make_post(99))
+        self.app.processEvents()
+
+        for row, widget in self.feed.post_widgets():
+            self.assertIs(widget.post_data, self.feed.post_model.post_at(row))
+            self.assertEqual(widget.geometry(), self.feed.row_rect(row))
+
+
+if __name__ == '__main__':
+    unittest.main()
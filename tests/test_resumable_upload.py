@@ -0,0 +1,165 @@
+import os
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from controller.image_cache import DiskImageCache
+from controller.resumable_upload import ResumableUploader, UploadInterrupted, UploadSessionStore, fingerprint
+from modal.constants import Constants
+
+
+class TusHandler(BaseHTTPRequestHandler):
+    """Just enough of a tus server: creation, offsets and appending."""
+    protocol_version = "HTTP/1.1"
+    uploads = {}  # id -> bytearray
+    lengths = {}
+    patches_received = 0
+    bytes_received = 0
+    fail_patches = set()  # numbers of the PATCH requests to fail after keeping half the chunk
+
+    def _reply(self, status, headers=None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        upload_id = str(len(TusHandler.uploads))
+        TusHandler.uploads[upload_id] = bytearray()
+        TusHandler.lengths[upload_id] = int(self.headers["Upload-Length"])
+        self._reply(201, {"Location": f"/files/{upload_id}"})
+
+    def do_HEAD(self):
+        upload_id = self.path.rsplit("/", 1)[-1]
+        if upload_id not in TusHandler.uploads:
+            self._reply(404)
+            return
+        self._reply(200, {"Upload-Offset": str(len(TusHandler.uploads[upload_id]))})
+
+    def do_PATCH(self):
+        upload_id = self.path.rsplit("/", 1)[-1]
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        TusHandler.patches_received += 1
+        TusHandler.bytes_received += len(body)
+        data = TusHandler.uploads[upload_id]
+        if int(self.headers["Upload-Offset"]) != len(data):
+            self._reply(409)
+            return
+        if TusHandler.patches_received in TusHandler.fail_patches:
+            data.extend(body[:len(body) // 2])
+            self._reply(503)
+            return
+        data.extend(body)
+        self._reply(204, {"Upload-Offset": str(len(data))})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestResumableUpload(unittest.TestCase):
+    def setUp(self):
+        TusHandler.uploads = {}
+        TusHandler.lengths = {}
+        TusHandler.patches_received = 0
+        TusHandler.bytes_received = 0
+        TusHandler.fail_patches = set()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), TusHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.endpoint = f"http://127.0.0.1:{self.server.server_address[1]}/files/"
+
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "image.bin")
+        self.data = os.urandom(10_000)
+        with open(self.path, "wb") as file:
+            file.write(self.data)
+        self.store = UploadSessionStore(os.path.join(self.temp_dir.name, "sessions.json"))
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.temp_dir.cleanup()
+
+    def uploader(self, **kwargs):
+        return ResumableUploader(self.endpoint, headers={}, chunk_size=1000, store=self.store,
+                                 retry_delay=0, **kwargs)
+
+    def test_file_uploaded_in_chunks(self):
+        """streamed from disk in chunk_size parts, with progress"""
+        progress = []
+        name = self.uploader().upload(self.path, "a.dat", on_progress=progress.append)
+
+        self.assertEqual(name, "a.dat")
+        self.assertEqual(bytes(TusHandler.uploads["0"]), self.data)
+        self.assertEqual(TusHandler.patches_received, 10)
+        self.assertEqual(progress[0], 0.0)
+        self.assertEqual(progress[-1], 1.0)
+        # finished uploads aren't resumed
+        self.assertIsNone(self.store.get(fingerprint(self.path)))
+
+    def test_buffer_upload(self):
+        """a buffer is sent from slices of itself"""
+        self.uploader().upload(bytearray(self.data), "a.dat")
+        self.assertEqual(bytes(TusHandler.uploads["0"]), self.data)
+
+    def test_failed_chunk_resumes_at_server_offset(self):
+        """after an error only what the server is missing is sent again"""
+        TusHandler.fail_patches = {3, 7}
+
+        self.uploader().upload(self.path, "a.dat")
+
+        self.assertEqual(bytes(TusHandler.uploads["0"]), self.data)
+        # the two failed chunks kept half of their bytes, only the other halves are resent
+        self.assertEqual(TusHandler.bytes_received, len(self.data) + 1000)
+
+    def test_interrupted_upload_resumes_in_a_new_attempt(self):
+        """the session is persisted, a later upload of the same file continues it"""
+        sent = []
+        with self.assertRaises(UploadInterrupted):
+            self.uploader().upload(self.path, "first.dat", on_progress=sent.append,
+                                   should_stop=lambda: len(sent) > 4)
+        self.assertEqual(len(TusHandler.uploads["0"]), 4000)
+
+        name = self.uploader().upload(self.path, "second.dat")
+
+        self.assertEqual(name, "first.dat")
+        self.assertEqual(len(TusHandler.uploads), 1)
+        self.assertEqual(bytes(TusHandler.uploads["0"]), self.data)
+        self.assertEqual(TusHandler.bytes_received, len(self.data))
+
+    def test_default_headers_need_auth(self):
+        """without the storage auth configured every request would be refused"""
+        with self.assertRaises(ValueError):
+            ResumableUploader(self.endpoint, store=self.store)
+
+    def test_gives_up_after_max_retries(self):
+        TusHandler.fail_patches = set(range(1, 100))
+        with self.assertRaises(requests.RequestException):
+            self.uploader(max_retries=2).upload(self.path, "a.dat")
+
+
+class TestUploadSessionLocation(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.temp_dir.cleanup()
+
+    def test_sessions_survive_opening_the_image_cache(self):
+        """the cache deletes files it doesn't know, the default store must not be among them"""
+        store = ResumableUploader(headers={"Authorization": "Bearer test"}).store
+        store.save("file:a.dat", {"url": "https://example.com/upload/1", "size": 10})
+
+        DiskImageCache(Constants.IMAGE_CACHE_FOLDER)
+
+        self.assertEqual(store.get("file:a.dat"), {"url": "https://example.com/upload/1", "size": 10})
+
+
+if __name__ == '__main__':
+    unittest.main()
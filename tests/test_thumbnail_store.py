@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+from PySide6.QtCore import Qt
+
+from controller.image_cache import DiskImageCache
+from controller.thumbnail_store import ThumbnailStore
+
+
+class TestThumbnailStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = DiskImageCache(os.path.join(self.temp_dir.name, "cache"))
+        self.store = ThumbnailStore(self.cache)
+        self.url = "https://example.com/photo.png"
+
+        source = os.path.join(self.temp_dir.name, "photo.png")
+        Image.new("RGB", (2000, 1000), "blue").save(source)
+        with open(source, "rb") as file:
+            self.file_name = self.cache.put_bytes(self.url, file.read())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_generates_variants_once(self):
+        self.store.ensure(self.url, self.file_name)
+        meta = self.cache.get_meta(self.url)
+        self.assertEqual(meta["thumbnails"], [64, 128, 256, 512, 1024])
+        self.assertEqual((meta["width"], meta["height"]), (2000, 1000))
+
+        path = self.cache.get_path(self.url, ThumbnailStore.variant_name(64))
+        with Image.open(path) as thumbnail:
+            self.assertEqual(thumbnail.size, (64, 32))
+
+    def test_picks_smallest_variant_covering_target(self):
+        self.store.ensure(self.url, self.file_name)
+        avatar = self.store.best_variant(self.url, (40, 40), device_pixel_ratio=2.0)
+        self.assertEqual(avatar, self.cache.get_path(self.url, ThumbnailStore.variant_name(128)))
+
+        # 150px high cover needs a 300px wide image at least
+        cover = self.store.best_variant(self.url, (100, 150), aspect_mode=Qt.KeepAspectRatioByExpanding)
+        self.assertEqual(cover, self.cache.get_path(self.url, ThumbnailStore.variant_name(512)))
+
+        self.assertIsNone(self.store.best_variant(self.url, (3000, 3000)))
+
+    def test_background_generation_is_queued_once(self):
+        jobs = []
+        with patch('controller.thumbnail_store.ExecutorRegistry.start',
+                   side_effect=lambda name, job, priority=0: jobs.append(job)):
+            self.store.ensure_in_background(self.url, self.file_name)
+            self.store.ensure_in_background(self.url, self.file_name)
+        self.assertEqual(len(jobs), 1)
+        self.assertNotIn("thumbnails", self.cache.get_meta(self.url))
+
+        jobs[0]()
+        self.assertEqual(self.cache.get_meta(self.url)["thumbnails"], [64, 128, 256, 512, 1024])
+
+
+if __name__ == '__main__':
+    unittest.main()
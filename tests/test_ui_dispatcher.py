@@ -0,0 +1,55 @@
+import threading
+import unittest
+
+from PySide6.QtCore import QCoreApplication
+
+from controller.ui_dispatcher import UiDispatcher
+
+
+class TestUiDispatcher(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QCoreApplication.instance() or QCoreApplication([])
+
+    def setUp(self):
+        self.dispatcher = UiDispatcher()
+
+    def test_burst_from_workers_runs_in_one_batch_on_gui_thread(self):
+        delivered = []
+
+        def callback(value):
+            delivered.append((value, threading.current_thread() is threading.main_thread()))
+
+        workers = [threading.Thread(target=self.dispatcher.post, args=(callback, i)) for i in range(50)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(delivered, [])
+
+        QCoreApplication.processEvents()
+
+        self.assertEqual(sorted(value for value, _ in delivered), list(range(50)))
+        self.assertTrue(all(on_main for _, on_main in delivered))
+        self.assertEqual(self.dispatcher.batches, 1)
+
+    def test_posting_after_a_flush_schedules_a_new_batch(self):
+        delivered = []
+        self.dispatcher.post(delivered.append, 1)
+        QCoreApplication.processEvents()
+        self.dispatcher.post(delivered.append, 2)
+        QCoreApplication.processEvents()
+
+        self.assertEqual(delivered, [1, 2])
+        self.assertEqual(self.dispatcher.batches, 2)
+
+    def test_failing_callback_does_not_drop_the_rest(self):
+        delivered = []
+        self.dispatcher.post(lambda: 1 / 0)
+        self.dispatcher.post(delivered.append, "ok")
+        QCoreApplication.processEvents()
+        self.assertEqual(delivered, ["ok"])
+
+
+if __name__ == '__main__':
+    unittest.main()
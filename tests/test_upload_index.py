@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+
+from controller.image_cache import DiskImageCache
+from controller.upload_index import UploadIndex
+from modal.constants import Constants
+
+
+class TestUploadIndex(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.temp_dir.name)
+        UploadIndex._instance = None
+
+    def tearDown(self):
+        UploadIndex._instance = None
+        os.chdir(self.cwd)
+        self.temp_dir.cleanup()
+
+    def test_entries_survive_opening_the_image_cache(self):
+        """the cache deletes files it doesn't know, the shared index must not be among them"""
+        UploadIndex.instance().add("key", "abc.webp", {"width": 10, "height": 10})
+        UploadIndex._instance = None  # as after a restart
+
+        DiskImageCache(Constants.IMAGE_CACHE_FOLDER)
+
+        self.assertEqual(UploadIndex.instance().get("key"),
+                         {"name": "abc.webp", "media_info": {"width": 10, "height": 10}})
+
+    def test_remove(self):
+        index = UploadIndex(os.path.join(self.temp_dir.name, "index.json"))
+        index.add("key", "abc.webp", {})
+        index.remove("key")
+        self.assertIsNone(UploadIndex(index.path).get("key"))
+
+
+if __name__ == '__main__':
+    unittest.main()
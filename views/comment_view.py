@@ -1,5 +1,5 @@
-from PySide6.QtCore import Qt, QThreadPool, Signal
-from PySide6.QtGui import QFont
+from PySide6.QtCore import Qt, Signal
+from PySide6.QtGui import QFont, QPixmap
 from PySide6.QtWidgets import (
     QMainWindow, QLabel, QVBoxLayout, QHBoxLayout, QWidget, QScrollArea,
     QPushButton, QTextEdit, QSizePolicy
@@ -7,6 +7,7 @@ from PySide6.QtWidgets import (
 
 from controller.firestore import FirestoreListener, fetch_post_by_id
 from controller.image_loader_task import ImageLoaderTask
+from controller.image_scheduler import ImageScheduler
 from controller.user_session import UserSession
 from modal.constants import Constants
 from widgets.post_widget import PostWidget
@@ -16,7 +17,7 @@ class CommentWidget(QWidget):
     def __init__(self, comment_data):
         super().__init__()
         self.comment_data = comment_data
-        self.thread_pool = QThreadPool()
+        self.image_scheduler = ImageScheduler.instance()
         self.init_ui()
 
     def init_ui(self):
@@ -36,8 +37,10 @@ class CommentWidget(QWidget):
             task = ImageLoaderTask(
                 image_url,
                 lambda pixmap: self.update_image(self.profile_pic, pixmap, 30, 30),
+                target_size=(30, 30),
+                device_pixel_ratio=self.devicePixelRatioF(),
             )
-            self.thread_pool.start(task)
+            self.image_scheduler.submit(task, owner=self)
 
         header_layout.addWidget(self.profile_pic)
 
@@ -75,9 +78,10 @@ class CommentWidget(QWidget):
         separator.setStyleSheet("background-color: #e0e0e0;")
         main_layout.addWidget(separator)
 
-    def update_image(self, label, pixmap, height, width):
-        scaled_pixmap = pixmap.scaled(height, width, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        label.setPixmap(scaled_pixmap)
+    def update_image(self, label, image, height, width):
+        if image is None:
+            return
+        label.setPixmap(QPixmap.fromImage(image))
 
 
 class CommentView(QMainWindow):
@@ -88,7 +92,6 @@ class CommentView(QMainWindow):
         super().__init__()
         self.post_id = post_id
         self.parent_window = parent_window
-        self.thread_pool = QThreadPool()
         self.post_data = None
         self.comments = []
 
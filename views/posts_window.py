@@ -1,8 +1,9 @@
+import dataclasses
 import platform
 from datetime import datetime
 
-from PySide6.QtCore import Signal, QThreadPool, Qt
-from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QScrollArea, QSizePolicy, QLabel
+from PySide6.QtCore import Signal, Qt, QTimer
+from PySide6.QtWidgets import QMainWindow, QWidget, QVBoxLayout, QSizePolicy, QLabel
 
 if platform.system() == "Windows":
     from windows_toasts import WindowsToaster, Toast, ToastDisplayImage
@@ -11,12 +12,18 @@ else:
     Toast = None
     ToastDisplayImage = None
 
+from controller.animation_scheduler import AnimationScheduler
 from controller.firestore import FirestoreListener
 from controller.icon_cache import IconCache
+from controller.image_loader_task import local_image_url
+from controller.image_scheduler import ImageScheduler, ImagePriority
+from controller.media_prefetcher import ScrollPrefetcher, PrefetchCandidate
+from controller.outbox import Outbox
 from controller.user_session import UserSession
 from modal.constants import Constants
 from modal.post import PostData
 from widgets.create_post_widget import CreatePostWidget
+from widgets.post_feed import PostFeedView
 from widgets.post_widget import PostWidget
 
 
@@ -32,24 +39,30 @@ class PostsWindow(QMainWindow):
         self.time = datetime.now()
         self.loading_label = None
         self.initial_load_count = 0
-        self.posts_layout = None
-        self.scroll = None
+        self.feed = None
+        self.post_model = None
         self.initial_fetch_done = False
-        self.posts_data = []
+        self.prefetcher = ScrollPrefetcher()
         if platform.system() == "Windows":
             self.toaster = WindowsToaster("Fwitter")
         else:
             self.toaster = None
-        self.thread_pool = QThreadPool().globalInstance()
         self.listener = FirestoreListener()
         self.listener.newPostsSignal.connect(self.on_post_notification)
         self.listener.likeUpdatedSignal.connect(self.on_post_like)
         self.listener.removeFromStoreSignal.connect(self.on_remove_from_store)
         self.listener.initialPostsLoadedSignal.connect(self.on_initial_fetch_complete)
+        # own posts not sent yet, shown ahead of the backend
+        self.outbox = Outbox.instance()
+        self.outbox.entry_progress.connect(self.on_outbox_progress)
+        self.outbox.entry_sent.connect(self.on_outbox_sent)
+        self.outbox.entry_failed.connect(self.on_outbox_failed)
+        self.outbox.entry_rejected.connect(self.on_outbox_rejected)
         self.init_ui()
         # print("PostsWindow init done time: " + str(datetime.now() - self.time))
 
         self.listener.subscribe_to_new_posts()
+        self.outbox.start(UserSession().user_id)
         # print("PostsWindow subscribed to new posts" + str(datetime.now() - self.time))
         self.preload_while_fetching()
         # print("PostsWindow preload done time: " + str(datetime.now() - self.time))
@@ -62,23 +75,29 @@ class PostsWindow(QMainWindow):
         main_layout = QVBoxLayout(main_widget)
         main_layout.setContentsMargins(0, 0, 0, 0)
 
-        self.scroll = QScrollArea()
-        self.scroll.setWidgetResizable(True)
-        self.scroll.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
-        self.scroll.setMaximumWidth(1000)
-        self.scroll.setAlignment(
-            Qt.AlignHCenter
-        )  # ysd
-
-        container = QWidget()
-        container.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred)
-        self.posts_layout = QVBoxLayout(container)
-
-        self.posts_layout.addStretch()
-
-        self.scroll.setWidget(container)
-        self.scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
-        main_layout.addWidget(self.scroll, 1)
+        self.loading_label = QLabel("Refreshing posts...")
+        self.loading_label.setAlignment(Qt.AlignCenter)
+        main_layout.addWidget(self.loading_label)
+
+        # only the posts in and around the viewport get a PostWidget, see PostFeedView
+        self.feed = PostFeedView(self.new_post_widget)
+        self.feed.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.feed.setMaximumWidth(1000)
+        self.post_model = self.feed.post_model
+
+        self.feed.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.feed.verticalScrollBar().valueChanged.connect(AnimationScheduler.instance().schedule_update)
+
+        # on screen posts load their images first, re-evaluated (at most every 50ms) while scrolling,
+        # posts ahead in the scroll direction are prefetched
+        self.priority_timer = QTimer(self)
+        self.priority_timer.setSingleShot(True)
+        self.priority_timer.setInterval(50)
+        self.priority_timer.timeout.connect(self.update_image_priorities)
+        self.feed.verticalScrollBar().valueChanged.connect(self.prefetcher.on_scroll)
+        self.feed.verticalScrollBar().valueChanged.connect(self.schedule_image_priorities)
+        self.feed.verticalScrollBar().rangeChanged.connect(self.schedule_image_priorities)
+        main_layout.addWidget(self.feed, 1)
 
         self.create_post_widget = CreatePostWidget(
             user_id="current_user_id", user_name="Your Username"
@@ -91,9 +110,9 @@ class PostsWindow(QMainWindow):
 
         self.setCentralWidget(main_widget)
 
-        self.loading_label = QLabel("Refreshing posts...")
-        self.loading_label.setAlignment(Qt.AlignCenter)
-        self.posts_layout.addWidget(self.loading_label)
+    @property
+    def posts_data(self) -> list:
+        return self.post_model.posts()
 
     def preload_while_fetching(self):
         IconCache.get_icon("res/icons/heart.png")
@@ -101,12 +120,67 @@ class PostsWindow(QMainWindow):
         IconCache.get_icon("res/icons/comment.png")
         IconCache.get_icon("res/icons/delete.png")
 
-    def add_post_widget(self, post: PostData):
-        post_widget = PostWidget(post)
+    def new_post_widget(self, post: PostData) -> PostWidget:
+        # made by the feed when the post scrolls near the viewport,
+        # its images are loaded once it gets nearer still, see update_image_priorities
+        post_widget = PostWidget(post, lazy_media=True)
         post_widget.profileClicked.connect(self.switch_to_profile_mode)
         post_widget.commentClicked.connect(self.switch_to_comment_mode)
         post_widget.deleteClicked.connect(self.listener.delete_post_2)
-        self.posts_layout.addWidget(post_widget, stretch=1)
+        post_widget.cancelClicked.connect(self.cancel_pending_post)
+        post_widget.mediaLoaded.connect(self.schedule_image_priorities)
+        # the scroll range may not change, e.g. while the feed still fits the window
+        self.schedule_image_priorities()
+        return post_widget
+
+    def add_post_widget(self, post: PostData):
+        self.post_model.append_post(post)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.schedule_image_priorities()
+
+    def schedule_image_priorities(self):
+        if not self.priority_timer.isActive():
+            self.priority_timer.start()
+
+    def update_image_priorities(self):
+        # row rectangles are in viewport coordinates, the viewport starts at 0
+        scheduler = ImageScheduler.instance()
+        height = self.feed.viewport().height()
+        for row, post_widget in self.feed.post_widgets():
+            geometry = self.feed.row_rect(row)
+            if geometry.bottom() >= 0 and geometry.top() <= height:
+                post_widget.load_media(ImagePriority.VISIBLE)
+            elif geometry.bottom() >= -height and geometry.top() <= 2 * height:
+                post_widget.load_media(ImagePriority.NEAR_VISIBLE)
+            else:
+                scheduler.set_priority(post_widget, ImagePriority.PREFETCH)
+        for post_widget in self.feed.parked_widgets():
+            scheduler.set_priority(post_widget, ImagePriority.PREFETCH)
+
+        # posts ahead that may not have a widget yet, the chosen ones get one to load into
+        lookahead = self.prefetcher.lookahead(height)
+        dpr = self.devicePixelRatioF()
+        candidates = []
+        for row in self.feed.rows_between(-lookahead, height + lookahead):
+            post = self.post_model.post_at(row)
+            if not post.mediaUrls:
+                continue
+            geometry = self.feed.row_rect(row)
+            post_widget = self.feed.widget_for(post.id)
+            if post_widget is None:
+                candidates.append(PrefetchCandidate(
+                    row, geometry.top(), geometry.bottom(), PostWidget.estimated_media_cost(post, dpr), False, False,
+                ))
+            else:
+                candidates.append(PrefetchCandidate(
+                    row, geometry.top(), geometry.bottom(), post_widget.media_cost_bytes(),
+                    post_widget.media_requested, post_widget.media_loaded,
+                ))
+
+        for post_widget in self.feed.prefetch_widgets(self.prefetcher.plan(candidates, 0, height)):
+            post_widget.load_media(ImagePriority.PREFETCH)
 
     def switch_to_profile_mode(self, userId):
         print(f"profile show: {userId}")
@@ -117,33 +191,87 @@ class PostsWindow(QMainWindow):
         self.commentSwitchRequested.emit(postId)
 
     def on_post_created(self, new_post: PostData):
-        self.add_post_widget(new_post)
-
-        self.posts_data.insert(0, new_post)
+        # optimistic: shown now, replaced by the real post when the listener gets it
+        self.post_model.set_pending(new_post.id, "Sending...")
+        self.post_model.insert_post(0, new_post)
+
+    def show_pending_posts(self):
+        """Posts still in the outbox from an earlier run"""
+        user_session = UserSession()
+        known = {post.id for post in self.posts_data}
+        rejected = self.outbox.rejected("post", user_session.user_id)
+        for key, payload in self.outbox.pending("post", user_session.user_id):
+            if key in known:
+                continue
+            post_dict = dict(payload["post"], timestamp=datetime.fromisoformat(payload["created"]))
+            pending_post = PostData.from_dict(post_dict)
+            pending_post.userData = user_session.profile_data
+            pending_post.mediaUrls = [local_image_url(path) for path in payload["images"]]
+            self.on_post_created(pending_post)
+            if key in rejected:
+                self.on_outbox_rejected(key, rejected[key])
+
+    def pending_post_widget(self, post_id):
+        """Widget of an own post not sent yet, None if it has none right now"""
+        if self.post_model.pending_status(post_id) is None:
+            return None
+        return self.feed.widget_for(post_id)
+
+    def cancel_pending_post(self, post_id):
+        self.outbox.discard(post_id)
+        row = self.post_model.row_of(post_id)
+        if row >= 0:
+            self.post_model.remove_post(row)
+
+    def on_outbox_progress(self, key, fraction, parts):
+        # the status is kept with the post, its widget may come and go while scrolling
+        if self.post_model.pending_status(key) is not None:
+            status = f"Sending... {int(fraction * 100)}%"
+            if len(parts) > 1:
+                status += " (images " + ", ".join(f"{int(part * 100)}%" for part in parts) + ")"
+            self.post_model.set_pending(key, status)
+
+    def on_outbox_sent(self, kind, key, payload):
+        row = self.post_model.row_of(key)
+        if kind != "post" or row < 0 or self.post_model.pending_status(key) is None:
+            return
+        # the local copies are deleted now, show the uploaded images until the listener has the post
+        uploaded = payload["uploaded"]
+        post = dataclasses.replace(self.post_model.post_at(row),
+                                   mediaUrls=[name for name, _ in uploaded],
+                                   mediaInfo=[info for _, info in uploaded])
+        self.post_model.set_pending(key, None)
+        self.post_model.replace_post(row, post)
+
+    def on_outbox_failed(self, key, error, retry_seconds):
+        if self.post_model.pending_status(key) is not None:
+            self.post_model.set_pending(key, f"Not sent yet, retrying in {int(retry_seconds)}s")
+
+    def on_outbox_rejected(self, key, error):
+        # server error texts can be whole pages, the first line says enough
+        if self.post_model.pending_status(key) is not None:
+            first_line = error.splitlines()[0][:80] if error else ""
+            self.post_model.set_pending(key, f"Not sent: {first_line}")
 
     def on_post_notification(self, post_data: PostData):
+        row = self.post_model.row_of(post_data.id)
+        if row >= 0 and self.post_model.pending_status(post_data.id) is not None:
+            # our own post arrived, it replaces the optimistic copy
+            self.post_model.set_pending(post_data.id, None)
+            self.post_model.replace_post(row, post_data)
+            return
+
         # search
 
         self.toast = Toast()
         self.toast.text_fields = ['New Post', 'Hello, World!']
-        if self.initial_fetch_done:
-            for i, post in enumerate(self.posts_data):
-                if post.id == post_data.id:
-                    print("Poszt már létezik. Adatmódosítás.")
-                    self.posts_data[i] = post_data
-
-                    # Adat frissítés
-                    post_widget = self.posts_layout.itemAt(i).widget()
-                    post_widget.post_data = post_data
-                    post_widget.refresh_ui()  # renamed from update()
-
-                    print(post_data)
-                    return
-        if self.initial_fetch_done:
-            self.posts_data.insert(0, post_data)
-        else:
-            self.posts_data.append(post_data)
+        if row >= 0:
+            print("Poszt már létezik. Adatmódosítás.")
+            # Adat frissítés, the feed refreshes the widget if the post has one
+            self.post_model.replace_post(row, post_data)
 
+            print(post_data)
+            return
 
 
         if self.initial_fetch_done and not UserSession().user_id == post_data.userId:
@@ -159,14 +287,10 @@ class PostsWindow(QMainWindow):
         # új widget mint an onpostcreated ben
         # print("Widget create time: " + str(datetime.now() - self.time))
 
-        post_widget = PostWidget(post_data)
-        post_widget.profileClicked.connect(self.switch_to_profile_mode)
-        post_widget.commentClicked.connect(self.switch_to_comment_mode)
-        post_widget.deleteClicked.connect(self.listener.delete_post_2)
         if self.initial_fetch_done:
-            self.posts_layout.insertWidget(0, post_widget)
+            self.post_model.insert_post(0, post_data)
         else:
-            self.posts_layout.addWidget(post_widget)
+            self.post_model.append_post(post_data)
 
     def on_post_like(self):
         # updates elsewhere
@@ -174,18 +298,16 @@ class PostsWindow(QMainWindow):
         pass
 
     def on_remove_from_store(self, post_id):
-        for i in range(self.posts_layout.count()):
-            post_widget = self.posts_layout.itemAt(i).widget()
-            if hasattr(post_widget, "post_data") and post_widget.post_data.id == post_id:
-                post_widget.cleanup_and_delete()
-                self.posts_layout.removeWidget(post_widget)
-                print("deletion ", post_id)
-                del self.posts_data[i]
-                break
+        row = self.post_model.row_of(post_id)
+        if row >= 0:
+            # the feed deletes the post's widget with the row
+            self.post_model.remove_post(row)
+            print("deletion ", post_id)
 
     def on_initial_fetch_complete(self):
         self.initial_fetch_done = True
-        self.scroll.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
+        self.feed.setVerticalScrollBarPolicy(Qt.ScrollBarAsNeeded)
         self.listener.initialPostsLoadedSignal.disconnect()
         # print("Initial fetch complete, removing loading label time: " + str(datetime.now() - self.time))
         self.loading_label.deleteLater()
+        self.show_pending_posts()
@@ -1,6 +1,7 @@
+import dataclasses
 from datetime import datetime
 
-from PySide6.QtCore import Qt, Signal, QThreadPool
+from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QPixmap, QFont
 from PySide6.QtWidgets import (
     QMainWindow,
@@ -17,11 +18,11 @@ from PySide6.QtWidgets import (
 )
 from google.cloud.firestore_v1 import SERVER_TIMESTAMP
 
-from controller.firestore import update_user_profile, clear_cache, create_user_profile
-from controller.image_loader_task import ImageLoaderTask
-from controller.image_uploader import ImageUploader
+from controller.firestore import clear_cache, create_user_profile
+from controller.image_loader_task import ImageLoaderTask, decode_image, local_image_url, stored_image_url
+from controller.image_scheduler import ImageScheduler
+from controller.outbox import Outbox, enqueue_profile, profile_key
 from controller.user_session import UserSession
-from modal.constants import Constants
 from modal.user import ProfileData
 from widgets.clickable_labels import ClickableLabel
 
@@ -33,12 +34,19 @@ class ProfileEditWindow(QMainWindow):
 
     def __init__(self, profile_data=None, is_registering=False):
         super().__init__()
-        self.thread_pool = QThreadPool()
+        self.image_scheduler = ImageScheduler.instance()
         self.user_data = profile_data
-        self.image_uploader = ImageUploader()
         self.new_profile_pic_path = None
         self.new_cover_pic_path = None
         self.is_registering = is_registering
+        self.previous_data = None  # the profile before the save being sent
+        self.sending_key = None  # outbox key of the save being sent, while its pictures upload
+
+        self.outbox = Outbox.instance()
+        self.outbox.entry_progress.connect(self.on_outbox_progress)
+        self.outbox.entry_sent.connect(self.on_outbox_sent)
+        self.outbox.entry_failed.connect(self.on_outbox_failed)
+        self.outbox.entry_rejected.connect(self.on_outbox_rejected)
 
         self.setWindowTitle("Fwitter - Edit Profile")
         self.setMinimumSize(1000, 600)
@@ -98,14 +106,17 @@ class ProfileEditWindow(QMainWindow):
         cover_pic_container_layout.addWidget(self.cover_pic_label)
 
         if self.user_data.profileImageUrl:
-            image_url = Constants.STORAGE_URL + self.user_data.profileImageUrl
-            task = ImageLoaderTask(image_url, self.update_profile_image)
-            self.thread_pool.start(task)
+            image_url = stored_image_url(self.user_data.profileImageUrl)
+            task = ImageLoaderTask(image_url, self.update_profile_image,
+                                   target_size=(120, 120), device_pixel_ratio=self.devicePixelRatioF())
+            self.image_scheduler.submit(task, owner=self)
 
         if self.user_data.coverImageUrl:
-            image_url = Constants.STORAGE_URL + self.user_data.coverImageUrl
-            task = ImageLoaderTask(image_url, self.update_cover_image)
-            self.thread_pool.start(task)
+            image_url = stored_image_url(self.user_data.coverImageUrl)
+            task = ImageLoaderTask(image_url, self.update_cover_image,
+                                   target_size=(600, 150), device_pixel_ratio=self.devicePixelRatioF(),
+                                   aspect_mode=Qt.KeepAspectRatioByExpanding)
+            self.image_scheduler.submit(task, owner=self)
 
         pic_layout.addWidget(self.cover_pic_label)
         pic_layout.addWidget(self.profile_pic_label)
@@ -166,7 +177,7 @@ class ProfileEditWindow(QMainWindow):
         self.cancel_btn = QPushButton("Cancel")
         self.cancel_btn.setFont(QFont("Wix Madefor Text", 12))
         self.cancel_btn.setMinimumWidth(120)
-        self.cancel_btn.clicked.connect(self.close)
+        self.cancel_btn.clicked.connect(self.cancel)
 
         self.save_btn = QPushButton("Save Changes")
         self.save_btn.setFont(QFont("Wix Madefor Text", 12, QFont.Bold))
@@ -188,13 +199,15 @@ class ProfileEditWindow(QMainWindow):
 
         self.setCentralWidget(main_widget)
 
-    def update_profile_image(self, pixmap):
+    def update_profile_image(self, image):
         """Update profile image in the UI"""
-        self.profile_pic_label.setPixmap(pixmap)
+        if image is not None:
+            self.profile_pic_label.setPixmap(QPixmap.fromImage(image))
 
-    def update_cover_image(self, pixmap):
+    def update_cover_image(self, image):
         """Update profile image in the UI"""
-        self.cover_pic_label.setPixmap(pixmap)
+        if image is not None:
+            self.cover_pic_label.setPixmap(QPixmap.fromImage(image))
 
     def get_rounded_pixmap(self, pixmap):
         """Convert a pixmap to a circular shape"""
@@ -208,8 +221,9 @@ class ProfileEditWindow(QMainWindow):
 
         if file_path:
             self.new_profile_pic_path = file_path
-            pixmap = QPixmap(file_path)
-            self.update_profile_image(pixmap)
+            self.update_profile_image(
+                decode_image(file_path, (120, 120), self.devicePixelRatioF())
+            )
 
     def select_cover_picture(self):
         """Open file dialog to select a new cover picture"""
@@ -219,8 +233,9 @@ class ProfileEditWindow(QMainWindow):
 
         if file_path:
             self.new_cover_pic_path = file_path
-            pixmap = QPixmap(file_path)
-            self.update_cover_image(pixmap)
+            self.update_cover_image(
+                decode_image(file_path, (600, 150), self.devicePixelRatioF(), Qt.KeepAspectRatioByExpanding)
+            )
 
     def validate_data(self):
         """Validate the input data"""
@@ -267,6 +282,7 @@ class ProfileEditWindow(QMainWindow):
             return
         self.user_data = UserSession().profile_data
         if self.user_data:
+            self.previous_data = dataclasses.replace(self.user_data)
             self.user_data.username = username
             self.user_data.displayName = self.display_name_edit.text().strip()
             self.user_data.bio = self.bio_edit.toPlainText().strip()
@@ -284,68 +300,84 @@ class ProfileEditWindow(QMainWindow):
                 bio=self.bio_edit.toPlainText().strip(),
                 location=self.location_edit.text().strip(),
             )
-        if self.new_profile_pic_path:
-            self.save_profile_pic_then_continue()
-            return
-        else:
-            if self.new_cover_pic_path:
-                self.save_cover_pic_then_continue()
-                return
-            else:
-                self.finalize_save()
-
-    def save_profile_pic_then_continue(self):
-        def on_upload_success(image_url):
-            self.user_data.profileImageUrl = image_url
-            if self.new_cover_pic_path:
-                self.save_cover_pic_then_continue()
-                self.image_uploader.signals.success_signal.disconnect(on_upload_success)
-                self.image_uploader.signals.failure_signal.disconnect(on_upload_failure)
-                return
-            else:
-                self.finalize_save()
-
-        def on_upload_failure(error_msg):
-            QMessageBox.critical(
-                self, "Upload Failed", f"Failed to upload image: {error_msg}"
-            )
-
-        self.image_uploader.signals.success_signal.connect(on_upload_success)
-        self.image_uploader.signals.failure_signal.connect(on_upload_failure)
-        self.image_uploader.upload_image(self.new_profile_pic_path, compress=True)
-
-    def save_cover_pic_then_continue(self):
-        def on_upload_success(image_url):
-            self.user_data.coverImageUrl = image_url
-            self.image_uploader.signals.success_signal.disconnect(on_upload_success)
-            self.image_uploader.signals.failure_signal.disconnect(on_upload_failure)
-            self.finalize_save()
-
-        def on_upload_failure(error_msg):
-            QMessageBox.critical(
-                self, "Upload Failed", f"Failed to upload image: {error_msg}"
-            )
-
-        self.image_uploader.signals.success_signal.connect(on_upload_success)
-        self.image_uploader.signals.failure_signal.connect(on_upload_failure)
-        self.image_uploader.upload_image(self.new_cover_pic_path, compress=True)
+        self.finalize_save()
 
     def finalize_save(self):
+        # new pictures are uploaded by the outbox, in the same entry as the profile fields
+        images = {field: path for field, path in (("profileImageUrl", self.new_profile_pic_path),
+                                                  ("coverImageUrl", self.new_cover_pic_path)) if path}
         try:
             if self.is_registering:
                 success = create_user_profile(UserSession().user_id, self.user_data)
                 if not success:
                     QMessageBox.critical(self, "Error", "Failed to create profile.")
                     return
+                if images:
+                    enqueue_profile(UserSession().user_id, images=images)
                 clear_cache()
                 UserSession().set_profile_data(self.user_data)
                 self.profileCreated.emit(self.user_data)  # Emit the new signal
                 self.close()
             else:
-                update_user_profile(UserSession().user_id, self.user_data)
+                # saved locally, the outbox sends it (and retries) in the background
+                copies = enqueue_profile(UserSession().user_id, self.user_data, images)
                 clear_cache()
-                self.profileUpdated.emit(self.user_data)
+                # the new pictures show from the local copies until they are uploaded, the
+                # session keeps the stored names, later saves must not send local paths
+                shown = dataclasses.replace(
+                    self.user_data, **{field: local_image_url(path) for field, path in copies.items()})
+                self.profileUpdated.emit(shown)
                 # QMessageBox.information(self, "Success", "Profile updated successfully!")
-                self.close()
+                if not copies:
+                    self.close()
+                    return
+                # stays open with the upload progress until it's through, Cancel discards the save
+                self.sending_key = profile_key(UserSession().user_id)
+                self.save_btn.setEnabled(False)
+                self.save_btn.setText("Uploading... 0%")
+                self.cancel_btn.setText("Cancel Upload")
         except Exception as e:
             QMessageBox.critical(self, "Error", f"Failed to update profile: {e}")
+
+    def cancel(self):
+        if self.sending_key is None:
+            self.close()
+            return
+        self.outbox.discard(self.sending_key)
+        self.restore_previous_profile()
+
+    def restore_previous_profile(self):
+        """The save isn't going to happen, back to the profile as it was"""
+        self.sending_key = None
+        if self.previous_data is not None:
+            UserSession().set_profile_data(self.previous_data)
+            self.profileUpdated.emit(self.previous_data)
+        self.reset_save_button()
+
+    def reset_save_button(self):
+        self.save_btn.setEnabled(True)
+        self.save_btn.setText("Finish Registration" if self.is_registering else "Save Changes")
+        self.cancel_btn.setText("Back" if self.is_registering else "Cancel")
+
+    def on_outbox_progress(self, key, fraction, parts):
+        if key == self.sending_key:
+            self.save_btn.setText(f"Uploading... {int(fraction * 100)}%")
+
+    def on_outbox_failed(self, key, error, retry_seconds):
+        # closing the window leaves it to the outbox, it keeps retrying
+        if key == self.sending_key:
+            self.save_btn.setText(f"Not saved yet, retrying in {int(retry_seconds)}s")
+
+    def on_outbox_rejected(self, key, error):
+        if key != self.sending_key:
+            return
+        self.outbox.discard(key)
+        self.restore_previous_profile()
+        first_line = error.splitlines()[0][:80] if error else ""
+        QMessageBox.critical(self, "Error", f"Failed to update profile: {first_line}")
+
+    def on_outbox_sent(self, kind, key, payload):
+        # the profile view swaps in the uploaded pictures itself
+        if key == self.sending_key:
+            self.sending_key = None
+            self.close()
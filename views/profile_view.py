@@ -1,7 +1,8 @@
+import dataclasses
 from datetime import datetime
 
-from PySide6.QtCore import Qt, QThreadPool
-from PySide6.QtGui import QFont
+from PySide6.QtCore import Qt
+from PySide6.QtGui import QFont, QPixmap
 from PySide6.QtWidgets import (
     QMainWindow,
     QLabel,
@@ -13,10 +14,11 @@ from PySide6.QtWidgets import (
 )
 
 from controller.firestore import fetch_user_info, fetch_posts_and_user_info, FirestoreListener
-from controller.image_loader_task import ImageLoaderTask
+from controller.image_loader_task import ImageLoaderTask, stored_image_url
+from controller.image_scheduler import ImageScheduler
+from controller.outbox import Outbox, profile_key, profile_pictures
 from controller.profiler import track_execution_time
 from controller.user_session import UserSession
-from modal.constants import Constants
 from modal.user import ProfileData
 from views.profile_edit_window import ProfileEditWindow
 from widgets.post_widget import PostWidget
@@ -28,7 +30,7 @@ class ProfileView(QMainWindow):
         self.user_id = user_id
         self.profile_data = profile_data
         self.parent_window = parent_window
-        self.thread_pool = QThreadPool()
+        self.image_scheduler = ImageScheduler.instance()
         self.profile_pic = None
         self.cover_image = None
         self.edit_window = None
@@ -37,6 +39,7 @@ class ProfileView(QMainWindow):
         self.listener = FirestoreListener()
         self.listener.newPostsSignal.connect(self.on_post_notification)
         self.listener.removeFromStoreSignal.connect(self.on_remove_from_store)
+        Outbox.instance().entry_sent.connect(self.on_outbox_sent)
 
         if self.user_id and not self.profile_data:
             user_dict = fetch_user_info(self.user_id)
@@ -85,14 +88,18 @@ class ProfileView(QMainWindow):
         self.cover_image.setStyleSheet("background-color: #3498db;")
 
         if self.profile_data.coverImageUrl:
-            image_url = Constants.STORAGE_URL + self.profile_data.coverImageUrl
+            image_url = stored_image_url(self.profile_data.coverImageUrl)
+            cover_width = max(self.width(), self.cover_image.width())
             task = ImageLoaderTask(
                 image_url,
                 lambda pixmap: self.update_image(
-                    self.cover_image, pixmap, 150, self.cover_image.width(), False
+                    self.cover_image, pixmap, 150, cover_width, False
                 ),
+                target_size=(cover_width, 150),
+                device_pixel_ratio=self.devicePixelRatioF(),
+                aspect_mode=Qt.KeepAspectRatioByExpanding,
             )
-            self.thread_pool.start(task)
+            self.image_scheduler.submit(task, owner=self)
 
         header_layout.addWidget(self.cover_image)
 
@@ -108,12 +115,14 @@ class ProfileView(QMainWindow):
         )
 
         if self.profile_data.profileImageUrl:
-            image_url = Constants.STORAGE_URL + self.profile_data.profileImageUrl
+            image_url = stored_image_url(self.profile_data.profileImageUrl)
             task = ImageLoaderTask(
                 image_url,
                 lambda pixmap: self.update_image(self.profile_pic, pixmap, 120, 120),
+                target_size=(120, 120),
+                device_pixel_ratio=self.devicePixelRatioF(),
             )
-            self.thread_pool.start(task)
+            self.image_scheduler.submit(task, owner=self)
 
         info_layout.addWidget(self.profile_pic)
 
@@ -206,6 +215,14 @@ class ProfileView(QMainWindow):
 
         self.init_ui()
 
+    def on_outbox_sent(self, kind, key, payload):
+        # a saved profile shows the local copies of new pictures until they are uploaded
+        if kind != "profile" or not self.user_id or key != profile_key(self.user_id):
+            return
+        pictures = profile_pictures(payload)
+        if pictures and self.profile_data:
+            self.on_profile_updated(dataclasses.replace(self.profile_data, **pictures))
+
     def create_posts_section(self):
         scroll = QScrollArea()
         scroll.setWidgetResizable(True)
@@ -266,19 +283,12 @@ class ProfileView(QMainWindow):
                 self.listener._likes_watch.unsubscribe()
         super().closeEvent(event)
 
-    def update_image(self, label, pixmap, height=400, width=300, aspect_ratio=True):
-        if aspect_ratio:
-            actual_width = label.width()
-            scaled_pixmap = pixmap.scaled(
-                actual_width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation
-            )
-        else:
-            scaled_pixmap = pixmap.scaled(
-                width, height, Qt.KeepAspectRatioByExpanding, Qt.SmoothTransformation
-            )
-
-        label.setPixmap(scaled_pixmap)
-        print("ok")
+    def update_image(self, label, image, height=400, width=300, aspect_ratio=True):
+        # the loader already decoded it at height x width, with aspect_ratio picking
+        # KeepAspectRatio or KeepAspectRatioByExpanding
+        if image is None:
+            return
+        label.setPixmap(QPixmap.fromImage(image))
 
     def go_back(self):
         if self.parent_window and hasattr(self.parent_window, "stacked_widget"):
@@ -1,4 +1,7 @@
+import os
+import sqlite3
 import uuid
+from datetime import datetime
 
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtGui import QIcon, QFont
@@ -12,10 +15,10 @@ from PySide6.QtWidgets import (
     QFileDialog,
     QMessageBox,
 )
-from google.cloud.firestore_v1 import SERVER_TIMESTAMP
-
-from controller.image_uploader import ImageUploader
+from controller.image_loader_task import local_image_url
+from controller.outbox import enqueue_post
 from controller.user_session import UserSession
+from modal.constants import Constants
 from modal.post import PostData
 
 
@@ -32,8 +35,7 @@ class CreatePostWidget(QWidget):
         super().__init__()
         self.user_id = user_id
         self.user_name = user_name
-        self.selected_image_path = None
-        self.image_uploader = ImageUploader()
+        self.selected_image_paths = []
         self.init_ui()
 
     def init_ui(self):
@@ -59,14 +61,20 @@ class CreatePostWidget(QWidget):
         self.image_preview.setVisible(False)
         layout.addWidget(self.image_preview)
 
+        # selected files
+        self.attachments_label = QLabel()
+        self.attachments_label.setStyleSheet("color: gray;")
+        self.attachments_label.setVisible(False)
+        layout.addWidget(self.attachments_label)
+
         buttons_layout = QHBoxLayout()
 
-        self.add_image_btn = QPushButton("Add Image")
+        self.add_image_btn = QPushButton("Add Images")
         self.add_image_btn.setIcon(QIcon.fromTheme("insert-image"))
         self.add_image_btn.clicked.connect(self.select_image)
         buttons_layout.addWidget(self.add_image_btn)
 
-        self.remove_image_btn = QPushButton("Remove Image")
+        self.remove_image_btn = QPushButton("Remove Images")
         self.remove_image_btn.setIcon(QIcon.fromTheme("edit-delete"))
         self.remove_image_btn.clicked.connect(self.remove_image)
         self.remove_image_btn.setVisible(False)
@@ -85,14 +93,26 @@ class CreatePostWidget(QWidget):
         layout.addLayout(buttons_layout)
 
     def select_image(self):
-        file_path, _ = QFileDialog.getOpenFileName(
-            self, "Select Image", "", "Image Files (*.png *.jpg *.jpeg *.gif)"
+        file_paths, _ = QFileDialog.getOpenFileNames(
+            self, "Select Images", "", "Image Files (*.png *.jpg *.jpeg *.gif)"
         )
 
-        if file_path:
-            self.selected_image_path = file_path
-            self.display_image_preview(file_path)
-            self.remove_image_btn.setVisible(True)
+        if file_paths:
+            room = Constants.MAX_POST_IMAGES - len(self.selected_image_paths)
+            if len(file_paths) > room:
+                QMessageBox.warning(
+                    self, "Too Many Images", f"A post can have at most {Constants.MAX_POST_IMAGES} images."
+                )
+                file_paths = file_paths[:room]
+            self.selected_image_paths.extend(file_paths)
+            self.display_image_preview(file_paths[0] if file_paths else None)
+            self.show_attachments()
+            self.remove_image_btn.setVisible(bool(self.selected_image_paths))
+
+    def show_attachments(self):
+        names = [os.path.basename(path) for path in self.selected_image_paths]
+        self.attachments_label.setText(", ".join(names))
+        self.attachments_label.setVisible(bool(names))
 
     def display_image_preview(self, image_path):
         return
@@ -105,7 +125,8 @@ class CreatePostWidget(QWidget):
         # self.image_preview.setVisible(True)
 
     def remove_image(self):
-        self.selected_image_path = None
+        self.selected_image_paths = []
+        self.show_attachments()
         self.image_preview.clear()
         self.image_preview.setVisible(False)
         self.remove_image_btn.setVisible(False)
@@ -113,76 +134,36 @@ class CreatePostWidget(QWidget):
     def submit_post(self):
         content = self.content_editor.toPlainText().strip()
 
-        if not content and not self.selected_image_path:
+        if not content and not self.selected_image_paths:
             QMessageBox.warning(
                 self, "Empty Post", "Please enter some text or add an image."
             )
             return
 
-        self.post_btn.setEnabled(False)
-        self.post_btn.setText("Posting...")
-
-        if self.selected_image_path:
-            self.upload_image_then_create_post(content)
-        else:
-            self.create_post(content)
-
-    def upload_image_then_create_post(self, content):
-        def on_upload_success(image_url):
-            self.create_post(content, image_url)
-
-        def on_upload_failure(error_msg):
-            self.post_btn.setEnabled(True)
-            self.post_btn.setText("Post")
-            print("Hiba történt az upload során:", error_msg)
-            QMessageBox.critical(
-                self, "Upload Failed", f"Failed to upload image: {error_msg}"
-            )
-
-        self.image_uploader.signals.success_signal.connect(on_upload_success)
-        self.image_uploader.signals.failure_signal.connect(on_upload_failure)
-        self.image_uploader.upload_image(
-            self.selected_image_path,
-        )
-
-    def create_post(self, content, image_url=None):
-        from controller.firestore import (
-            create_new_post,
+        # queued locally and shown right away, the outbox uploads the images and
+        # creates the post in the background, retrying until it's through
+        user = UserSession()
+        post = PostData(
+            id=generate_random_uuid(),
+            userId=user.user_id,
+            userName=user.profile_data.displayName,
+            content=content,
+            userProfilePicUrl=user.profile_data.profileImageUrl,
+            mediaUrls=[],
+            likedByCurrentUser=False,
+            likesCount=0,
+            commentsCount=0,
+            timestamp=datetime.now().astimezone(),
+            userData=user.profile_data,
         )
-
         try:
-            user = UserSession()
-            post = PostData(
-                id=generate_random_uuid(),
-                userId=user.user_id,
-                userName=user.profile_data.displayName,
-                content=content,
-                userProfilePicUrl=user.profile_data.profileImageUrl,
-                mediaUrls=(
-                    [image_url] if image_url else []
-                ),
-                likedByCurrentUser=False,
-                likesCount=0,
-                commentsCount=0,
-                timestamp=SERVER_TIMESTAMP,
-            )
-
-            success = create_new_post(post)
-
-            if success:
-
-                self.content_editor.clear()
-                self.remove_image()
-
-                # self.postCreated.emit(post)
-            else:
-                QMessageBox.warning(
-                    self, "Error", "Failed to create"
-                )
-
-        except Exception as e:
-            QMessageBox.critical(self, "Error", f"hiba: {str(e)}")
+            copies = enqueue_post(post, self.selected_image_paths)
+        except (OSError, sqlite3.Error) as e:
+            QMessageBox.critical(self, "Error", f"Failed to save the post: {e}")
+            return
+        # shown from the outbox's copies until the uploaded ones are known
+        post.mediaUrls = [local_image_url(path) for path in copies]
 
-        finally:
-            self.post_btn.setEnabled(True)
-            self.post_btn.setText("Post")
+        self.content_editor.clear()
+        self.remove_image()
+        self.postCreated.emit(post)
@@ -0,0 +1,387 @@
+import math
+from bisect import bisect_right
+from collections import OrderedDict
+from itertools import accumulate
+
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QRect, Qt, QTimer, QEvent
+from PySide6.QtGui import QFont, QFontMetrics, QPainter, QPalette
+from PySide6.QtWidgets import QAbstractScrollArea, QFrame
+
+from modal.constants import Constants
+from modal.post import PostData
+from widgets.post_widget import PostWidget
+
+
+class PostListModel(QAbstractListModel):
+    """The feed's posts in display order. PostRole gives the PostData of a row."""
+
+    PostRole = Qt.UserRole + 1
+    PendingRole = Qt.UserRole + 2  # status of a post not sent yet, None once it's through
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._posts = []
+        self._pending = {}  # post id -> status
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._posts)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._posts):
+            return None
+        post = self._posts[index.row()]
+        if role == self.PostRole:
+            return post
+        if role == self.PendingRole:
+            return self._pending.get(post.id)
+        if role == Qt.DisplayRole:
+            return post.content
+        return None
+
+    def posts(self) -> list:
+        return self._posts
+
+    def post_at(self, row: int) -> PostData:
+        return self._posts[row]
+
+    def row_of(self, post_id: str) -> int:
+        """Row of the post, -1 if it isn't in the feed"""
+        for row, post in enumerate(self._posts):
+            if post.id == post_id:
+                return row
+        return -1
+
+    def insert_post(self, row: int, post: PostData) -> None:
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._posts.insert(row, post)
+        self.endInsertRows()
+
+    def append_post(self, post: PostData) -> None:
+        self.insert_post(len(self._posts), post)
+
+    def replace_post(self, row: int, post: PostData) -> None:
+        self._posts[row] = post
+        index = self.index(row)
+        self.dataChanged.emit(index, index, [self.PostRole])
+
+    def remove_post(self, row: int) -> None:
+        self.beginRemoveRows(QModelIndex(), row, row)
+        post = self._posts.pop(row)
+        self._pending.pop(post.id, None)
+        self.endRemoveRows()
+
+    def pending_status(self, post_id: str):
+        return self._pending.get(post_id)
+
+    def set_pending(self, post_id: str, status) -> None:
+        """Mark the post as not sent yet, showing status. None marks it sent."""
+        if status is None:
+            self._pending.pop(post_id, None)
+        else:
+            self._pending[post_id] = status
+        row = self.row_of(post_id)
+        if row >= 0:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [self.PendingRole])
+
+
+class PostFeedView(QAbstractScrollArea):
+    """
+    The feed of a PostListModel, virtualized: only the rows in or near the viewport
+    have a PostWidget (made by widget_factory), placed over the row by the view.
+    Widgets that scroll out are hidden and kept, with their images, for the
+    MAX_PARKED most recently seen posts, so scrolling back doesn't load again.
+    A feed of any length costs a constant number of widgets.
+
+    Row heights are measured from the widgets, and estimated from the post for
+    rows that never had one. The tops of the rows are kept as running sums, so
+    finding the rows on screen is a binary search, not a layout of the whole feed.
+    """
+
+    OVERSCAN = 0.5  # rows this far outside the viewport get widgets too, in viewport heights
+    MAX_PARKED = Constants.FEED_PARKED_WIDGETS
+    MAX_LAYOUT_PASSES = 3  # measuring rows may bring other rows into view, measure those too
+    BASE_HEIGHT = 150  # estimate of a post without text or images: header, buttons, margins
+    MEDIA_MARGIN = 30
+
+    def __init__(self, widget_factory, parent=None):
+        """widget_factory: PostData -> PostWidget, e.g. to connect the widget's signals"""
+        super().__init__(parent)
+        self.widget_factory = widget_factory
+        self._widgets = {}  # post id -> PostWidget of a row in the materialized range
+        self._rows = {}  # post id -> row of the materialized widgets
+        self._parked = OrderedDict()  # post id -> hidden PostWidget, least recently seen first
+        self._measured = {}  # post id -> height measured from its widget
+        self._heights = []  # per row, measured or estimated
+        self._offsets = [0]  # top of every row, then the bottom of the last one
+        self._offsets_dirty = False
+        self._estimate_width = 0
+        self._syncing = False
+        metrics = QFontMetrics(QFont("Wix Madefor Text", 12))
+        self._char_width = max(1, metrics.averageCharWidth())
+        self._line_height = metrics.lineSpacing()
+
+        self.post_model = PostListModel(self)
+        self.post_model.rowsInserted.connect(self._on_rows_inserted)
+        self.post_model.rowsAboutToBeRemoved.connect(self._on_rows_about_to_be_removed)
+        self.post_model.rowsRemoved.connect(self._on_rows_removed)
+        self.post_model.dataChanged.connect(self._on_data_changed)
+
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setFrameShape(QFrame.NoFrame)
+        self.viewport().setBackgroundRole(QPalette.Window)
+        self.verticalScrollBar().setSingleStep(20)
+
+        # model changes and widgets whose layout changed (e.g. an image arrived)
+        # are handled together, once control is back in the event loop
+        self._sync_timer = QTimer(self)
+        self._sync_timer.setSingleShot(True)
+        self._sync_timer.setInterval(0)
+        self._sync_timer.timeout.connect(self.sync_widgets)
+
+    def widget_for(self, post_id: str):
+        """The post's widget if it has one right now"""
+        return self._widgets.get(post_id) or self._parked.get(post_id)
+
+    def post_widgets(self) -> list:
+        """(row, PostWidget) of the materialized rows"""
+        return [(self._rows[post_id], widget) for post_id, widget in self._widgets.items()]
+
+    def parked_widgets(self) -> list:
+        return list(self._parked.values())
+
+    def widget_count(self) -> int:
+        return len(self._widgets) + len(self._parked)
+
+    def row_rect(self, row: int) -> QRect:
+        """Where the row is, in viewport coordinates"""
+        offsets = self._row_offsets()
+        top = offsets[row] - self.verticalScrollBar().value()
+        return QRect(0, top, self.viewport().width(), offsets[row + 1] - offsets[row])
+
+    def rows_between(self, top: int, bottom: int) -> range:
+        """Rows overlapping top..bottom, in viewport coordinates"""
+        offsets = self._row_offsets()
+        value = self.verticalScrollBar().value()
+        top, bottom = max(0, top + value), min(offsets[-1] - 1, bottom + value)
+        if bottom < top:
+            return range(0)
+        return range(bisect_right(offsets, top) - 1, bisect_right(offsets, bottom))
+
+    def estimate_height(self, post: PostData, width: int) -> int:
+        """Height of the post's widget, guessed without making it"""
+        chars_per_line = max(1, (width - 40) // self._char_width)
+        lines = sum(max(1, math.ceil(len(line) / chars_per_line)) for line in (post.content or "").split("\n"))
+        height = self.BASE_HEIGHT + lines * self._line_height
+        if post.mediaUrls:
+            info = post.mediaInfo[0] if post.mediaInfo else None
+            if info and info.get("width") and info.get("height"):
+                scale = min(1.0, PostWidget.MEDIA_SIZE.width() / info["width"],
+                            PostWidget.MEDIA_SIZE.height() / info["height"])
+                height += round(info["height"] * scale)
+            else:
+                height += PostWidget.MEDIA_SIZE.height()
+            height += self.MEDIA_MARGIN
+            if len(post.mediaUrls) > 1:
+                height += PostWidget.GALLERY_THUMB_SIZE.height() + 6
+        return height
+
+    def sync_widgets(self) -> None:
+        """Give the rows in and around the viewport their widgets, park the others."""
+        if self._syncing:
+            return
+        self._syncing = True
+        try:
+            width = self.viewport().width()
+            if width != self._estimate_width:
+                # text wraps differently, rows without a measurement get a new estimate
+                self._estimate_width = width
+                self._heights = [self._measured.get(post.id) or self.estimate_height(post, width)
+                                 for post in self.post_model.posts()]
+                self._offsets_dirty = True
+            for _ in range(self.MAX_LAYOUT_PASSES):
+                if not self._materialize():
+                    break
+            self._place_widgets()
+        finally:
+            self._syncing = False
+
+    def prefetch_widgets(self, rows) -> list:
+        """
+        Widgets for rows outside the materialized range, to load their media early.
+        They're made and measured now, but stay parked until scrolled to.
+        """
+        widgets = []
+        changes = {}
+        for row in rows:
+            post = self.post_model.post_at(row)
+            widget = self._widgets.get(post.id)
+            if widget is None:
+                widget = self._parked.pop(post.id, None) or self._create(post)
+                self._park(post.id, widget)
+            self._measure(row, post.id, widget, changes)
+            widgets.append(widget)
+        if changes and not self._syncing:
+            self._syncing = True
+            try:
+                self._apply_heights(changes)
+                self._place_widgets()
+            finally:
+                self._syncing = False
+        return widgets
+
+    def _row_offsets(self) -> list:
+        if self._offsets_dirty:
+            self._offsets_dirty = False
+            self._offsets = [0, *accumulate(self._heights)]
+            scrollbar = self.verticalScrollBar()
+            scrollbar.setPageStep(self.viewport().height())
+            scrollbar.setRange(0, max(0, self._offsets[-1] - self.viewport().height()))
+        return self._offsets
+
+    def _materialize(self) -> bool:
+        """Returns True if a row's measured height changed, the rows are laid out again then"""
+        height = self.viewport().height()
+        overscan = int(height * self.OVERSCAN)
+        wanted = {}
+        for row in self.rows_between(-overscan, height + overscan):
+            wanted[self.post_model.post_at(row).id] = row
+
+        changes = {}
+        for post_id, row in wanted.items():
+            widget = self._widgets.get(post_id)
+            if widget is None:
+                widget = self._parked.pop(post_id, None) or self._create(self.post_model.post_at(row))
+                self._widgets[post_id] = widget
+            self._rows[post_id] = row
+            self._measure(row, post_id, widget, changes)
+
+        # parked after taking back the wanted ones, so those aren't evicted to make room
+        for post_id in [post_id for post_id in self._widgets if post_id not in wanted]:
+            self._park(post_id, self._widgets.pop(post_id))
+            del self._rows[post_id]
+
+        if changes:
+            self._apply_heights(changes)
+        return bool(changes)
+
+    def _measure(self, row: int, post_id: str, widget: PostWidget, changes: dict) -> None:
+        width = self.viewport().width()
+        height = widget.heightForWidth(width) if widget.hasHeightForWidth() else widget.sizeHint().height()
+        self._measured[post_id] = height
+        if self._heights[row] != height:
+            changes[row] = height
+
+    def _apply_heights(self, changes: dict) -> None:
+        # rows above the viewport changing height mustn't move what's on screen
+        scrollbar = self.verticalScrollBar()
+        offsets = self._row_offsets()
+        value = scrollbar.value()
+        anchor = bisect_right(offsets, value) - 1
+        shift = sum(height - self._heights[row] for row, height in changes.items() if row < anchor)
+        for row, height in changes.items():
+            self._heights[row] = height
+        self._offsets_dirty = True
+        self._row_offsets()
+        if shift and anchor < len(self._heights):
+            scrollbar.setValue(value + shift)
+
+    def _create(self, post: PostData) -> PostWidget:
+        widget = self.widget_factory(post)
+        widget.setParent(self.viewport())
+        status = self.post_model.pending_status(post.id)
+        if status is not None:
+            widget.set_pending(status)
+        widget.installEventFilter(self)
+        return widget
+
+    def _park(self, post_id: str, widget: PostWidget) -> None:
+        widget.hide()
+        self._parked[post_id] = widget
+        self._parked.move_to_end(post_id)
+        while len(self._parked) > self.MAX_PARKED:
+            _, oldest = self._parked.popitem(last=False)
+            oldest.cleanup_and_delete()
+
+    def _release(self, post_id: str) -> None:
+        widget = self._widgets.pop(post_id, None) or self._parked.pop(post_id, None)
+        self._rows.pop(post_id, None)
+        if widget is not None:
+            widget.cleanup_and_delete()
+
+    def _place_widgets(self) -> None:
+        for post_id, widget in self._widgets.items():
+            widget.setGeometry(self.row_rect(self._rows[post_id]))
+            if widget.isHidden():
+                widget.show()
+
+    def _on_rows_inserted(self, parent, first, last):
+        width = self.viewport().width()
+        self._heights[first:first] = [self.estimate_height(self.post_model.post_at(row), width)
+                                      for row in range(first, last + 1)]
+        self._offsets_dirty = True
+        self._sync_timer.start()
+
+    def _on_rows_about_to_be_removed(self, parent, first, last):
+        for row in range(first, last + 1):
+            post_id = self.post_model.post_at(row).id
+            self._release(post_id)
+            self._measured.pop(post_id, None)
+
+    def _on_rows_removed(self, parent, first, last):
+        del self._heights[first:last + 1]
+        self._offsets_dirty = True
+        self._sync_timer.start()
+
+    def _on_data_changed(self, top_left, bottom_right, roles=()):
+        for row in range(top_left.row(), bottom_right.row() + 1):
+            post = self.post_model.post_at(row)
+            widget = self.widget_for(post.id)
+            if widget is None:
+                continue
+            if not roles or PostListModel.PendingRole in roles:
+                widget.set_pending(self.post_model.pending_status(post.id))
+            if (not roles or PostListModel.PostRole in roles) and widget.post_data is not post:
+                if widget.post_data.mediaUrls != post.mediaUrls:
+                    # e.g. a sent post with its uploaded images, made again on the next sync
+                    self._release(post.id)
+                    self._measured.pop(post.id, None)
+                else:
+                    widget.post_data = post
+                    widget.refresh_ui()
+        self._sync_timer.start()
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.LayoutRequest and isinstance(watched, PostWidget):
+            self._sync_timer.start()
+        return super().eventFilter(watched, event)
+
+    def scrollContentsBy(self, dx, dy):
+        # the widgets are moved by sync_widgets, only the stand-ins are painted
+        self.sync_widgets()
+        self.viewport().update()
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self._offsets_dirty = True
+        self.sync_widgets()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.sync_widgets()
+
+    def paintEvent(self, event):
+        # rows without a widget yet get a plain stand-in, seen for a moment at most,
+        # e.g. while the scrollbar is dragged fast
+        painter = QPainter(self.viewport())
+        painter.setPen(self.palette().color(QPalette.PlaceholderText))
+        rect = event.rect()
+        for row in self.rows_between(rect.top(), rect.bottom()):
+            post = self.post_model.post_at(row)
+            if post.id in self._widgets:
+                continue
+            row_rect = self.row_rect(row)
+            painter.drawText(row_rect.adjusted(60, 12, -12, -12), Qt.TextWordWrap,
+                             f"{post.userName}\n\n{post.content}")
+            painter.drawLine(row_rect.bottomLeft(), row_rect.bottomRight())
+        painter.end()
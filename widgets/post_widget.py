@@ -1,8 +1,8 @@
 from datetime import datetime
 
 from PySide6 import QtCore
-from PySide6.QtCore import Signal, Qt, QThreadPool, QThread, QBuffer
-from PySide6.QtGui import QFont, QPixmap
+from PySide6.QtCore import Signal, Qt, QBuffer
+from PySide6.QtGui import QFont, QPixmap, QImage
 from PySide6.QtWidgets import (
     QLabel,
     QVBoxLayout,
@@ -10,9 +10,13 @@ from PySide6.QtWidgets import (
     QWidget,
     QSizePolicy)
 
+from controller.animation_scheduler import AnimationScheduler
+from controller.blurhash import placeholder_image
+from controller.executors import ExecutorRegistry
 from controller.firestore import toggle_post_like
 from controller.icon_cache import IconCache
-from controller.image_loader_task import ImageLoaderTask
+from controller.image_loader_task import ImageLoaderTask, stored_image_url
+from controller.image_scheduler import ImageScheduler, ImagePriority
 from controller.user_session import UserSession
 from modal.constants import Constants
 from modal.post import PostData
@@ -22,15 +26,21 @@ from widgets.like_comment_button import PostButton
 
 
 class PostWidget(QWidget):
+    MEDIA_SIZE = QtCore.QSize(300, 400)  # bounding box of the post image
+    GALLERY_THUMB_SIZE = QtCore.QSize(96, 96)  # the post's other images, below the first one
+
     profileClicked = Signal(str)  # PostWindow
     likeClicked = Signal(str)  # FirestoreListener
     commentClicked = Signal(str)  # Nothing
     deleteClicked = Signal(str)  # FirestoreListener
+    cancelClicked = Signal(str)  # PostsWindow, the post isn't sent yet and won't be
+    mediaLoaded = Signal()  # PostsWindow, loading the post image finished
 
-    def __init__(self, post_data: PostData, hide_buttons=False):
+    def __init__(self, post_data: PostData, hide_buttons=False, lazy_media=False):
+        """lazy_media: don't load the post image until load_media() is called"""
         super().__init__()
         self.post_data = post_data
-        self.thread_pool = QThreadPool.globalInstance()
+        self.image_scheduler = ImageScheduler.instance()
         self.setMinimumWidth(400)
         self.setMaximumWidth(1000)
         self.setSizePolicy(QSizePolicy(QSizePolicy.Expanding, QSizePolicy.Preferred))
@@ -41,26 +51,31 @@ class PostWidget(QWidget):
         self.post_stats = None
         self.post_image = None
         self.hide_buttons = hide_buttons
+        self.lazy_media = lazy_media
+        self.media_requested = False
+        self.media_loaded = False
+        self._media_size = self.MEDIA_SIZE
         self._current_movie = None
         self._current_buffer = None
+        self.pending = False  # shown before the backend has it, see set_pending
         self.init_ui()
 
     def update_image(self, label, pixmap_or_movie, height=400, width=300):
         if label is None:
             print("Warning: label not found")
             return
-        if isinstance(pixmap_or_movie, QPixmap):
-            scaled_pixmap = pixmap_or_movie.scaled(
-                width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation
-            )
-            label.setPixmap(scaled_pixmap)
+        if label is getattr(self, "image_label", None) and not self.media_loaded:
+            # failed loads count too, the load is over either way
+            self.media_loaded = True
+            self.mediaLoaded.emit()
+        if isinstance(pixmap_or_movie, QImage):
+            # already decoded at display size by the loader
+            label.setPixmap(QPixmap.fromImage(pixmap_or_movie))
         elif isinstance(pixmap_or_movie, tuple):
-            if not QThread.currentThread().isMainThread():
-                print("Warning: update_image called from non-main thread, gif will show up as static image")
             if (pixmap_or_movie[0] == "gif_data" and isinstance(pixmap_or_movie[1], bytes)):
                 gif_data = pixmap_or_movie[1]
                 from PySide6.QtGui import QMovie
-                # Create QBuffer and QMovie on main thread
+                # loader results arrive on the GUI thread, QMovie can be created right here
                 buffer = QBuffer()
                 buffer.setData(gif_data)
                 buffer.open(QBuffer.ReadOnly)
@@ -73,15 +88,15 @@ class PostWidget(QWidget):
                     return
 
                 movie.setScaledSize(QtCore.QSize(width, height))
-                movie.setCacheMode(QMovie.CacheAll)
-                movie.finished.connect(movie.start)
 
                 # Store references to prevent garbage collection
                 self._current_movie = movie
                 self._current_buffer = buffer  # Keep buffer alive
 
                 label.setMovie(movie)
-                movie.start()
+                # plays it only while it's on screen
+                movie.jumpToFrame(0)
+                AnimationScheduler.instance().register(movie, label)
                 return
 
 
@@ -103,8 +118,10 @@ class PostWidget(QWidget):
             task = ImageLoaderTask(
                 image_url,
                 lambda pixmap: self.update_image(self.profile_pic, pixmap, 40, 40),
+                target_size=(40, 40),
+                device_pixel_ratio=self.devicePixelRatioF(),
             )
-            self.thread_pool.start(task)
+            self.image_scheduler.submit(task, owner=self)
 
         header_layout.addWidget(self.profile_pic)
 
@@ -138,26 +155,38 @@ class PostWidget(QWidget):
 
         # kép
         if self.post_data.mediaUrls:
-            image_url = Constants.STORAGE_URL + self.post_data.mediaUrls[0]
+            image_url = stored_image_url(self.post_data.mediaUrls[0])
             self.image_label = ClickableImageLabel(image_url, username=self.post_data.userName)
             self.image_label.setAlignment(Qt.AlignCenter)
             self.image_label.setStyleSheet("margin: 10px 0;")
             self.image_label.clicked.connect(self.on_image_clicked)
 
-            task = ImageLoaderTask(
-                image_url, lambda pixmap_or_movie: self.update_image(self.image_label, pixmap_or_movie), allow_gif=True
-            )
-
-            # connect to singal for gifs hopefully will change to it lateer
-            def one_time_update(pixmap_or_movie):
-                self.update_image(self.image_label, pixmap_or_movie)
-                task.loaded_gif_signal.disconnect(one_time_update)
-
-            task.loaded_gif_signal.connect(one_time_update)
-            self.thread_pool.start(task)
+            media_size = self.media_display_size()
+            if media_size is not None:
+                self._media_size = media_size
+                self.show_media_placeholder(media_size)
 
             main_layout.addWidget(self.image_label)
 
+            # gallery of the other images, loaded together with the first one
+            self.gallery_labels = []
+            if len(self.post_data.mediaUrls) > 1:
+                gallery_layout = QHBoxLayout()
+                gallery_layout.setAlignment(Qt.AlignCenter)
+                for index, media_url in enumerate(self.post_data.mediaUrls[1:], start=1):
+                    thumb = ClickableImageLabel(stored_image_url(media_url), username=self.post_data.userName)
+                    thumb.setFixedSize(self.GALLERY_THUMB_SIZE)
+                    thumb.setAlignment(Qt.AlignCenter)
+                    thumb.setStyleSheet("background-color: lightgray;")
+                    thumb.clicked.connect(self.on_image_clicked)
+                    self.show_blurhash(thumb, index, self.GALLERY_THUMB_SIZE)
+                    gallery_layout.addWidget(thumb)
+                    self.gallery_labels.append(thumb)
+                main_layout.addLayout(gallery_layout)
+
+            if not self.lazy_media:
+                self.load_media()
+
         # kommentelés meg kedvelés
         stats_layout = QHBoxLayout()
         stats_layout.setAlignment(Qt.AlignCenter)
@@ -212,20 +241,96 @@ class PostWidget(QWidget):
 
         self.post_data_old = self.post_data
 
+    def load_media(self, priority: ImagePriority = ImagePriority.VISIBLE) -> None:
+        """Start loading the post image, once. Later calls only change the priority of pending loads."""
+        if self.media_requested or not self.post_data.mediaUrls:
+            self.image_scheduler.set_priority(self, priority)
+            return
+        self.media_requested = True
+        media_size = self._media_size
+        image_url = stored_image_url(self.post_data.mediaUrls[0])
+
+        task = ImageLoaderTask(
+            image_url,
+            lambda pixmap_or_movie: self.update_image(self.image_label, pixmap_or_movie,
+                                                      media_size.height(), media_size.width()),
+            allow_gif=True,
+            target_size=(self.MEDIA_SIZE.width(), self.MEDIA_SIZE.height()),
+            device_pixel_ratio=self.devicePixelRatioF()
+        )
+        self.image_scheduler.submit(task, owner=self, priority=priority)
+
+        for thumb in self.gallery_labels:
+            task = ImageLoaderTask(
+                thumb.image_url,
+                lambda image, label=thumb: self.update_image(label, image),
+                target_size=(self.GALLERY_THUMB_SIZE.width(), self.GALLERY_THUMB_SIZE.height()),
+                device_pixel_ratio=self.devicePixelRatioF(),
+                aspect_mode=Qt.KeepAspectRatioByExpanding,
+            )
+            self.image_scheduler.submit(task, owner=self, priority=priority)
+
+    def media_cost_bytes(self) -> int:
+        """Memory the decoded post images take, 0 without any"""
+        if not self.post_data.mediaUrls:
+            return 0
+        dpr = self.devicePixelRatioF()
+        pixels = self._media_size.width() * self._media_size.height()
+        pixels += len(self.gallery_labels) * self.GALLERY_THUMB_SIZE.width() * self.GALLERY_THUMB_SIZE.height()
+        return int(pixels * dpr * dpr * 4)
+
+    @classmethod
+    def estimated_media_cost(cls, post_data: PostData, device_pixel_ratio: float) -> int:
+        """media_cost_bytes() of a widget not made yet, assuming the image fills MEDIA_SIZE"""
+        if not post_data.mediaUrls:
+            return 0
+        pixels = cls.MEDIA_SIZE.width() * cls.MEDIA_SIZE.height()
+        pixels += (len(post_data.mediaUrls) - 1) * cls.GALLERY_THUMB_SIZE.width() * cls.GALLERY_THUMB_SIZE.height()
+        return int(pixels * device_pixel_ratio * device_pixel_ratio * 4)
+
+    def media_display_size(self):
+        """
+        Size the first image will be shown at, from the dimensions stored with the post.
+        Same rule as decode_image: fit into MEDIA_SIZE, never upscale. None if unknown.
+        """
+        info = self.post_data.mediaInfo[0] if self.post_data.mediaInfo else None
+        if not info or not info.get("width") or not info.get("height"):
+            return None
+        dpr = self.devicePixelRatioF()
+        source_size = QtCore.QSize(info["width"], info["height"])
+        wanted = QtCore.QSize(round(self.MEDIA_SIZE.width() * dpr), round(self.MEDIA_SIZE.height() * dpr))
+        scaled = source_size.scaled(wanted, Qt.KeepAspectRatio)
+        if scaled.width() >= source_size.width():
+            scaled = source_size
+        return QtCore.QSize(max(1, round(scaled.width() / dpr)), max(1, round(scaled.height() / dpr)))
+
+    def show_media_placeholder(self, media_size):
+        # reserve the final size right away, so the layout doesn't jump when the image arrives
+        self.image_label.setMinimumSize(media_size)
+        self.show_blurhash(self.image_label, 0, media_size)
+
+    def show_blurhash(self, label, index, size):
+        info = self.post_data.mediaInfo[index] if index < len(self.post_data.mediaInfo) else None
+        if info and info.get("blurhash"):
+            image = placeholder_image(info["blurhash"], size, self.devicePixelRatioF())
+            if image is not None:
+                label.setPixmap(QPixmap.fromImage(image))
+
     def on_image_clicked(self, image_url: str, username: str):
         if not hasattr(self, "_image_previews"):
             self._image_previews = []  # keep references
         preview = ImagePreviewWindow(image_url, username)
-        if hasattr(self, "image_label") and getattr(self.image_label, "_original_pixmap", None):
+        if (hasattr(self, "image_label") and self.image_label.image_url == image_url
+                and getattr(self.image_label, "_original_pixmap", None)):
             preview.set_pixmap(self.image_label._original_pixmap)
         else:
             # doesnt work
-            def _apply(pixmap):
-                if pixmap and not pixmap.isNull():
-                    preview.set_pixmap(pixmap)
+            def _apply(image):
+                if isinstance(image, QImage) and not image.isNull():
+                    preview.set_pixmap(QPixmap.fromImage(image))
 
             task = ImageLoaderTask(image_url, _apply)
-            self.thread_pool.start(task)
+            self.image_scheduler.submit(task, owner=preview)
         preview.show()
         self._image_previews.append(preview)
 
@@ -234,8 +339,9 @@ class PostWidget(QWidget):
 
     def on_like_clicked(self, post_id):
 
-        self.likeClicked.emit(post_id)  # main szálon fut úgyhogy szaggat, de legalább eltakarja a nyomi animációt
-        toggle_post_like(post_id)
+        self.likeClicked.emit(post_id)
+        # firestore round trips, keep them off the main thread
+        ExecutorRegistry.start(ExecutorRegistry.BACKEND, lambda: toggle_post_like(post_id))
 
     def on_comment_clicked(self, post_id):
 
@@ -243,8 +349,26 @@ class PostWidget(QWidget):
         print("Képzeletben működik a kommentelés")
         # nem csinal semmit
 
+    def set_pending(self, status):
+        """
+        Show the post as not yet sent, with status in place of its time (None once
+        it's through). Likes and comments wait until then, delete cancels sending it.
+        """
+        self.pending = status is not None
+        timestamp = self.post_data.timestamp
+        if status is not None:
+            self.time_label.setText(status)
+        elif timestamp and hasattr(timestamp, "year"):
+            self.time_label.setText(datetime.strftime(timestamp, "%Y-%m-%d %H:%M"))
+        for button in (self.like_button, self.comment_button):
+            button.setEnabled(not self.pending)
+        self.delete_button.setText("Cancel" if self.pending else "Delete")
+
     def on_delete_clicked(self, post_id):
-        self.deleteClicked.emit(post_id)
+        if self.pending:
+            self.cancelClicked.emit(post_id)
+        else:
+            self.deleteClicked.emit(post_id)
 
     def refresh_ui(self):
         print("Refreshing UI for post:", self.post_data.id)
@@ -271,8 +395,10 @@ class PostWidget(QWidget):
                 task = ImageLoaderTask(
                     image_url,
                     lambda pixmap: self.update_image(self.profile_pic, pixmap, 40, 40),
+                    target_size=(40, 40),
+                    device_pixel_ratio=self.devicePixelRatioF(),
                 )
-                self.thread_pool.start(task)
+                self.image_scheduler.submit(task, owner=self)
 
     def cleanup_and_delete(self):
         """
@@ -292,8 +418,12 @@ class PostWidget(QWidget):
             print("Disconnecting signals failed, maybe already disconnected?")
             pass
 
+        # queued image loads are dropped, running ones won't call back
+        self.image_scheduler.cancel_owner(self)
+
         # Explicitly release image resources
         if self._current_movie:
+            AnimationScheduler.instance().unregister(self._current_movie)
             self._current_movie.stop()
             self._current_movie.deleteLater()
             self._current_movie = None